@@ -1,7 +1,11 @@
-from typing import List
+import time
+import asyncio
+import threading
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from typing_extensions import TypedDict
 from langchain.schema import Document
-from utils import tv_search
+from utils import get_tv_search
 from data_loader import DataLoader
 from grader import DocGrader
 from rephraser import QuestionRephraser
@@ -9,143 +13,943 @@ from qa_rag_chain import QARAGChain
 from langgraph.graph import END, StateGraph
 from classifier import QuestionCategorizer
 from db_handler import CategoryDB
+from answer_cache import SemanticAnswerCache
+from web_cache import WebSearchCache
+from session_store import SessionStore
+from telemetry import logger, telemetry
 
 class GraphState(TypedDict):
     question: str
+    user_question: Optional[str]
     category: str
     generation: str
     web_search_needed: str
     documents: List[str]
+    retrieval_scores: List[float]
+    rewritten_question: Optional[str]
+    web_results: Optional[List[dict]]
+    session: Optional[dict]
+    grades: Optional[dict]
+    carried: Optional[List[str]]
 
 
 
 class Agent:
     """Encapsulates all steps of the agent's workflow."""
 
-    def __init__(self):
-        self.data_loader = DataLoader()
-        self.grader = DocGrader()
-        self.rephraser = QuestionRephraser()
-        self.ans_generator = QARAGChain()
-        self.categorizer = QuestionCategorizer()
-        self.db = CategoryDB()
+    SPECULATION_POLICIES = ("off", "always", "low_score")
+
+    def __init__(self, grading_concurrency=4, grading_early_exit=False, grading_mode="pointwise",
+                 speculative_search="off", speculation_score_threshold=0.5,
+                 web_cache=True, web_cache_ttl_seconds=24 * 3600, web_write_back=False,
+                 retrieval_mode="vector", score_band=None, reranker=None, reranker_band=(0.2, 0.8),
+                 category_mode="keyword", context_budget=1500, max_sessions=1000, session_turns=3,
+                 session_ttl_seconds=30 * 60, llm=None, search_tool=None, data_loader=None, db=None):
+        """
+        Args:
+            grading_concurrency (int): Maximum number of document grading calls in flight.
+            grading_early_exit (bool): Stop grading once a document is graded irrelevant.
+                Documents not yet graded at that point are dropped from the context.
+            grading_mode (str): 'pointwise' (one grader call per document) or 'listwise'
+                (all documents in one call). See `DocGrader.usage_per_call` to compare them.
+            speculative_search (str): Rewrite the query and search the web while documents are
+                being graded: 'off', 'always', or 'low_score' to only speculate when the lowest
+                retrieval score is below `speculation_score_threshold`.
+            speculation_score_threshold (float): Relevance score under which retrieval counts as weak.
+            web_cache (bool): Reuse web search results of recently searched queries.
+            web_cache_ttl_seconds (float): Lifetime of cached web search results.
+            web_write_back (bool): Index the web results behind answered questions into the
+                vector DB, so that later questions are answered from local retrieval.
+            retrieval_mode (str): 'vector' or 'hybrid' (vector fused with BM25), see `DataLoader`.
+            score_band (tuple): (reject_below, accept_above) retrieval relevance scores. Documents
+                scoring above the band are accepted and below it rejected without calling the
+                grader; only documents inside the band are graded. None grades every document.
+            reranker: Optional local reranker with a `score(question, documents)` method, e.g.
+                `lexical_index.LexicalReranker`, consulted for documents inside the score band
+                before the grader.
+            reranker_band (tuple): (reject_below, accept_above) reranker scores.
+            category_mode (str): 'keyword' or 'centroid', see `QuestionCategorizer`. The centroid
+                mode embeds with the retrieval model, so the query embedding computed for
+                retrieval is served from the embedding cache instead of a new model call.
+            context_budget (int): Maximum tokens of retrieved context in the answer prompt.
+            max_sessions (int): Conversations whose recent turns are kept for follow-up questions.
+            session_turns (int): Turns per conversation that its follow-ups reuse.
+            session_ttl_seconds (float): Inactivity after which a conversation is forgotten.
+            llm: Chat model shared by the grader, rephraser and answer chain instead of the
+                pooled ChatOpenAI (see `llm_pool`), e.g. `fakes.FakeChatModel` for offline runs.
+            search_tool: Web search tool with `invoke`/`ainvoke` instead of Tavily, e.g. `fakes.FakeSearch`.
+            data_loader (DataLoader): Prebuilt data loader, e.g. with fake embeddings. Overrides `retrieval_mode`.
+            db (CategoryDB): Question log to use instead of the default `categories.db`.
+        """
+        if speculative_search not in self.SPECULATION_POLICIES:
+            raise ValueError(f"Unknown speculation policy '{speculative_search}'. Expected one of {self.SPECULATION_POLICIES}.")
+        self.grading_concurrency = grading_concurrency
+        self.grading_early_exit = grading_early_exit
+        self.grading_mode = grading_mode
+        self.speculative_search = speculative_search
+        self.speculation_score_threshold = speculation_score_threshold
+        self.speculation_executor = None
+        self.speculation_lock = threading.Lock()
+        self.speculation_stats = {
+            "launched": 0, "used": 0, "discarded": 0, "failed": 0,
+            "calls_saved": 0, "calls_wasted": 0, "seconds_overlapped": 0.0,
+        }
+        self.score_band = score_band
+        self.reranker = reranker
+        self.reranker_band = reranker_band
+        self.grading_lock = threading.Lock()
+        self.grading_stats = {
+            "documents": 0, "score_accepted": 0, "score_rejected": 0,
+            "reranker_accepted": 0, "reranker_rejected": 0, "session_reused": 0, "llm_graded": 0,
+        }
+        self.sessions = SessionStore(max_sessions=max_sessions, max_turns=session_turns, ttl_seconds=session_ttl_seconds)
+        self.session_lock = threading.Lock()
+        self.session_stats = {
+            "turns": 0, "follow_ups": 0, "documents_carried": 0,
+            "grader_calls_saved": 0, "rewrite_calls_saved": 0, "search_calls_saved": 0,
+        }
+        self.web_cache = WebSearchCache(ttl_seconds=web_cache_ttl_seconds) if web_cache else None
+        self.web_write_back = web_write_back
+        self.write_back_executor = None
+        self.llm = llm
+        self.search_tool = search_tool
+        self.data_loader = data_loader or DataLoader(retrieval_mode=retrieval_mode)
+        self._grader = None
+        self.grader_init_lock = threading.Lock()
+        self.rephraser = QuestionRephraser(llm=llm)
+        self.ans_generator = QARAGChain(llm=llm, context_budget=context_budget)
+        self.categorizer = QuestionCategorizer(
+            mode=category_mode,
+            embedding_model=self.data_loader.embedding_model if category_mode == "centroid" else None,
+        )
+        self.db = db or CategoryDB()
+
+    @property
+    def grader(self):
+        """The document grader, built on first use since cached and score-band answers never grade."""
+        if self._grader is None:
+            with self.grader_init_lock:
+                if self._grader is None:
+                    self._grader = DocGrader(llm=self.llm)
+        return self._grader
 
     def retrieve(self, state: GraphState) -> GraphState:
         """Retrieve documents."""
-        print("---RETRIEVAL FROM VECTOR DB---")
+        logger.debug("---RETRIEVAL FROM VECTOR DB---")
         question = state["question"]
-        documents = self.data_loader.get_retriever().invoke(question)
-        return {"documents": documents, "question": question}
+        results = self.data_loader.search(question)
+        return {
+            "documents": [doc for doc, _ in results],
+            "retrieval_scores": [score for _, score in results],
+            "question": question,
+        }
     
     def categorize_question(self, state: GraphState) -> GraphState:
-        """Categorize the question and save to the database."""
-        print("---CATEGORIZE QUESTION---")
+        """Categorize the question as the user asked it and save to the database."""
+        logger.debug("---CATEGORIZE QUESTION---")
+        asked = state.get("user_question") or state["question"]
+        category = self.categorizer.classify(asked)
+        logger.debug(f"---CATEGORY: {category}---")
+        self.db.save_category(asked, category)
+        return {"question": state["question"], "category": category, "documents": state["documents"]}
+
+    async def aretrieve(self, state: GraphState) -> GraphState:
+        """Retrieve documents asynchronously."""
+        logger.debug("---RETRIEVAL FROM VECTOR DB---")
         question = state["question"]
-        category = self.categorizer.classify(question)
-        print(f"---CATEGORY: {category}---")
-        self.db.save_category(question, category)
-        return {"question": question, "category": category, "documents": state["documents"]}
+        results = await self.data_loader.asearch(question)
+        return {
+            "documents": [doc for doc, _ in results],
+            "retrieval_scores": [score for _, score in results],
+            "question": question,
+        }
+
+    async def acategorize_question(self, state: GraphState) -> GraphState:
+        """Categorize the question as the user asked it and queue it for the database."""
+        logger.debug("---CATEGORIZE QUESTION---")
+        asked = state.get("user_question") or state["question"]
+        if self.categorizer.mode == "centroid":
+            category = await asyncio.to_thread(self.categorizer.classify, asked)
+        else:
+            category = self.categorizer.classify(asked)
+        logger.debug(f"---CATEGORY: {category}---")
+        self.db.save_category(asked, category)
+        return {"question": state["question"], "category": category, "documents": state.get("documents")}
+
+    async def aretrieve_and_categorize(self, state: GraphState) -> GraphState:
+        """Retrieve documents while categorizing and logging the question; neither depends on the other."""
+        if self.categorizer.mode == "centroid":
+            # Let retrieval embed the question first, so categorization reuses its embedding
+            # (a follow-up is categorized as asked, which retrieval does not embed)
+            retrieved = await self.aretrieve(state)
+            categorized = await self.acategorize_question(state)
+        else:
+            retrieved, categorized = await asyncio.gather(
+                self.aretrieve(state), self.acategorize_question(state)
+            )
+        return {**retrieved, "category": categorized["category"]}
 
     def grade_documents(self, state: GraphState) -> GraphState:
         """Grade documents for relevance."""
-        print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
-        question = state["question"]
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        speculation = self.start_speculation(state)
+        try:
+            candidates, grades, pending = self.prepare_grading(state)
+            if pending:
+                llm_grades = self.grader.grade_documents(
+                    state["question"], [candidates[i] for i in pending], **self.grading_options()
+                )
+                for index, grade in zip(pending, llm_grades):
+                    grades[index] = grade
+            update = self.apply_grades(state, candidates, grades)
+        except BaseException:
+            # Nothing will use the speculation when grading fails or is cancelled
+            self.cancel_speculation(speculation)
+            raise
+        return {**update, **self.resolve_speculation(speculation, update["web_search_needed"])}
+
+    async def agrade_documents(self, state: GraphState) -> GraphState:
+        """Grade documents for relevance asynchronously."""
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        speculation = self.astart_speculation(state)
+        try:
+            candidates, grades, pending = self.prepare_grading(state)
+            if pending:
+                llm_grades = await self.grader.agrade_documents(
+                    state["question"], [candidates[i] for i in pending], **self.grading_options()
+                )
+                for index, grade in zip(pending, llm_grades):
+                    grades[index] = grade
+            update = self.apply_grades(state, candidates, grades)
+        except BaseException:
+            self.cancel_speculation(speculation)
+            raise
+        return {**update, **(await self.aresolve_speculation(speculation, update["web_search_needed"]))}
+
+    def grading_options(self):
+        """Keyword arguments of the grader calls."""
+        return {
+            "max_concurrency": self.grading_concurrency,
+            "stop_on_irrelevant": self.grading_early_exit,
+            "mode": self.grading_mode,
+        }
+
+    def prepare_grading(self, state: GraphState):
+        """Triage the documents to grade, before the grader is called.
+
+        A follow-up's documents from earlier turns are graded against this question along
+        with the retrieved documents, after them.
+
+        Returns:
+            tuple: (candidate documents, their grades so far, indices left to the grader)
+        """
         documents = state["documents"]
-        filtered_docs = []
-        web_search_needed = "No"
+        carried = self.carried_documents(state, documents)
+        candidates = documents + carried
+        if not candidates:
+            return candidates, [], []
+        scores = (state.get("retrieval_scores") or []) + [None] * len(carried)
+        grades = self.triage(state["question"], candidates, scores, state.get("session"), carried=len(carried))
+        return candidates, grades, self.pending_grades(grades)
 
+    def apply_grades(self, state: GraphState, candidates, grades):
+        """State update of the grading node: the relevant documents and whether a web search is needed."""
+        documents = state["documents"]
+        filtered_docs = []
         if documents:
-            for doc in documents:
-                score = self.grader.grader_chain.invoke(
-                    {"question": question, "document": doc.page_content}
-                )
-                if score.binary_score == "yes":
-                    print("---GRADE: DOCUMENT RELEVANT---")
-                    filtered_docs.append(doc)
-                else:
-                    print("---GRADE: DOCUMENT NOT RELEVANT---")
-                    web_search_needed = "Yes"
+            filtered_docs, web_search_needed = self.filter_graded(documents, grades[:len(documents)])
         else:
-            print("---NO DOCUMENTS RETRIEVED---")
+            logger.debug("---NO DOCUMENTS RETRIEVED---")
             web_search_needed = "Yes"
+        relevant_carried, _ = self.filter_graded(candidates[len(documents):], grades[len(documents):])
+        filtered_docs, web_search_needed, carried = self.carry_session(
+            filtered_docs, web_search_needed, relevant_carried
+        )
+        return {
+            "documents": filtered_docs,
+            "question": state["question"],
+            "web_search_needed": web_search_needed,
+            "grades": self.session_grades(state, documents, grades),
+            "carried": carried,
+        }
+
+    def triage(self, question, documents, scores, session=None, carried=0):
+        """Decide clear-cut documents without the LLM grader.
+
+        Documents left undecided by their retrieval score and the reranker keep the grade
+        an earlier turn of the session gave them, if any; except the last `carried`, which
+        earlier turns graded for their own question and are graded for this one again.
+
+        Returns:
+            list: 'yes'/'no' for documents decided by their retrieval score or the reranker,
+                None for the ones left to the grader.
+        """
+        grades = [None] * len(documents)
+        counts = {"documents": len(documents)}
+        if self.score_band is not None and scores and len(scores) == len(documents):
+            low, high = self.score_band
+            for index, score in enumerate(self.band_scores(documents, scores)):
+                if score is None:
+                    continue
+                if score >= high:
+                    grades[index] = "yes"
+                elif score < low:
+                    grades[index] = "no"
+            counts["score_accepted"] = grades.count("yes")
+            counts["score_rejected"] = grades.count("no")
+        undecided = [i for i, grade in enumerate(grades) if grade is None]
+        if self.reranker is not None and undecided:
+            low, high = self.reranker_band
+            rerank_scores = self.reranker.score(question, [documents[i] for i in undecided])
+            for index, score in zip(undecided, rerank_scores):
+                if score >= high:
+                    grades[index] = "yes"
+                    counts["reranker_accepted"] = counts.get("reranker_accepted", 0) + 1
+                elif score < low:
+                    grades[index] = "no"
+                    counts["reranker_rejected"] = counts.get("reranker_rejected", 0) + 1
+        known = (session or {}).get("grades")
+        if known:
+            undecided = [i for i, grade in enumerate(grades[:len(documents) - carried]) if grade is None]
+            for index in undecided:
+                grades[index] = known.get(SessionStore.doc_key(documents[index]))
+            reused = len(undecided) - grades.count(None)
+            pending = self.pending_grades(grades)
+            # Listwise grading makes one call for all pending documents
+            saved = reused if self.grading_mode == "pointwise" else int(bool(reused and not pending))
+            counts["session_reused"] = reused
+            self.record_session(grader_calls_saved=saved)
+            telemetry.record_session(grader=saved)
+        counts["llm_graded"] = len(self.pending_grades(grades))
+        self.record_grading(**counts)
+        logger.debug(f"---TRIAGE: {grades.count('yes')} ACCEPTED, {grades.count('no')} REJECTED, "
+                     f"{counts['llm_graded']} TO GRADER---")
+        return grades
+
+    @staticmethod
+    def band_scores(documents, scores):
+        """Retrieval scores the score band applies to.
+
+        Lexical-only hits of hybrid retrieval get None: they are kept despite a low cosine
+        score, so that score says nothing about their relevance.
+        """
+        return [
+            None if (doc.metadata or {}).get("retrieval") == "lexical" else score
+            for doc, score in zip(documents, scores)
+        ]
+
+    def pending_grades(self, grades):
+        """Indices of the documents the grader still has to grade.
+
+        With early exit, a document already rejected by triage decides the web search,
+        so nothing is left to grade.
+        """
+        if self.grading_early_exit and "no" in grades:
+            return []
+        return [i for i, grade in enumerate(grades) if grade is None]
+
+    def record_grading(self, **increments):
+        """Add to the grading counters."""
+        with self.grading_lock:
+            for key, value in increments.items():
+                self.grading_stats[key] += value
+
+    def grading_report(self):
+        """Grading counters plus the fraction of documents that did not need a grader call."""
+        with self.grading_lock:
+            report = dict(self.grading_stats)
+        report["grader_calls_avoided"] = (
+            1 - report["llm_graded"] / report["documents"] if report["documents"] else 0.0
+        )
+        return report
+
+    def filter_graded(self, documents, grades):
+        """Keep the relevant documents in order and decide whether a web search is needed."""
+        filtered_docs = []
+        web_search_needed = "No"
+        for doc, grade in zip(documents, grades):
+            if grade == "yes":
+                logger.debug("---GRADE: DOCUMENT RELEVANT---")
+                filtered_docs.append(doc)
+            elif grade is None:
+                logger.debug("---GRADE: SKIPPED, WEB SEARCH ALREADY NEEDED---")
+            else:
+                logger.debug("---GRADE: DOCUMENT NOT RELEVANT---")
+                web_search_needed = "Yes"
+        return filtered_docs, web_search_needed
+
+    def should_speculate(self, state: GraphState) -> bool:
+        """Apply the speculation policy to the retrieval results."""
+        if self.session_web_documents(state):
+            # The session's earlier web results are graded first and make a search unnecessary if relevant
+            return False
+        if self.speculative_search == "always":
+            return True
+        if self.speculative_search == "low_score":
+            scores = self.band_scores(state.get("documents") or [], state.get("retrieval_scores") or [])
+            scores = [score for score in scores if score is not None]
+            return not scores or min(scores) < self.speculation_score_threshold
+        return False
+
+    def record_speculation(self, **increments):
+        """Add to the speculation counters."""
+        with self.speculation_lock:
+            for key, value in increments.items():
+                self.speculation_stats[key] += value
+
+    def speculate(self, question, record):
+        """Rewrite the question and search the web ahead of the grading outcome."""
+        started = time.perf_counter()
+        better_question = self.rephraser.rephraser_chain.invoke({"question": question})
+        record["calls"] += 1
+        web_results = self.search_web(better_question)
+        record["calls"] += 1
+        record["seconds"] = time.perf_counter() - started
+        return better_question, web_results
+
+    async def aspeculate(self, question, record):
+        """Async version of `speculate`."""
+        started = time.perf_counter()
+        better_question = await self.rephraser.rephraser_chain.ainvoke({"question": question})
+        record["calls"] += 1
+        web_results = await self.asearch_web(better_question)
+        record["calls"] += 1
+        record["seconds"] = time.perf_counter() - started
+        return better_question, web_results
+
+    def start_speculation(self, state: GraphState):
+        """Start the corrective path in the background if the policy asks for it."""
+        if not self.should_speculate(state):
+            return None
+        logger.debug("---SPECULATIVE WEB SEARCH STARTED---")
+        if self.speculation_executor is None:
+            self.speculation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculation")
+        record = {"calls": 0, "seconds": 0.0}
+        self.record_speculation(launched=1)
+        return self.speculation_executor.submit(self.speculate, state["question"], record), record
+
+    def astart_speculation(self, state: GraphState):
+        """Start the corrective path as a task on the running event loop if the policy asks for it."""
+        if not self.should_speculate(state):
+            return None
+        logger.debug("---SPECULATIVE WEB SEARCH STARTED---")
+        record = {"calls": 0, "seconds": 0.0}
+        self.record_speculation(launched=1)
+        return asyncio.ensure_future(self.aspeculate(state["question"], record)), record
+
+    def use_speculation(self, result, record):
+        """State update that lets `rewrite_query` and `web_search` reuse a speculative result."""
+        better_question, web_results = result
+        logger.debug("---SPECULATIVE WEB SEARCH USED---")
+        self.record_speculation(used=1, calls_saved=record["calls"], seconds_overlapped=record["seconds"])
+        return {"rewritten_question": better_question, "web_results": web_results}
+
+    def resolve_speculation(self, speculation, web_search_needed):
+        """Use the speculative result if grading asks for a web search, otherwise discard it."""
+        if speculation is None:
+            return {}
+        future, record = speculation
+        if web_search_needed == "Yes":
+            try:
+                return self.use_speculation(future.result(), record)
+            except Exception as e:
+                logger.warning(f"---SPECULATIVE WEB SEARCH FAILED: {e}---")
+                self.record_speculation(failed=1)
+                return {}
+        self.cancel_speculation(speculation)
+        return {}
+
+    async def aresolve_speculation(self, speculation, web_search_needed):
+        """Async version of `resolve_speculation`; a discarded task is cancelled."""
+        if speculation is None:
+            return {}
+        task, record = speculation
+        if web_search_needed == "Yes":
+            try:
+                return self.use_speculation(await task, record)
+            except Exception as e:
+                logger.warning(f"---SPECULATIVE WEB SEARCH FAILED: {e}---")
+                self.record_speculation(failed=1)
+                return {}
+        self.cancel_speculation(speculation)
+        return {}
+
+    def cancel_speculation(self, speculation):
+        """Discard a speculation, thread future or asyncio task, and cancel it if it has not finished."""
+        if speculation is None:
+            return
+        future, record = speculation
+        logger.debug("---SPECULATIVE WEB SEARCH DISCARDED---")
+        self.record_speculation(discarded=1)
+        future.cancel()
+        future.add_done_callback(lambda done: self.finish_discarded(done, record))
+
+    def finish_discarded(self, future, record):
+        """Done callback of a discarded speculation: its calls are wasted only if it completed."""
+        if future.cancelled():
+            return
+        # Retrieved, so a failure is not reported as never retrieved
+        error = future.exception()
+        if error is not None:
+            logger.debug(f"---DISCARDED SPECULATIVE WEB SEARCH FAILED: {error}---")
+            return
+        self.record_speculation(calls_wasted=record["calls"])
+
+    def start_turn(self, question, session_id=None):
+        """Initial graph state of a question, set up to reuse the recent turns of its session.
+
+        A follow-up is retrieved, graded, answered and cached as its standalone question;
+        the question as asked stays in 'user_question' for categorization and analytics.
+        """
+        if session_id is None:
+            return {"question": question, "user_question": question}
+        session = self.sessions.context(session_id, question)
+        self.record_session(turns=1, follow_ups=int(session["follow_up"]))
+        telemetry.record_session(follow_up=session["follow_up"])
+        if session["follow_up"]:
+            logger.debug(f"---FOLLOW-UP: {len(session['documents'])} DOCUMENTS, {len(session['grades'])} GRADES REUSABLE---")
+        return {"question": session["question"], "user_question": question, "session": session}
+
+    def end_turn(self, session_id, start, response):
+        """Keep a finished turn for the follow-ups of its session."""
+        if session_id is not None:
+            self.sessions.record(session_id, start["session"], response)
+
+    def session_grades(self, state, documents, grades):
+        """Grades of this turn's documents by document key, kept for later follow-ups."""
+        if state.get("session") is None:
+            return None
+        return {SessionStore.doc_key(doc): grade for doc, grade in zip(documents, grades) if grade is not None}
+
+    @staticmethod
+    def session_web_documents(state):
+        """Web documents an earlier turn of the conversation answered from, if this is a follow-up."""
+        session = state.get("session")
+        if not session or not session["follow_up"]:
+            return []
+        return [doc for doc in session["documents"] if (doc.metadata or {}).get("origin") == "web"]
+
+    @staticmethod
+    def carried_documents(state, documents):
+        """Documents of earlier turns a follow-up grades along with its retrieved documents."""
+        session = state.get("session")
+        if not session or not session["follow_up"]:
+            return []
+        keys = {SessionStore.doc_key(doc) for doc in documents}
+        return [doc for doc in session["documents"] if SessionStore.doc_key(doc) not in keys]
 
-        return {"documents": filtered_docs, "question": question, "web_search_needed": web_search_needed}
+    def carry_session(self, documents, web_search_needed, relevant_carried=()):
+        """Add the documents of earlier turns that passed grading for this follow-up.
+
+        When some of them are web results, a web search asked for by grading is skipped,
+        saving the rewrite and the search.
+
+        Returns:
+            tuple: (documents, web_search_needed, keys of the carried documents). The turn
+                records its documents without the carried ones, so a thread only reuses
+                what its last turns found.
+        """
+        if not relevant_carried:
+            return documents, web_search_needed, []
+        saved = 0
+        if web_search_needed == "Yes" and any((doc.metadata or {}).get("origin") == "web" for doc in relevant_carried):
+            logger.debug("---FOLLOW-UP: REUSING EARLIER WEB RESULTS GRADED RELEVANT---")
+            web_search_needed = "No"
+            saved = 1
+        self.record_session(documents_carried=len(relevant_carried), rewrite_calls_saved=saved, search_calls_saved=saved)
+        telemetry.record_session(rewrite=saved, search=saved)
+        return documents + list(relevant_carried), web_search_needed, [SessionStore.doc_key(doc) for doc in relevant_carried]
+
+    def record_session(self, **increments):
+        """Add to the session counters."""
+        with self.session_lock:
+            for key, value in increments.items():
+                self.session_stats[key] += value
+
+    def session_report(self):
+        """Session counters, the remote calls follow-ups saved per turn, and the session store size."""
+        with self.session_lock:
+            report = dict(self.session_stats)
+        saved = report["grader_calls_saved"] + report["rewrite_calls_saved"] + report["search_calls_saved"]
+        report["calls_saved_per_follow_up"] = saved / report["follow_ups"] if report["follow_ups"] else 0.0
+        report.update(self.sessions.stats())
+        return report
 
     def rewrite_query(self, state: GraphState) -> GraphState:
         """Rewrite the query."""
-        print("---REWRITE QUERY---")
+        logger.debug("---REWRITE QUERY---")
         question = state["question"]
-        better_question = self.rephraser.rephraser_chain.invoke({"question": question})
+        better_question = state.get("rewritten_question")
+        if better_question is None:
+            better_question = self.rephraser.rephraser_chain.invoke({"question": question})
+        return {"documents": state["documents"], "question": better_question}
+
+    async def arewrite_query(self, state: GraphState) -> GraphState:
+        """Rewrite the query asynchronously."""
+        logger.debug("---REWRITE QUERY---")
+        question = state["question"]
+        better_question = state.get("rewritten_question")
+        if better_question is None:
+            better_question = await self.rephraser.rephraser_chain.ainvoke({"question": question})
         return {"documents": state["documents"], "question": better_question}
 
     def web_search(self, state: GraphState) -> GraphState:
         """Perform a web search."""
-        print("---WEB SEARCH---")
+        logger.debug("---WEB SEARCH---")
+        question = state["question"]
+        documents = state["documents"]
+        web_results = state.get("web_results")
+        if web_results is None:
+            web_results = self.search_web(question)
+        documents.extend(self.web_documents(web_results))
+        return {"documents": documents, "question": question, "web_results": web_results}
+
+    async def aweb_search(self, state: GraphState) -> GraphState:
+        """Perform a web search asynchronously."""
+        logger.debug("---WEB SEARCH---")
         question = state["question"]
         documents = state["documents"]
-        web_results = tv_search.invoke(question)
-        web_content = "\n\n".join([doc["content"] for doc in web_results])
-        documents.append(Document(page_content=web_content))
-        return {"documents": documents, "question": question}
+        web_results = state.get("web_results")
+        if web_results is None:
+            web_results = await self.asearch_web(question)
+        documents.extend(self.web_documents(web_results))
+        return {"documents": documents, "question": question, "web_results": web_results}
+
+    @staticmethod
+    def web_documents(web_results):
+        """One document per web result, keeping its URL for source attribution."""
+        return [
+            Document(page_content=result["content"], metadata={"source": result.get("url", "web"), "origin": "web"})
+            for result in web_results
+        ]
+
+    def search_web(self, query):
+        """Search the web, serving recently searched queries from the cache."""
+        if self.web_cache is not None:
+            web_results = self.web_cache.get(query)
+            telemetry.record_cache("web", web_results is not None)
+            if web_results is not None:
+                logger.debug("---WEB SEARCH CACHE HIT---")
+                return web_results
+        tool = self.search_tool or get_tv_search()
+        started = time.perf_counter()
+        web_results = tool.invoke(query)
+        seconds = time.perf_counter() - started
+        if not isinstance(web_results, list):
+            return self.failed_search(query, tool, seconds, web_results)
+        telemetry.record_call("search", type(tool).__name__, seconds, results=len(web_results))
+        if self.web_cache is not None:
+            self.web_cache.put(query, web_results)
+        return web_results
+
+    @staticmethod
+    def failed_search(query, tool, seconds, error):
+        """No results for a failed search. Tavily returns its error as a string, which must not be cached."""
+        logger.warning(f"---WEB SEARCH FAILED for '{query}': {str(error)[:200]}---")
+        telemetry.record_call("search", type(tool).__name__, seconds, results=0, error=True)
+        return []
+
+    async def asearch_web(self, query):
+        """Async version of `search_web`."""
+        if self.web_cache is not None:
+            web_results = await asyncio.to_thread(self.web_cache.get, query)
+            telemetry.record_cache("web", web_results is not None)
+            if web_results is not None:
+                logger.debug("---WEB SEARCH CACHE HIT---")
+                return web_results
+        tool = self.search_tool or get_tv_search()
+        started = time.perf_counter()
+        web_results = await tool.ainvoke(query)
+        seconds = time.perf_counter() - started
+        if not isinstance(web_results, list):
+            return self.failed_search(query, tool, seconds, web_results)
+        telemetry.record_call("search", type(tool).__name__, seconds, results=len(web_results))
+        if self.web_cache is not None:
+            await asyncio.to_thread(self.web_cache.put, query, web_results)
+        return web_results
+
+    def write_back(self, state: GraphState):
+        """Index the web results behind an answered question in the background."""
+        web_results = state.get("web_results")
+        if not (self.web_write_back and web_results and self.ans_generator.is_answered(state.get("generation"))):
+            return None
+        if self.write_back_executor is None:
+            # A single worker keeps vector DB writes serialized
+            self.write_back_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write-back")
+        return self.write_back_executor.submit(self.data_loader.index_web_results, web_results, state["question"])
 
     def generate_answer(self, state: GraphState) -> GraphState:
         """Generate an answer."""
-        print("---GENERATE ANSWER---")
+        logger.debug("---GENERATE ANSWER---")
         question = state["question"]
         documents = state["documents"]
         generation = self.ans_generator.rag_chain.invoke(
             {"context": documents, "question": question}
         )
+        self.write_back({**state, "generation": generation})
+        return {"documents": documents, "question": question, "generation": generation}
+
+    async def agenerate_answer(self, state: GraphState) -> GraphState:
+        """Generate an answer asynchronously."""
+        logger.debug("---GENERATE ANSWER---")
+        question = state["question"]
+        documents = state["documents"]
+        generation = await self.ans_generator.rag_chain.ainvoke(
+            {"context": documents, "question": question}
+        )
+        self.write_back({**state, "generation": generation})
         return {"documents": documents, "question": question, "generation": generation}
 
     def decide_to_generate(self, state: GraphState) -> str:
         """Decide the next step."""
-        print("---ASSESS GRADED DOCUMENTS---")
+        logger.debug("---ASSESS GRADED DOCUMENTS---")
         if state["web_search_needed"] == "Yes":
-            print("---DECISION: REWRITE QUERY---")
+            logger.debug("---DECISION: REWRITE QUERY---")
+            telemetry.record_branch("rewrite_query")
             return "rewrite_query"
         else:
-            print("---DECISION: GENERATE RESPONSE---")
+            logger.debug("---DECISION: GENERATE RESPONSE---")
+            telemetry.record_branch("generate_answer")
             return "generate_answer"
 
 
 class AgenticRAG:
     """Sets up and executes the agent's workflow using a state graph."""
 
-    def __init__(self):
-        self.agent = Agent()
-        self.graph = StateGraph(GraphState)
+    def __init__(self, answer_cache=True, cache_threshold=0.92, cache_max_entries=1000,
+                 cache_ttl_seconds=7 * 24 * 3600, cache_path="answer_cache.db", agent=None):
+        """
+        Args:
+            answer_cache (bool): Serve answers to semantically repeated questions from a cache.
+            cache_threshold (float): Minimum cosine similarity between questions for a cache hit.
+            cache_max_entries (int): Maximum number of cached answers (LRU eviction).
+            cache_ttl_seconds (float): Lifetime of a cached answer.
+            cache_path (str): SQLite file the answer cache is persisted to.
+            agent (Agent): Prebuilt agent, e.g. with fake components. Defaults to `Agent()`.
+        """
+        self.agent = agent or Agent()
+        self.answer_cache = None
+        if answer_cache:
+            self.answer_cache = SemanticAnswerCache(
+                self.agent.data_loader.embedding_model,
+                self.agent.data_loader.index_version,
+                db_path=cache_path,
+                threshold=cache_threshold,
+                max_entries=cache_max_entries,
+                ttl_seconds=cache_ttl_seconds,
+            )
+        self.graph = self.build_graph()
+        self.async_graph = self.build_async_graph()
+        # Stops before generation so that `stream` can stream the answer tokens itself
+        self.retrieval_graph = self.build_graph(generate=False)
+
+    def build_graph(self, generate=True):
+        """Builds and compiles the synchronous workflow graph.
+
+        Args:
+            generate (bool): Include the answer generation node. Without it the graph ends
+                with the documents to answer from.
+        """
+        graph = StateGraph(GraphState)
 
         # Define the nodes
-        self.graph.add_node("retrieve", self.agent.retrieve)
-        self.graph.add_node("categorize_question", self.agent.categorize_question)
-        self.graph.add_node("grade_documents", self.agent.grade_documents)
-        self.graph.add_node("rewrite_query", self.agent.rewrite_query)
-        self.graph.add_node("web_search", self.agent.web_search)
-        self.graph.add_node("generate_answer", self.agent.generate_answer)
+        graph.add_node("retrieve", telemetry.node("retrieve", self.agent.retrieve))
+        graph.add_node("categorize_question", telemetry.node("categorize_question", self.agent.categorize_question))
+        graph.add_node("grade_documents", telemetry.node("grade_documents", self.agent.grade_documents))
+        graph.add_node("rewrite_query", telemetry.node("rewrite_query", self.agent.rewrite_query))
+        graph.add_node("web_search", telemetry.node("web_search", self.agent.web_search))
+        if generate:
+            graph.add_node("generate_answer", telemetry.node("generate_answer", self.agent.generate_answer))
 
         # Build graph
-        self.graph.set_entry_point("retrieve")
-        self.graph.add_edge("retrieve", "categorize_question")
-        self.graph.add_edge("categorize_question", "grade_documents")
-        #self.graph.add_edge("retrieve", "grade_documents")
-        self.graph.add_conditional_edges(
+        graph.set_entry_point("retrieve")
+        graph.add_edge("retrieve", "categorize_question")
+        graph.add_edge("categorize_question", "grade_documents")
+        #graph.add_edge("retrieve", "grade_documents")
+        self.add_corrective_edges(graph, generate)
+
+        # Compile graph
+        return graph.compile()
+
+    def build_async_graph(self):
+        """Builds and compiles the async workflow graph.
+
+        Categorization and DB logging do not depend on retrieval, so the entry node runs
+        them alongside it instead of as a separate step.
+        """
+        graph = StateGraph(GraphState)
+
+        # Define the nodes
+        graph.add_node("retrieve", telemetry.node("retrieve", self.agent.aretrieve_and_categorize))
+        graph.add_node("grade_documents", telemetry.node("grade_documents", self.agent.agrade_documents))
+        graph.add_node("rewrite_query", telemetry.node("rewrite_query", self.agent.arewrite_query))
+        graph.add_node("web_search", telemetry.node("web_search", self.agent.aweb_search))
+        graph.add_node("generate_answer", telemetry.node("generate_answer", self.agent.agenerate_answer))
+
+        # Build graph
+        graph.set_entry_point("retrieve")
+        graph.add_edge("retrieve", "grade_documents")
+        self.add_corrective_edges(graph)
+
+        # Compile graph
+        return graph.compile()
+
+    def add_corrective_edges(self, graph, generate=True):
+        """Adds the edges shared by all graphs, from grading to the answer."""
+        answer = "generate_answer" if generate else END
+        graph.add_conditional_edges(
             "grade_documents",
             self.agent.decide_to_generate,
-            {"rewrite_query": "rewrite_query", "generate_answer": "generate_answer"},
+            {"rewrite_query": "rewrite_query", "generate_answer": answer},
         )
-        self.graph.add_edge("rewrite_query", "web_search")
-        self.graph.add_edge("web_search", "generate_answer")
-        self.graph.add_edge("generate_answer", END)
+        graph.add_edge("rewrite_query", "web_search")
+        graph.add_edge("web_search", answer)
+        if generate:
+            graph.add_edge("generate_answer", END)
 
-        # Compile graph
-        self.graph = self.graph.compile()
+    def invoke(self, query: str, timings=None, session_id=None):
+        """Invoke the graph with the initial query, answering repeated questions from the cache.
+
+        Args:
+            query (str): The question.
+            timings (dict): If given, filled with the milliseconds spent in each node
+                ('answer_cache' for the cache lookup).
+            session_id (str): Conversation the question belongs to. Follow-up questions reuse
+                the documents, grades and web results of its recent turns.
+        """
+        with telemetry.trace(query):
+            start = self.agent.start_turn(query, session_id)
+            response = self.answer(start, timings)
+            self.agent.end_turn(session_id, start, response)
+            return response
+
+    def answer(self, start, timings=None):
+        """Answers the initial state of a turn from the cache or by running the graph.
+
+        Follow-ups are looked up and cached as the standalone question they are answered as.
+        """
+        if self.answer_cache is None:
+            return self.run_graph(start, timings)
+
+        question = start["question"]
+        started = time.perf_counter()
+        embedding = self.answer_cache.embed(question)
+        cached = self.answer_cache.lookup(question, embedding)
+        telemetry.record_cache("answer", cached is not None)
+        if timings is not None:
+            timings["answer_cache"] = (time.perf_counter() - started) * 1000
+        if cached is not None:
+            logger.debug("---ANSWER CACHE HIT---")
+            # Keep the analytics complete; categorization does not call an LLM.
+            cached.update(self.agent.categorize_question({**start, **cached}))
+            return cached
+        response = self.run_graph(start, timings)
+        self.answer_cache.store(question, response, embedding)
+        return response
+
+    def run_graph(self, start, timings=None):
+        """Runs the synchronous graph from the initial state, timing each node when `timings` is given."""
+        if timings is None:
+            return self.graph.invoke(start)
+        # Nodes run one after the other, so each update closes the previous node's time
+        state = dict(start)
+        started = time.perf_counter()
+        for update in self.graph.stream(state, stream_mode="updates"):
+            now = time.perf_counter()
+            for node, values in update.items():
+                timings[node] = timings.get(node, 0.0) + (now - started) * 1000
+                state.update(values or {})
+            started = now
+        return state
+
+    def stream(self, query: str, session_id=None):
+        """Run the graph for a query, yielding events as soon as they happen.
+
+        Args:
+            query (str): The question.
+            session_id (str): Conversation the question belongs to, see `invoke`.
+
+        Yields:
+            dict: {"type": "progress", "node": name} when a node starts,
+                {"type": "token", "content": text} for each generated answer token, and
+                finally {"type": "done", "response": final_state}.
+        """
+        with telemetry.trace(query):
+            start = self.agent.start_turn(query, session_id)
+            question = start["question"]
+            embedding = None
+            if self.answer_cache is not None:
+                embedding = self.answer_cache.embed(question)
+                cached = self.answer_cache.lookup(question, embedding)
+                telemetry.record_cache("answer", cached is not None)
+                if cached is not None:
+                    logger.debug("---ANSWER CACHE HIT---")
+                    yield {"type": "progress", "node": "answer_cache"}
+                    cached.update(self.agent.categorize_question({**start, **cached}))
+                    self.agent.end_turn(session_id, start, cached)
+                    yield {"type": "token", "content": cached["generation"]}
+                    yield {"type": "done", "response": cached}
+                    return
+
+            state = dict(start)
+            for mode, payload in self.retrieval_graph.stream(state, stream_mode=["debug", "updates"]):
+                if mode == "debug":
+                    if payload["type"] == "task":
+                        yield {"type": "progress", "node": payload["payload"]["name"]}
+                else:
+                    for update in payload.values():
+                        state.update(update)
 
-    def invoke(self, query: str):
-        """Invoke the graph with the initial query."""
-        response = self.graph.invoke({"question": query})
+            yield {"type": "progress", "node": "generate_answer"}
+            logger.debug("---GENERATE ANSWER---")
+            started = time.perf_counter()
+            tokens = []
+            for token in self.agent.ans_generator.stream(state["question"], state["documents"]):
+                tokens.append(token)
+                yield {"type": "token", "content": token}
+            state["generation"] = "".join(tokens)
+            self.agent.write_back(state)
+            telemetry.record_node("generate_answer", time.perf_counter() - started)
+
+            if self.answer_cache is not None:
+                self.answer_cache.store(question, state, embedding)
+            self.agent.end_turn(session_id, start, state)
+            yield {"type": "done", "response": state}
+
+    async def ainvoke(self, query: str, session_id=None):
+        """Invoke the async graph with the initial query; many queries can share one event loop.
+
+        Args:
+            query (str): The question.
+            session_id (str): Conversation the question belongs to, see `invoke`.
+        """
+        with telemetry.trace(query):
+            start = self.agent.start_turn(query, session_id)
+            response = await self.aanswer(start)
+            self.agent.end_turn(session_id, start, response)
+            return response
+
+    async def aanswer(self, start):
+        """Async version of `answer`."""
+        if self.answer_cache is None:
+            return await self.async_graph.ainvoke(start)
+
+        question = start["question"]
+        embedding = await asyncio.to_thread(self.answer_cache.embed, question)
+        cached = await asyncio.to_thread(self.answer_cache.lookup, question, embedding)
+        telemetry.record_cache("answer", cached is not None)
+        if cached is not None:
+            logger.debug("---ANSWER CACHE HIT---")
+            cached.update(await self.agent.acategorize_question({**start, **cached}))
+            return cached
+        response = await self.async_graph.ainvoke(start)
+        await asyncio.to_thread(self.answer_cache.store, question, response, embedding)
         return response
 
+    async def abatch(self, queries):
+        """Answer several queries concurrently on the current event loop."""
+        return await asyncio.gather(*(self.ainvoke(query) for query in queries))
+
 
 if __name__ == "__main__":
     query = "What is the capital of India?"
@@ -0,0 +1,192 @@
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from langchain.schema import Document
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers keyed on the embedding of the question.
+
+    A lookup returns the stored answer of the most similar cached question when the
+    cosine similarity reaches the threshold. Entries are evicted least-recently-used
+    beyond `max_entries` and expire after `ttl_seconds`. Every entry records the index
+    version it was generated against; entries of other versions are never served.
+
+    The embeddings are kept in memory. Entries stored here are added to it directly;
+    entries stored by other processes sharing the file are picked up by reloading it
+    whenever SQLite reports that another connection committed.
+    """
+
+    def __init__(self, embedding_model, index_version, db_path="answer_cache.db",
+                 threshold=0.92, max_entries=1000, ttl_seconds=7 * 24 * 3600):
+        """
+        Args:
+            embedding_model: Embedding model used to embed questions.
+            index_version (str): Version of the document index answers are generated against.
+            db_path (str): SQLite file the cache is persisted to.
+            threshold (float): Minimum cosine similarity for a cache hit.
+            max_entries (int): Maximum number of cached answers.
+            ttl_seconds (float): Lifetime of a cached answer.
+        """
+        self.embedding_model = embedding_model
+        self.index_version = index_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT,
+                embedding BLOB,
+                generation TEXT,
+                documents TEXT,
+                index_version TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+            """
+        )
+        self.invalidate(index_version)
+
+    def invalidate(self, index_version):
+        """
+        Switches the cache to a new index version, dropping answers of any other version.
+        """
+        with self.lock:
+            self.index_version = index_version
+            self.conn.execute("DELETE FROM answers WHERE index_version != ?", (index_version,))
+            self.conn.commit()
+            self._load()
+
+    def _load(self):
+        """
+        Drops expired entries and loads the remaining embeddings into memory.
+        """
+        self.conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self.conn.commit()
+        rows = self.conn.execute("SELECT id, embedding FROM answers ORDER BY id").fetchall()
+        self.data_version = self.data_version_now()
+        self.ids = [row[0] for row in rows]
+        if rows:
+            self.matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+
+    def data_version_now(self):
+        """
+        Returns SQLite's data version, which changes when another connection commits.
+        """
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        """
+        Reloads the embeddings if another process changed the cache since the last load.
+        Caller holds the lock.
+        """
+        if self.data_version_now() != self.data_version:
+            self._load()
+
+    def embed(self, question):
+        """
+        Returns the unit-normalized float32 embedding of a question.
+        """
+        vector = np.asarray(self.embedding_model.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question, embedding=None):
+        """
+        Returns the cached response for the most similar question, or None on a miss.
+
+        Args:
+            question (str): The user question.
+            embedding: Precomputed normalized question embedding, if available.
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+        with self.lock:
+            self.refresh()
+            if not self.ids:
+                self.misses += 1
+                return None
+            similarities = self.matrix @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            row = self.conn.execute(
+                "SELECT generation, documents, created_at FROM answers WHERE id = ?", (self.ids[best],)
+            ).fetchone()
+            if row is None or row[2] < time.time() - self.ttl_seconds:
+                self._load()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), self.ids[best]))
+            self.conn.commit()
+            self.hits += 1
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.loads(row[1])]
+        return {"question": question, "generation": row[0], "documents": documents, "cache_hit": True}
+
+    def store(self, question, response, embedding=None):
+        """
+        Caches the generation and documents of a graph response.
+
+        Args:
+            question (str): The user question.
+            response (dict): Final graph state with 'generation' and 'documents'.
+            embedding: Precomputed normalized question embedding, if available.
+        """
+        if not response.get("generation"):
+            return
+        if embedding is None:
+            embedding = self.embed(question)
+        documents = json.dumps([
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in response.get("documents") or []
+        ])
+        embedding = np.asarray(embedding, dtype=np.float32)
+        now = time.time()
+        with self.lock:
+            self.refresh()
+            row_id = self.conn.execute(
+                """
+                INSERT INTO answers (question, embedding, generation, documents, index_version, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (question, embedding.tobytes(), response["generation"], documents,
+                 self.index_version, now, now)
+            ).lastrowid
+            evicted = {row[0] for row in self.conn.execute(
+                "SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            )}
+            self.conn.executemany("DELETE FROM answers WHERE id = ?", [(evicted_id,) for evicted_id in evicted])
+            self.conn.commit()
+            # Appended in memory rather than reloading every embedding
+            self.ids.append(row_id)
+            self.matrix = np.vstack([self.matrix, embedding]) if len(self.ids) > 1 else embedding[None, :]
+            if evicted:
+                keep = [i for i, cached_id in enumerate(self.ids) if cached_id not in evicted]
+                self.ids = [self.ids[i] for i in keep]
+                self.matrix = self.matrix[keep]
+
+    @property
+    def hit_ratio(self):
+        """
+        Returns the fraction of lookups served from the cache.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of cached answers.
+        """
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio, "entries": len(self.ids)}
@@ -0,0 +1,73 @@
+import json
+import urllib.request
+
+
+class RAGClient:
+    """
+    Client of `server.py` with the `invoke` and `stream` interface of AgenticRAG, so the
+    Streamlit app can run as a thin client of the service. Only the standard library is
+    imported, so the client does not load the pipeline.
+
+    HTTP errors are raised as `urllib.error.HTTPError`; a 503 means the service's queue
+    is full and carries a Retry-After header.
+    """
+
+    def __init__(self, base_url, timeout=180):
+        """
+        Args:
+            base_url (str): URL of the service, e.g. http://localhost:8000.
+            timeout (float): Seconds to wait for the service to respond.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def get(self, path):
+        with self.request(path) as response:
+            return json.loads(response.read())
+
+    def invoke(self, query, session_id=None):
+        """
+        Returns the service's answer: the response fields of AgenticRAG.invoke, documents as
+        dicts, and 'coalesced' when the answer was shared with a concurrent request.
+        """
+        with self.request("/v1/answer", {"question": query, "session_id": session_id}) as response:
+            return json.loads(response.read())
+
+    def stream(self, query, session_id=None):
+        """
+        Yields the events of AgenticRAG.stream as the service sends them.
+
+        Raises:
+            RuntimeError: If the service failed to answer.
+        """
+        with self.request("/v1/stream", {"question": query, "session_id": session_id}) as response:
+            for line in response:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["type"] == "error":
+                    raise RuntimeError(event["message"])
+                yield event
+
+    def telemetry_summary(self):
+        """
+        Returns the service's `Telemetry.summary`.
+        """
+        return self.get("/v1/telemetry")
+
+    def analytics(self, days=None):
+        """
+        Returns the question rollups of the service's database, over the last `days` days
+        or all time: 'categories' and 'engagement' rows, as `CategoryDB` reads them.
+        """
+        return self.get("/v1/analytics" if days is None else f"/v1/analytics?days={days}")
+
+    def health(self):
+        return self.get("/healthz")
@@ -1,14 +1,84 @@
+import os
+import uuid
+import urllib.error
 import streamlit as st
 from PIL import Image
-from agentic_rag import AgenticRAG  
 import pandas as pd
-import plotly.express as px
+
+# Analytics time windows, in days (None covers all questions ever asked)
+ANALYTICS_WINDOWS = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "All time": None}
+
+
+# The rollup reads are cheap, but caching them keeps reruns from touching the database at all
+@st.cache_data(ttl=60, show_spinner=False)
+def load_category_counts(_db, days):
+    return _db.read_sql(days)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_engagement(_db, days):
+    if days is None:
+        return _db.read_qns()
+    return _db.read_daily(days)
+
+
+# Set to the URL of server.py to run the app as a thin client of the service
+API_URL = os.getenv("ANA_API_URL")
+
+
+# One pipeline per process, shared by every session and rerun
+@st.cache_resource(show_spinner="Loading ANA...")
+def get_agentic_rag():
+    if API_URL:
+        from api_client import RAGClient
+        return RAGClient(API_URL)
+    from agentic_rag import AgenticRAG
+    return AgenticRAG()
+
+
+# The analytics tab reads the question log through its own connection, so it never loads the pipeline
+@st.cache_resource
+def get_category_db():
+    from db_handler import CategoryDB
+    return CategoryDB()
+
+
+# The thin client shows the questions the service logged, not a local database
+@st.cache_data(ttl=60, show_spinner=False)
+def load_service_analytics(days):
+    analytics = get_agentic_rag().analytics(days)
+    period = "year_month" if days is None else "day"
+    return (
+        pd.DataFrame(analytics["categories"], columns=["category", "Count"]),
+        pd.DataFrame(analytics["engagement"], columns=[period, "Count"]),
+    )
+
+
+@st.cache_resource
+def load_image(path):
+    return Image.open(path)
+
 
 class buildApp:
+    # Status shown while a graph node runs
+    PROGRESS_LABELS = {
+        "answer_cache": "Found an answer to a similar question...",
+        "retrieve": "Retrieving relevant documents...",
+        "categorize_question": "Categorizing your question...",
+        "grade_documents": "Checking the documents for relevance...",
+        "rewrite_query": "Rewriting your question for web search...",
+        "web_search": "Searching the web...",
+        "generate_answer": "Generating the answer...",
+    }
+
     def __init__(self):
-        self.agentic_rag = AgenticRAG()  # Initialize the AgenticRAG instance
-        self.header_image = Image.open("header_image.webp")  # Header image
-        self.sidebar_image = Image.open("sidebar_image.webp")  # Sidebar image
+        self.header_image = load_image("header_image.webp")  # Header image
+        self.sidebar_image = load_image("sidebar_image.webp")  # Sidebar image
+
+    @property
+    def agentic_rag(self):
+        # Built on first use, so the page paints before the pipeline loads
+        return get_agentic_rag()
 
     def set_global_styles(self):
         st.markdown(
@@ -38,15 +108,55 @@ class buildApp:
         query = st.text_input("📝 Type your question below:", "")
         if st.button("Submit"):
             if query.strip():
-                with st.spinner("Processing your query..."):
-                    response = self.agentic_rag.invoke(query)
-                    st.success("Query processed successfully!")
-                    st.markdown("### 💡 ANA Says")
-                    st.write(response.get("generation", "No response generated."))
+                status = st.empty()
+                status.info("Processing your query...")
+                st.markdown("### 💡 ANA Says")
+                answer = st.empty()
+                generation = ""
+                # Follow-up questions in this browser session reuse what earlier answers found
+                session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+                try:
+                    for event in self.agentic_rag.stream(query, session_id=session_id):
+                        if event["type"] == "progress":
+                            status.info(self.PROGRESS_LABELS.get(event["node"], "Processing your query..."))
+                        elif event["type"] == "token":
+                            generation += event["content"]
+                            answer.markdown(generation)
+                except urllib.error.HTTPError as e:
+                    # Only raised by the thin client of server.py
+                    status.empty()
+                    if e.code == 503:
+                        retry_after = e.headers.get("Retry-After")
+                        wait = f"in {retry_after} seconds" if retry_after else "in a moment"
+                        st.warning(f"ANA is busy answering other questions. Please try again {wait}.")
+                    else:
+                        st.error(f"ANA could not answer your question (HTTP {e.code}).")
+                    return
+                except urllib.error.URLError as e:
+                    status.empty()
+                    st.error(f"ANA is unreachable ({e.reason}). Please try again later.")
+                    return
+                except RuntimeError as e:
+                    # The service failed while answering
+                    status.empty()
+                    st.error(f"ANA could not answer your question: {e}")
+                    return
+                status.success("Query processed successfully!")
+                if not generation:
+                    answer.write("No response generated.")
             else:
                 st.warning("Please enter a valid question.")
 
     def render_tab2(self):
+        import plotly.express as px
+
+        window = st.selectbox("Time window", list(ANALYTICS_WINDOWS), index=1)
+        days = ANALYTICS_WINDOWS[window]
+        if API_URL:
+            df_queries, df_engagement = load_service_analytics(days)
+        else:
+            db = get_category_db()
+            df_queries, df_engagement = load_category_counts(db, days), load_engagement(db, days)
         col1, col2 = st.columns(2)
         
         with col1:
@@ -58,7 +168,6 @@ class buildApp:
                 """,
                 unsafe_allow_html=True,
             )
-            df_queries = self.agentic_rag.agent.db.read_sql()
             fig_query = px.bar(
                 df_queries,
                 x="category",
@@ -77,17 +186,55 @@ class buildApp:
                 """,
                 unsafe_allow_html=True,
             )
-            df_engagement = self.agentic_rag.agent.db.read_qns()
-            df_engagement["year_month"] = pd.Categorical(df_engagement["year_month"], ordered=True)
+            period = "year_month" if days is None else "day"
+            df_engagement[period] = pd.Categorical(df_engagement[period], ordered=True)
             fig_engagement = px.line(
                 df_engagement,
-                x="year_month",
+                x=period,
                 y="Count",
                 markers=True,
-                labels={"year_month": "Month-Year", "Count": "Number of Questions"},
+                labels={"year_month": "Month-Year", "day": "Day", "Count": "Number of Questions"},
             )
             st.plotly_chart(fig_engagement, use_container_width=True)
 
+        self.render_telemetry(px)
+
+    def render_telemetry(self, px):
+        st.markdown(
+            """
+            <div style="background-color: #f9f9f9; padding: 20px; border-radius: 10px;">
+            <h4 style="color: #3f51b5;">Latency & Cost</h4>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+        if API_URL:
+            summary = self.agentic_rag.telemetry_summary()
+        else:
+            from telemetry import telemetry
+            summary = telemetry.summary()
+        if not summary["requests"]:
+            st.info("No questions answered since the app started.")
+            return
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Questions traced", summary["requests"])
+        col2.metric("LLM cost (USD)", f"{sum(u['cost_usd'] for u in summary['llm_usage'].values()):.4f}")
+        col3.metric("Answer cache hits", f"{summary['cache_hit_ratio'].get('answer', 0.0):.0%}")
+        col4.metric("Context tokens saved", f"{summary['context_tokens']['saved']:,.0f}")
+        col5.metric("Calls saved by follow-ups", f"{sum(summary['session_calls_saved'].values()):,.0f}")
+
+        df_latency = pd.DataFrame(summary["latency"]).sort_values("p95_ms", ascending=False)
+        fig_latency = px.bar(
+            df_latency,
+            x="step",
+            y=["p50_ms", "p95_ms"],
+            barmode="group",
+            labels={"step": "Step", "value": "Latency (ms)", "variable": "Percentile"},
+        )
+        st.plotly_chart(fig_latency, use_container_width=True)
+        if summary["llm_usage"]:
+            st.dataframe(pd.DataFrame.from_dict(summary["llm_usage"], orient="index"), use_container_width=True)
+
     def run(self):
         self.set_global_styles()
         self.render_sidebar()
@@ -0,0 +1,207 @@
+"""
+Runs a file of questions through AgenticRAG, e.g. for nightly evaluation or to
+pre-warm the caches.
+
+Questions are read from JSONL (a 'question' field and an optional 'id') or CSV (a
+'question' column and an optional 'id' column); without an id, the line number is
+used. Results are appended to a JSONL file as soon as each question finishes, and
+questions already answered in it are skipped, so an interrupted run resumes where it
+stopped and retries the questions that failed.
+
+Usage:
+    python batch_runner.py questions.jsonl results.jsonl
+    python batch_runner.py questions.csv results.jsonl --workers 8 --rate 2
+"""
+import csv
+import json
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from agentic_rag import AgenticRAG
+from bench_retrieval import percentile
+
+
+def read_questions(path):
+    """
+    Yields (id, question) pairs from a JSONL or CSV file.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            question = (row.get("question") or "").strip()
+            if question:
+                yield str(row.get("id") or number), question
+
+
+def read_done(path):
+    """
+    Returns the ids already answered in a results file. A line cut short by a crash is
+    ignored, and questions that failed are not done, so a resumed run retries them.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if "error" not in record:
+                    done.add(record["id"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+class RateLimiter:
+    """
+    Spaces calls to `acquire` so that at most `rate` start per second, across threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BatchRunner:
+    """
+    Answers questions on a worker pool and appends one JSON result per question.
+    """
+
+    def __init__(self, rag, output_path, workers=4, rate=None, progress_every=100):
+        """
+        Args:
+            rag (AgenticRAG): The pipeline to run the questions through.
+            output_path (str): JSONL file the results are appended to.
+            workers (int): Questions processed concurrently.
+            rate (float): Maximum questions started per second. None for no limit.
+            progress_every (int): Print progress every this many questions.
+        """
+        self.rag = rag
+        self.output_path = output_path
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.progress_every = progress_every
+        self.lock = threading.Lock()
+        self.results = []
+
+    def answer(self, question_id, question):
+        """
+        Answers one question and returns its result record; failures are recorded, not raised.
+        """
+        self.limiter.acquire()
+        timings = {}
+        started = time.perf_counter()
+        record = {"id": question_id, "question": question}
+        try:
+            response = self.rag.invoke(question, timings=timings)
+            record.update({
+                "category": response.get("category"),
+                "generation": response.get("generation"),
+                "corrective": response.get("web_search_needed") == "Yes",
+                "cache_hit": bool(response.get("cache_hit")),
+            })
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_ms"] = (time.perf_counter() - started) * 1000
+        record["node_ms"] = timings
+        return record
+
+    def write(self, output, record):
+        with self.lock:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            self.results.append(record)
+            if len(self.results) % self.progress_every == 0:
+                print(f"[INFO] {len(self.results)} questions processed.")
+
+    def run(self, questions):
+        """
+        Answers every question not yet in the output file.
+
+        Returns:
+            dict: Throughput and latency report of this run.
+        """
+        done = read_done(self.output_path)
+        pending = [(question_id, question) for question_id, question in questions if question_id not in done]
+        print(f"[INFO] {len(done)} questions already answered, {len(pending)} to go.")
+        started = time.perf_counter()
+        with open(self.output_path, "a", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-runner") as executor:
+            # Keeps at most a few questions per worker queued, however long the input
+            in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+            def task(question_id, question):
+                try:
+                    self.write(output, self.answer(question_id, question))
+                finally:
+                    in_flight.release()
+
+            for question_id, question in pending:
+                in_flight.acquire()
+                executor.submit(task, question_id, question)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        answered = [r for r in self.results if "error" not in r]
+        graphed = [r for r in answered if not r["cache_hit"]]
+        node_ms = {}
+        for record in answered:
+            for node, ms in record["node_ms"].items():
+                node_ms.setdefault(node, []).append(ms)
+        return {
+            "questions": len(self.results),
+            "errors": len(self.results) - len(answered),
+            "seconds": elapsed,
+            "questions_per_second": len(self.results) / elapsed if elapsed else 0.0,
+            "cache_hit_rate": (len(answered) - len(graphed)) / len(answered) if answered else 0.0,
+            "corrective_rate": sum(r["corrective"] for r in graphed) / len(graphed) if graphed else 0.0,
+            "latency_p50_ms": percentile([r["latency_ms"] for r in answered], 50),
+            "latency_p95_ms": percentile([r["latency_ms"] for r in answered], 95),
+            "node_ms": {
+                node: {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+                for node, values in node_ms.items()
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL or CSV file of questions.")
+    parser.add_argument("output", help="JSONL file the results are appended to.")
+    parser.add_argument("--workers", type=int, default=4, help="Questions processed concurrently.")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum questions started per second.")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Run every question through the graph.")
+    args = parser.parse_args()
+
+    rag = AgenticRAG(answer_cache=not args.no_answer_cache)
+    report = BatchRunner(rag, args.output, workers=args.workers, rate=args.rate).run(read_questions(args.questions))
+    rag.agent.db.close()
+
+    print(f"\nquestions       {report['questions']} ({report['errors']} errors) in {report['seconds']:.1f} s")
+    print(f"throughput      {report['questions_per_second']:.2f} questions/s")
+    print(f"cache hits      {report['cache_hit_rate']:.1%}")
+    print(f"corrective path {report['corrective_rate']:.1%} of graph runs")
+    print(f"latency         p50 {report['latency_p50_ms']:.0f} ms, p95 {report['latency_p95_ms']:.0f} ms")
+    print(f"\n{'node':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for node, p in report["node_ms"].items():
+        print(f"{node:<20} {p['p50']:>8.1f} {p['p95']:>8.1f} {p['p99']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Offline benchmark of the pipeline's own overhead.
+
+OpenAI and Tavily are replaced by the deterministic stand-ins of `fakes.py`, with
+configurable latency (zero by default, so only our code is measured), and every file
+is written to a temporary directory. Covered: DataLoader ingestion, the Agent nodes,
+full AgenticRAG.invoke runs, and CategoryDB writes and reads.
+
+Each scenario reports throughput and p50/p95/p99 latency. Save the report as a
+baseline on a reference run, then compare later runs against it; the exit status is
+1 when a scenario's p95 regressed beyond the tolerance, so this can gate CI.
+
+Usage:
+    python bench_offline.py --save-baseline bench_baseline.json
+    python bench_offline.py --baseline bench_baseline.json --tolerance 0.25
+    python bench_offline.py --llm-latency 0.2 --search-latency 0.5
+    python bench_offline.py --vector-backend mmap --vector-dtype int8
+"""
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import contextlib
+from agentic_rag import Agent, AgenticRAG
+from bench_retrieval import load_questions, percentile
+from data_loader import DataLoader
+from db_handler import CategoryDB
+from fakes import FakeChatModel, FakeEmbeddings, FakeSearch
+from mmap_store import MmapVectorStore
+
+DEFAULT_QUESTIONS = [
+    "How much exercise should an adult get per week?",
+    "What is a balanced diet for weight loss?",
+    "How many hours of sleep do teenagers need?",
+    "How can I manage stress and anxiety at work?",
+    "Which vitamins are important for bone health?",
+    "What are the side effects of common painkillers?",
+    "Is intermittent fasting healthy?",
+    "How do I lower my blood pressure naturally?",
+    "What foods are rich in protein?",
+    "How can I improve my mental health during winter?",
+    "Does caffeine affect sleep quality?",
+    "What are the early symptoms of diabetes?",
+]
+
+
+def summarize(latencies, seconds):
+    """
+    Returns the throughput and latency percentiles of a scenario.
+    """
+    return {
+        "count": len(latencies),
+        "seconds": round(seconds, 4),
+        "throughput": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def measure(fn, items):
+    """
+    Calls fn on every item and returns the scenario summary.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        call_started = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(args, workdir):
+    """
+    Runs every scenario in workdir and returns {scenario: summary}.
+    """
+    questions = (load_questions(args.questions) if args.questions else DEFAULT_QUESTIONS) * args.rounds
+    pdf_directory = os.path.abspath(args.pdf_directory)
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    results = {}
+
+    results["ingest"] = measure(
+        lambda i: DataLoader(
+            pdf_directory=pdf_directory,
+            persist_directory=os.path.join(workdir, f"ingest_{i}"),
+            embedding_model=embeddings,
+            embedding_cache=False,
+            vector_backend=args.vector_backend,
+            vector_dtype=args.vector_dtype,
+        ),
+        range(args.ingest_runs),
+    )
+
+    data_loader = DataLoader(
+        pdf_directory=pdf_directory,
+        persist_directory=os.path.join(workdir, "vector_db"),
+        embedding_model=embeddings,
+        vector_backend=args.vector_backend,
+        vector_dtype=args.vector_dtype,
+    )
+    db = CategoryDB(os.path.join(workdir, "categories.db"))
+    agent = Agent(
+        llm=FakeChatModel(latency=args.llm_latency, relevance=args.relevance),
+        search_tool=FakeSearch(latency=args.search_latency),
+        data_loader=data_loader,
+        db=db,
+        web_cache=False,
+    )
+
+    states = {}
+    results["node:retrieve"] = measure(lambda q: states.__setitem__(q, agent.retrieve({"question": q})), questions)
+    results["node:categorize_question"] = measure(lambda q: agent.categorize_question(states[q]), questions)
+    results["node:grade_documents"] = measure(lambda q: states.__setitem__(q, agent.grade_documents(states[q])), questions)
+    results["node:generate_answer"] = measure(lambda q: agent.generate_answer(states[q]), questions)
+
+    rag = AgenticRAG(answer_cache=False, agent=agent)
+    results["invoke"] = measure(rag.invoke, questions)
+
+    writes = [f"{question} #{i}" for i in range(args.db_writes // len(questions) + 1) for question in questions]
+    started = time.perf_counter()
+    results["db:write"] = measure(lambda q: db.save_category(q, "General health"), writes[:args.db_writes])
+    db.flush()
+    # Queueing is cheap; the throughput that matters includes committing to disk
+    seconds = time.perf_counter() - started
+    results["db:write"]["seconds"] = round(seconds, 4)
+    results["db:write"]["throughput"] = round(args.db_writes / seconds, 2)
+    results["db:read"] = measure(lambda _: (db.read_sql(), db.read_sql(days=30), db.read_qns()), range(args.db_reads))
+    db.close()
+    return results
+
+
+def compare(results, baseline, tolerance, floor_ms):
+    """
+    Returns the scenarios whose p95 regressed beyond the tolerance against the baseline.
+    Differences under floor_ms are treated as noise.
+    """
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance)
+        if summary["p95_ms"] > limit and summary["p95_ms"] - base["p95_ms"] > floor_ms:
+            regressions.append((name, base["p95_ms"], summary["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="Text file with one question per line, or JSONL with a 'question' field.")
+    parser.add_argument("--rounds", type=int, default=5, help="Times the question set is run.")
+    parser.add_argument("--pdf-directory", default="docs", help="PDFs ingested by the benchmark.")
+    parser.add_argument("--ingest-runs", type=int, default=3, help="Full ingestions from scratch.")
+    parser.add_argument("--db-writes", type=int, default=10000, help="Questions logged to CategoryDB.")
+    parser.add_argument("--db-reads", type=int, default=200, help="Analytics reads from CategoryDB.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call.")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding call.")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Seconds per fake web search.")
+    parser.add_argument("--vector-backend", default="chroma", choices=DataLoader.VECTOR_BACKENDS)
+    parser.add_argument("--vector-dtype", default="float32", choices=MmapVectorStore.DTYPES)
+    parser.add_argument("--relevance", type=float, default=0.5, help="Share of documents the fake grader accepts.")
+    parser.add_argument("--save-baseline", help="Write the report to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the report against this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95 increase.")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="p95 increases below this are ignored.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with contextlib.ExitStack() as quiet:
+            if not args.verbose:
+                quiet.enter_context(contextlib.redirect_stdout(io.StringIO()))
+                quiet.enter_context(contextlib.redirect_stderr(io.StringIO()))
+            results = run(args, workdir)
+
+    print(f"{'scenario':<26} {'count':>6} {'per s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in results.items():
+        print(f"{name:<26} {s['count']:>6} {s['throughput']:>10.1f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[INFO] Baseline saved to {args.save_baseline}.")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, before, after in regressions:
+                print(f"  {name}: p95 {before:.2f} ms -> {after:.2f} ms")
+            sys.exit(1)
+        print(f"\nNo regression beyond {args.tolerance:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
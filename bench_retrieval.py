@@ -0,0 +1,79 @@
+"""
+Compares vector and hybrid retrieval on a set of questions.
+
+For every retrieval mode each question is retrieved and graded with the regular
+Agent nodes, and the share of questions sent down the corrective (rewrite + web
+search) path is reported together with the retrieval latency.
+
+Usage:
+    python bench_retrieval.py questions.txt
+    python bench_retrieval.py questions.jsonl --modes vector hybrid
+"""
+import json
+import time
+import argparse
+from agentic_rag import Agent
+
+
+def load_questions(path):
+    """
+    Reads questions from a text file (one per line) or a JSONL file with a 'question' field.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of the values by nearest rank.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def run_mode(agent, mode, questions):
+    """
+    Retrieves and grades every question in one retrieval mode.
+    """
+    agent.data_loader.retrieval_mode = mode
+    latencies, corrective, retrieved = [], 0, 0
+    for question in questions:
+        started = time.perf_counter()
+        state = agent.retrieve({"question": question})
+        latencies.append((time.perf_counter() - started) * 1000)
+        retrieved += len(state["documents"])
+        graded = agent.grade_documents(state)
+        corrective += graded["web_search_needed"] == "Yes"
+    return {
+        "mode": mode,
+        "questions": len(questions),
+        "corrective_rate": corrective / len(questions),
+        "avg_documents": retrieved / len(questions),
+        "retrieval_p50_ms": percentile(latencies, 50),
+        "retrieval_p95_ms": percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="Text file with one question per line, or JSONL with a 'question' field.")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"], help="Retrieval modes to compare.")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    agent = Agent()
+    results = [run_mode(agent, mode, questions) for mode in args.modes]
+
+    print(f"{'mode':<8} {'questions':>9} {'corrective':>10} {'docs':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['questions']:>9} {r['corrective_rate']:>10.1%} {r['avg_documents']:>6.2f} "
+              f"{r['retrieval_p50_ms']:>8.1f} {r['retrieval_p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Load test of the HTTP service of server.py.
+
+Starts the service in this process over the fakes of `fakes.py`, or targets a running
+one with --url, and sends --requests questions from --concurrency client threads. A
+share of the requests (--duplicates) repeats a question sent shortly before, as
+concurrent users asking the same thing do, to exercise in-flight coalescing; the rest
+are distinct. The answer cache is off unless --answer-cache is given, so repeated
+questions are only shared while in flight.
+
+Reports throughput, latency percentiles of the answered requests, the count per
+status (503 when the admission queue is full), and the service's request counters.
+
+Usage:
+    python bench_server.py --requests 200 --concurrency 32 --llm-latency 0.2
+    python bench_server.py --workers 2 --queue-size 4 --concurrency 64
+    python bench_server.py --url http://localhost:8000 --requests 500
+"""
+import time
+import random
+import argparse
+import threading
+import urllib.error
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from api_client import RAGClient
+from bench_offline import DEFAULT_QUESTIONS
+from bench_retrieval import percentile
+
+
+def make_requests(count, duplicates, window, seed=0):
+    """
+    Returns the questions to send: distinct ones, and repeats of one of the last `window`.
+    """
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        if questions and rng.random() < duplicates:
+            questions.append(rng.choice(questions[-window:]))
+        else:
+            questions.append(f"{DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)]} ({i})")
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Service to load, instead of starting one over the fakes.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16, help="Client threads sending requests.")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="Share of requests repeating a recent question.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--answer-cache", action="store_true")
+    parser.add_argument("--pdf-directory", default="docs")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call.")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Seconds per fake web search.")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        from server import build_rag, serve
+        args.offline, args.no_answer_cache, args.vector_backend = True, not args.answer_cache, "chroma"
+        server, _ = serve(build_rag(args), port=0, workers=args.workers, queue_size=args.queue_size)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = RAGClient(url)
+    questions = make_requests(args.requests, args.duplicates, args.concurrency)
+
+    lock = threading.Lock()
+    results = []
+
+    def send(question):
+        started = time.perf_counter()
+        try:
+            status, coalesced = 200, client.invoke(question).get("coalesced", False)
+        except urllib.error.HTTPError as e:
+            status, coalesced = e.code, False
+        except OSError as e:
+            # Connection refused or reset
+            status, coalesced = type(e).__name__, False
+        with lock:
+            results.append((status, (time.perf_counter() - started) * 1000, coalesced))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send, questions))
+    seconds = time.perf_counter() - started
+
+    answered = [latency for status, latency, _ in results if status == 200]
+    statuses = Counter(status for status, _, _ in results)
+    print(f"{len(results)} requests, {args.concurrency} concurrent, {args.duplicates:.0%} repeated, in {seconds:.2f}s\n")
+    print(f"answered/s  {len(answered) / seconds:>8.1f}")
+    for q in (50, 95, 99):
+        print(f"p{q} ms      {percentile(answered, q):>8.1f}")
+    print(f"coalesced   {sum(coalesced for _, _, coalesced in results):>8}")
+    for status, count in sorted(statuses.items(), key=str):
+        print(f"HTTP {status}    {count:>8}" if isinstance(status, int) else f"{status:<12}{count:>8}")
+    print(f"\nservice: {client.health()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures the startup cost of the Streamlit app before and after lazy loading.
+
+Every stage runs in a fresh interpreter, so import and construction costs are not
+hidden by modules already loaded, and runs the app script itself with Streamlit's
+AppTest, so both tabs render as they do in a browser. "After" is the app as it is: the
+first run of the script, which paints without loading the pipeline, and a repeat run.
+"Before" adds what the eager app did on top of that: its first load imported plotly and
+the web search client and built the whole pipeline with its grader, and every rerun
+built the pipeline and grader again with the modules already imported.
+
+By default the pipeline is built from the fakes of `fakes.py` over an index synced once
+beforehand, so the benchmark runs without API keys; the fakes cost less to build than
+the OpenAI and Tavily clients, so "before" is a lower bound. --online builds the real
+pipeline instead.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --repeat 5
+    python bench_startup.py --online
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def timed(code, setup=""):
+    """
+    Returns a script printing the duration of code, in seconds, after running setup.
+    """
+    return f"import time\n{setup}\nstarted = time.perf_counter()\n{code}\nprint(time.perf_counter() - started)"
+
+
+# Streamlit is loaded before the script runs, as by the server; the run raises if the app did
+APP_SETUP = "from streamlit.testing.v1 import AppTest"
+APP_FIRST_RUN = f"at = AppTest.from_file({os.path.join(ROOT, 'app.py')!r}, default_timeout=120)\nassert not at.run().exception"
+APP_RERUN = "assert not at.run().exception"
+
+# What the eager app loaded once per process
+EAGER_IMPORTS = "import plotly.express\nfrom agentic_rag import Agent, AgenticRAG\nfrom utils import get_tv_search"
+ONLINE_IMPORTS = "get_tv_search()"
+OFFLINE_IMPORTS = "from data_loader import DataLoader\nfrom db_handler import CategoryDB\nfrom fakes import FakeChatModel, FakeEmbeddings, FakeSearch"
+
+
+def eager_build(workdir):
+    """
+    Returns what the eager app built on every run: the pipeline and its grader, from the
+    fakes over the index in workdir, or the real ones without a workdir.
+    """
+    if workdir is None:
+        return "AgenticRAG().agent.grader"
+    data_loader = (f"DataLoader(pdf_directory={os.path.join(ROOT, 'docs')!r}, persist_directory="
+                   f"{os.path.join(workdir, 'vector_db')!r}, embedding_model=FakeEmbeddings())")
+    agent = (f"Agent(llm=FakeChatModel(), search_tool=FakeSearch(), data_loader={data_loader}, "
+             f"db=CategoryDB({os.path.join(workdir, 'categories.db')!r}))")
+    return f"AgenticRAG(agent={agent}, cache_path={os.path.join(workdir, 'answer_cache.db')!r}).agent.grader"
+
+
+def stages(workdir):
+    """
+    Returns the scripts to time by stage name.
+    """
+    imports = f"{EAGER_IMPORTS}\n{OFFLINE_IMPORTS if workdir else ONLINE_IMPORTS}"
+    build = eager_build(workdir)
+    return {
+        "eager first load": timed(f"{imports}\n{build}\n{APP_FIRST_RUN}", setup=APP_SETUP),
+        "eager rerun": timed(f"{build}\n{APP_RERUN}", setup=f"{APP_SETUP}\n{imports}\n{build}\n{APP_FIRST_RUN}"),
+        "first run": timed(APP_FIRST_RUN, setup=APP_SETUP),
+        "rerun": timed(APP_RERUN, setup=f"{APP_SETUP}\n{APP_FIRST_RUN}"),
+    }
+
+
+def run_script(script):
+    """
+    Runs a script in a fresh interpreter from the app's directory and returns the duration
+    it printed last.
+    """
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=ROOT)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported.")
+    parser.add_argument("--online", action="store_true", help="Build the real pipeline, which needs API keys.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.online:
+            workdir = None
+        else:
+            # Indexed once, so the eager runs open an index that is up to date, as a deployment does
+            run_script(timed(eager_build(workdir), setup=f"{EAGER_IMPORTS}\n{OFFLINE_IMPORTS}"))
+        timings = {
+            name: median(run_script(script) for _ in range(args.repeat)) for name, script in stages(workdir).items()
+        }
+
+    for name, seconds in timings.items():
+        print(f"{name:<18} {seconds * 1000:>10.1f} ms")
+    print(f"\nbefore: first load {timings['eager first load'] * 1000:.1f} ms, "
+          f"every rerun {timings['eager rerun'] * 1000:.1f} ms")
+    print(f"after:  first run {timings['first run'] * 1000:.1f} ms, "
+          f"every rerun {timings['rerun'] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
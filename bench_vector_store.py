@@ -0,0 +1,195 @@
+"""
+Compares the Chroma and memory-mapped vector store backends.
+
+A synthetic corpus of clustered unit vectors with chunk-sized texts is written to
+Chroma (HNSW, cosine, as DataLoader configures it) and to MmapVectorStore in
+float32, float16 and int8. Queries are noisy copies of corpus vectors, and their
+exact float32 neighbours are the ground truth.
+
+Each backend is then measured in a fresh interpreter: time to import its modules and
+to open the store, recall@k, single-query latency, batched-query latency and recall, and memory. RSS counts
+the store's mapped pages, which the page cache shares between processes; anonymous
+memory is what each process holds privately (Linux only).
+
+Usage:
+    python bench_vector_store.py
+    python bench_vector_store.py --chunks 50000 --dim 1536 --queries 200 --k 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+BACKENDS = ("chroma", "mmap:float32", "mmap:float16", "mmap:int8")
+# Chroma rejects larger upserts
+WRITE_BATCH = 5000
+
+
+def memory_mb():
+    """
+    Returns the (RSS, anonymous memory) of this process in MB; anonymous memory is None off Linux.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith("0"))
+        kb = lambda name: int(fields[name].split()[0])
+        return kb("Rss") / 1024, kb("Anonymous") / 1024
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024), None
+
+
+def make_corpus(chunks, dim, queries, k, seed=0):
+    """
+    Returns clustered unit vectors, chunk texts, query vectors and their exact top-k rows.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, chunks // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=chunks)] + 0.5 * rng.normal(size=(chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    words = np.array(["sleep", "exercise", "diet", "protein", "stress", "vitamin", "heart", "dose", "adult", "week"])
+    texts = [" ".join(words[rng.integers(len(words), size=300)]) + f" #{i}" for i in range(chunks)]
+    query_vectors = vectors[rng.integers(chunks, size=queries)] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+    return vectors, texts, query_vectors, truth
+
+
+def recall_at(found, truth, k):
+    """
+    Returns the mean share of each query's exact top-k rows found.
+    """
+    return float(np.mean([len(set(rows) & set(expected)) / k for rows, expected in zip(found, truth.tolist())]))
+
+
+def build(backend, directory, vectors, texts):
+    """
+    Writes the corpus to a backend and returns the seconds it took.
+    """
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+    metadatas = [{"file_name": "synthetic.pdf", "page": i // 4} for i in range(len(texts))]
+    started = time.perf_counter()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        db = Chroma(collection_name="bench", collection_metadata={"hnsw:space": "cosine"}, persist_directory=directory)
+        for start in range(0, len(texts), WRITE_BATCH):
+            end = start + WRITE_BATCH
+            db._collection.upsert(ids=ids[start:end], embeddings=vectors[start:end].tolist(),
+                                  documents=texts[start:end], metadatas=metadatas[start:end])
+    else:
+        from mmap_store import MmapVectorStore
+        store = MmapVectorStore(directory, None, dtype=backend.split(":")[1])
+        for start in range(0, len(texts), WRITE_BATCH):
+            end = start + WRITE_BATCH
+            store.add_embeddings(texts[start:end], vectors[start:end], metadatas[start:end], ids[start:end])
+    return time.perf_counter() - started
+
+
+def measure(backend, directory, query_vectors, truth, k):
+    """
+    Opens a backend in this (fresh) interpreter and measures it.
+    """
+    rss_before, anon_before = memory_mb()
+    started = time.perf_counter()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+    else:
+        from mmap_store import MmapVectorStore
+    import_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    if backend == "chroma":
+        db = Chroma(collection_name="bench", collection_metadata={"hnsw:space": "cosine"}, persist_directory=directory)
+        search = lambda query: db.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k)
+        row_of = lambda doc: int(doc.page_content.rsplit("#", 1)[1])
+        search_batch = lambda queries: db._collection.query(query_embeddings=queries.tolist(), n_results=k)["ids"]
+        batch_rows = lambda result: [[int(doc_id.split("-")[1]) for doc_id in ids] for ids in result]
+    else:
+        store = MmapVectorStore(directory, None)
+        search = lambda query: store.similarity_search_by_vector_with_score(query, k=k)
+        row_of = lambda doc: int(doc.page_content.rsplit("#", 1)[1])
+        search_batch = lambda queries: [store.to_documents(hits) for hits in store.search_vectors(queries, k)]
+        batch_rows = lambda result: [[row_of(doc) for doc, _ in hits] for hits in result]
+    open_ms = (time.perf_counter() - started) * 1000
+    rss_open, anon_open = memory_mb()
+
+    latencies, found = [], []
+    for query in query_vectors:
+        started = time.perf_counter()
+        results = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append([row_of(doc) for doc, _ in results])
+    started = time.perf_counter()
+    batch = batch_rows(search_batch(query_vectors))
+    batch_ms = (time.perf_counter() - started) * 1000 / len(query_vectors)
+    rss_after, anon_after = memory_mb()
+
+    return {
+        "backend": backend,
+        "import_ms": round(import_ms, 1),
+        "open_ms": round(open_ms, 1),
+        f"recall@{k}": round(recall_at(found, truth, k), 4),
+        "latencies_ms": latencies,
+        "batch_ms_per_query": round(batch_ms, 3),
+        "batch_recall": round(recall_at(batch, truth, k), 4),
+        "rss_mb": round(rss_after - rss_before, 1),
+        "anon_mb": round(anon_after - anon_before, 1) if anon_after is not None else None,
+        "rss_open_mb": round(rss_open - rss_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000, help="Corpus size.")
+    parser.add_argument("--dim", type=int, default=1536, help="Vector dimensions (text-embedding-3-small has 1536).")
+    parser.add_argument("--queries", type=int, default=100, help="Queries measured per backend.")
+    parser.add_argument("--k", type=int, default=3, help="Results per query, as the retriever's k.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Measurement run in a fresh interpreter
+        query_vectors = np.load(os.path.join(args.workdir, "queries.npy"))
+        truth = np.load(os.path.join(args.workdir, "truth.npy"))
+        directory = os.path.join(args.workdir, args.child.replace(":", "_"))
+        print(json.dumps(measure(args.child, directory, query_vectors, truth, args.k)))
+        return
+
+    # Not imported by the measurement runs, whose import time and memory it would skew
+    from bench_retrieval import percentile
+
+    with tempfile.TemporaryDirectory() as workdir:
+        vectors, texts, query_vectors, truth = make_corpus(args.chunks, args.dim, args.queries, args.k)
+        np.save(os.path.join(workdir, "queries.npy"), query_vectors)
+        np.save(os.path.join(workdir, "truth.npy"), truth)
+        results = []
+        for backend in args.backends:
+            seconds = build(backend, os.path.join(workdir, backend.replace(":", "_")), vectors, texts)
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", backend, "--workdir", workdir, "--k", str(args.k)],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            latencies = result.pop("latencies_ms")
+            result.update(build_s=seconds, p50_ms=percentile(latencies, 50), p95_ms=percentile(latencies, 95))
+            results.append(result)
+
+    print(f"{args.chunks} chunks x {args.dim} dims, {args.queries} queries, k={args.k}\n")
+    recall = f"recall@{args.k}"
+    print(f"{'backend':<14} {'build s':>8} {'import ms':>9} {'open ms':>8} {recall:>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'batch ms/q':>10} {'batch rec':>9} {'RSS MB':>7} {'anon MB':>8}")
+    for r in results:
+        anon = f"{r['anon_mb']:>8.1f}" if r["anon_mb"] is not None else f"{'n/a':>8}"
+        print(f"{r['backend']:<14} {r['build_s']:>8.2f} {r['import_ms']:>9.1f} {r['open_ms']:>8.1f} {r[recall]:>9.3f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['batch_ms_per_query']:>10.3f} {r['batch_recall']:>9.3f} {r['rss_mb']:>7.1f} {anon}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the lock only excludes the threads of one process
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive lock on a file, held across processes with `flock` and re-entrant
+    within a process.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Lock file, created if missing.
+        """
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                self.file = open(self.path, "a")
+                if fcntl is not None:
+                    fcntl.flock(self.file, fcntl.LOCK_EX)
+            except BaseException:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+class ChunkStore:
+    """
+    Append-only, offset-indexed store of chunk texts and metadata on disk.
+
+    Each chunk is one JSON record [id, text, metadata] in a data file. A memory-mapped
+    index holds the (offset, length) of every row and another one a 64-bit hash of its
+    ID, so opening reads no chunk, a lookup reads only the rows it returns, and processes
+    opening the same directory share the files through the page cache. The heap holds
+    about 17 bytes per chunk: a sorted copy of the ID hashes and a row liveness flag.
+
+    Rows are never rewritten: replacing a chunk appends a new row and a tombstone for
+    the old one. Writing the state file commits an append, so a store kept alongside
+    (e.g. the vectors of `MmapVectorStore`) can write its rows first and rely on the
+    chunk count as its own.
+
+    Writers, in any process, hold the store's file lock and start from the state
+    committed on disk, so concurrent appends never overwrite each other.
+    """
+
+    DATA_FILE = "chunks.bin"
+    INDEX_FILE = "chunks.idx"
+    KEYS_FILE = "chunks.keys"
+    DELETED_FILE = "chunks.deleted"
+    STATE_FILE = "chunks.json"
+    FILES = (DATA_FILE, INDEX_FILE, KEYS_FILE, DELETED_FILE, STATE_FILE)
+    LOCK_FILE = "chunks.lock"
+
+    def __init__(self, directory, lock=None):
+        """
+        Args:
+            directory (str): Directory of the store files, created if missing.
+            lock (FileLock): Write lock shared with a store kept alongside. Defaults to
+                a lock on LOCK_FILE.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = lock or FileLock(self.path(self.LOCK_FILE))
+        self.reload()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def key(doc_id):
+        return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def committed_state(self):
+        """
+        Returns the state last committed to disk, by any process.
+        """
+        if not os.path.exists(self.path(self.STATE_FILE)):
+            return {"count": 0, "data_bytes": 0, "deleted": 0}
+        with open(self.path(self.STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def reload(self):
+        """
+        Reads the committed state back from disk and maps the files.
+        """
+        state = self.committed_state()
+        count = state["count"]
+        index = keys = data = None
+        if count:
+            index = np.memmap(self.path(self.INDEX_FILE), dtype=np.int64, mode="r", shape=(count, 2))
+            keys = np.memmap(self.path(self.KEYS_FILE), dtype=np.uint64, mode="r", shape=(count,))
+        if state["data_bytes"]:
+            data = np.memmap(self.path(self.DATA_FILE), dtype=np.uint8, mode="r", shape=(state["data_bytes"],))
+        alive = np.ones(count, dtype=bool)
+        if state["deleted"]:
+            deleted = np.fromfile(self.path(self.DELETED_FILE), dtype=np.int64, count=state["deleted"])
+            alive[deleted] = False
+        # Maps first, so a concurrent read of an existing row never sees them missing
+        self.index, self.keys, self.data = index, keys, data
+        self.state, self.alive = state, alive
+        self.sort_keys()
+
+    def refresh(self):
+        """
+        Reloads if another process committed since the last load.
+        """
+        if self.committed_state() != self.state:
+            self.reload()
+
+    def sort_keys(self):
+        keys = np.asarray(self.keys) if self.keys is not None else np.zeros(0, dtype=np.uint64)
+        # Stable, so equal hashes keep row order and the last one is the latest
+        self.key_order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.key_order]
+
+    def save_state(self):
+        tmp_path = self.path(self.STATE_FILE) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path(self.STATE_FILE))
+
+    def append_file(self, name, data, committed):
+        """
+        Appends to a store file after dropping bytes past its committed size.
+        """
+        with open(self.path(name), "ab") as f:
+            f.truncate(committed)
+            f.write(data)
+
+    @property
+    def count(self):
+        """
+        Rows in the files, dead ones included.
+        """
+        return self.state["count"]
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def read(self, row):
+        """
+        Returns the (id, text, metadata) of a row.
+        """
+        offset, length = self.index[row]
+        return tuple(json.loads(bytes(self.data[offset:offset + length]).decode("utf-8")))
+
+    def row(self, doc_id):
+        """
+        Returns the live row of an ID, or None.
+        """
+        key = np.uint64(self.key(doc_id))
+        start = np.searchsorted(self.sorted_keys, key, side="left")
+        end = np.searchsorted(self.sorted_keys, key, side="right")
+        for row in reversed(self.key_order[start:end].tolist()):
+            # A hash collision is possible in principle; the record has the real ID
+            if self.alive[row] and self.read(row)[0] == doc_id:
+                return row
+        return None
+
+    def rows(self, ids):
+        """
+        Returns the live rows of the IDs that are in the store, in input order.
+        """
+        rows = (self.row(doc_id) for doc_id in ids)
+        return [row for row in rows if row is not None]
+
+    def live_rows(self):
+        return np.flatnonzero(self.alive)
+
+    def append(self, ids, texts, metadatas):
+        """
+        Appends chunks as new rows and tombstones the previous rows of their IDs.
+
+        Returns:
+            list: Rows replaced by the new chunks.
+        """
+        with self.lock:
+            self.refresh()
+            replaced = self.rows(ids)
+            start, offset = self.count, self.state["data_bytes"]
+            records, index = [], []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                record = json.dumps([doc_id, text, metadata or {}], ensure_ascii=False).encode("utf-8")
+                records.append(record)
+                index.append((offset, len(record)))
+                offset += len(record)
+            keys = np.array([self.key(doc_id) for doc_id in ids], dtype=np.uint64)
+            # The state file is written last: until then the appended bytes are not committed
+            self.append_file(self.DATA_FILE, b"".join(records), self.state["data_bytes"])
+            self.append_file(self.INDEX_FILE, np.array(index, dtype=np.int64).tobytes(), start * 16)
+            self.append_file(self.KEYS_FILE, keys.tobytes(), start * 8)
+            if replaced:
+                self.append_file(self.DELETED_FILE, np.array(replaced, dtype=np.int64).tobytes(), self.state["deleted"] * 8)
+            self.state = {"count": start + len(ids), "data_bytes": offset, "deleted": self.state["deleted"] + len(replaced)}
+            self.save_state()
+            self.reload()
+            return replaced
+
+    def delete(self, rows):
+        """
+        Tombstones rows. The caller holds `lock` since it looked the rows up, as another
+        process may renumber them otherwise.
+        """
+        with self.lock:
+            rows = [row for row in rows if self.alive[row]]
+            if not rows:
+                return
+            self.append_file(self.DELETED_FILE, np.array(rows, dtype=np.int64).tobytes(), self.state["deleted"] * 8)
+            self.state = {**self.state, "deleted": self.state["deleted"] + len(rows)}
+            self.save_state()
+            alive = self.alive.copy()
+            alive[rows] = False
+            self.alive = alive
+
+    def clear(self):
+        """
+        Deletes every file of the store.
+        """
+        with self.lock:
+            for name in self.FILES:
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+            self.reload()
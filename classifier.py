@@ -1,21 +1,132 @@
+import re
+import numpy as np
+
+
 class QuestionCategorizer:
     """Classify the category of the question."""
-    def __init__(self):
+
+    # (category, keywords) in priority order: the first category with a keyword anywhere
+    # in the question wins, whatever the position of the keyword
+    KEYWORDS = [
+        ("Exercise", ["exercise"]),
+        ("Diet", ["diet", "food"]),
+        ("Sleep", ["sleep"]),
+        ("Mental Health", ["mind", "mental health"]),
+        ("Nutrition", ["nutrition"]),
+        ("Drugs", ["medicine", "drugs"]),
+    ]
+    DEFAULT_CATEGORY = "General health"
+
+    # Texts embedded into the category centroids
+    DESCRIPTIONS = {
+        "Exercise": "exercise, workouts, physical activity, fitness, running, strength training, sports",
+        "Diet": "diet, food, meals, eating habits, weight loss, calories, recipes",
+        "General health": "general health, symptoms, diseases, prevention, check-ups, wellbeing",
+        "Sleep": "sleep, insomnia, naps, sleep quality, tiredness, rest, circadian rhythm",
+        "Mental Health": "mental health, mind, stress, anxiety, depression, mood, therapy",
+        "Nutrition": "nutrition, vitamins, minerals, protein, supplements, nutrients",
+        "Drugs": "drugs, medicine, medication, dosage, side effects, prescriptions, painkillers",
+    }
+    MODES = ("keyword", "centroid")
+
+    def __init__(self, mode="keyword", embedding_model=None):
+        """
+        Args:
+            mode (str): 'keyword' for the rule-based matcher, or 'centroid' to classify
+                questions without a keyword by the nearest category centroid.
+            embedding_model: Embedding model for 'centroid' mode. Use the retrieval model, so
+                that the query embedding computed for retrieval can be reused.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown categorizer mode '{mode}'. Expected one of {self.MODES}.")
+        if mode == "centroid" and embedding_model is None:
+            raise ValueError("The 'centroid' mode needs an embedding model.")
         self.categories = ["Exercise", "Diet", "General health", "Sleep","Mental Health","Nutrition","Drugs"]
+        self.mode = mode
+        self.embedding_model = embedding_model
+
+        # One alternation over every keyword, in priority order, so that at any position the
+        # highest-priority keyword starting there is the one matched.
+        self.priority = {}
+        for rank, (category, keywords) in enumerate(self.KEYWORDS):
+            for keyword in keywords:
+                self.priority.setdefault(keyword, (rank, category))
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(self.priority, key=lambda k: self.priority[k][0]))
+        self.pattern = re.compile(alternation)
+
+        self.centroids = None
+        if mode == "centroid":
+            self.centroids = self.normalize(
+                embedding_model.embed_documents([self.DESCRIPTIONS[c] for c in self.categories])
+            )
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def match(self, question: str):
+        """
+        Returns the category of the highest-priority keyword in the question, or None.
+        """
+        text = question.lower()
+        best = None
+        match = self.pattern.search(text)
+        while match:
+            rank, category = self.priority[match.group()]
+            if rank == 0:
+                return category
+            if best is None or rank < best[0]:
+                best = (rank, category)
+            # Resume right after the match start, so overlapping keywords are not skipped
+            match = self.pattern.search(text, match.start() + 1)
+        return best[1] if best else None
+
+    def nearest(self, embeddings):
+        """
+        Returns the category of the nearest centroid for each embedding.
+        """
+        similarities = self.normalize(embeddings) @ self.centroids.T
+        return [self.categories[i] for i in similarities.argmax(axis=1)]
+
+    def classify(self, question: str, embedding=None) -> str:
+        """
+        Args:
+            question (str): The question.
+            embedding (list): Query embedding of the question, used in 'centroid' mode when
+                no keyword matches. Embedded with `embedding_model` if not given.
+        """
+        category = self.match(question)
+        if category is not None:
+            return category
+        if self.mode == "keyword":
+            return self.DEFAULT_CATEGORY
+        if embedding is None:
+            embedding = self.embedding_model.embed_query(question)
+        return self.nearest([embedding])[0]
+
+    def classify_batch(self, questions, embeddings=None):
+        """
+        Classifies many questions, e.g. to backfill or re-categorize history.
+
+        Args:
+            questions (list): The questions.
+            embeddings (list): Optional query embeddings, one per question ('centroid' mode).
+                Questions without a keyword are otherwise embedded in one batch call.
 
-    def classify(self, question: str) -> str:
-       #Rule-based categorization (will be replaced with a ML model)
-        if "exercise" in question.lower():
-            return "Exercise"
-        elif "diet" in question.lower() or "food" in question.lower():
-            return "Diet"
-        elif "sleep" in question.lower():
-            return "Sleep"
-        elif "mind" in question.lower() or "mental health" in question.lower():
-            return "Mental Health"
-        elif "nutrition" in question.lower():
-            return "Nutrition"
-        elif "medicine" in question.lower() or "drugs" in question.lower():
-            return "Drugs"
+        Returns:
+            list: One category per question.
+        """
+        categories = [self.match(question) for question in questions]
+        unmatched = [i for i, category in enumerate(categories) if category is None]
+        if self.mode == "keyword" or not unmatched:
+            return [category or self.DEFAULT_CATEGORY for category in categories]
+        if embeddings is None:
+            vectors = self.embedding_model.embed_documents([questions[i] for i in unmatched])
         else:
-            return "General health"
+            vectors = [embeddings[i] for i in unmatched]
+        for i, category in zip(unmatched, self.nearest(vectors)):
+            categories[i] = category
+        return categories
@@ -0,0 +1,162 @@
+import re
+from functools import lru_cache
+from lexical_index import tokenize
+from telemetry import logger
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """
+    Returns the tiktoken encoding of a model, loaded once per process, or None when tiktoken
+    or its vocabulary file (downloaded on first use) is unavailable.
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable ({type(e).__name__}), estimating 4 characters per token.")
+        return None
+
+
+class ContextBuilder:
+    """
+    Assembles the answer context from retrieved documents within a token budget.
+
+    Documents are split into passages, near-duplicate passages are dropped, and the
+    remaining ones are ranked by how many question terms they contain and added until
+    the budget is spent, the last one trimmed to fit. Each passage is labelled with its
+    source, so answers stay attributable.
+    """
+
+    def __init__(self, token_budget=1500, passage_tokens=300, duplicate_threshold=0.8,
+                 min_passage_tokens=40, model_name="gpt-3.5-turbo"):
+        """
+        Args:
+            token_budget (int): Maximum context tokens. None keeps every distinct passage.
+            passage_tokens (int): Paragraphs are merged into passages of up to this many tokens.
+            duplicate_threshold (float): Share of a passage's word shingles found in a better-ranked
+                passage above which it is dropped as a near-duplicate.
+            min_passage_tokens (int): Passages are not trimmed below this many tokens.
+            model_name (str): Model whose tokenizer counts the tokens.
+        """
+        self.token_budget = token_budget
+        self.passage_tokens = passage_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_passage_tokens = min_passage_tokens
+        self.model_name = model_name
+
+    @property
+    def encoding(self):
+        # Loaded on the first answer rather than at startup
+        return get_encoding(self.model_name)
+
+    def count_tokens(self, text):
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, tokens):
+        """
+        Returns the first `tokens` tokens of text.
+        """
+        if self.encoding is None:
+            return text[:tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+
+    @staticmethod
+    def source(doc):
+        """
+        Returns a short label of where a document comes from.
+        """
+        metadata = doc.metadata or {}
+        if metadata.get("origin") == "web" or metadata.get("file_name") == "web":
+            return metadata.get("source") or "web search"
+        if "file_name" in metadata:
+            page = metadata.get("page")
+            return f"{metadata['file_name']}, page {page}" if page is not None else metadata["file_name"]
+        return metadata.get("source") or "retrieved document"
+
+    def passages(self, documents):
+        """
+        Splits documents into (source, text, tokens) passages of up to `passage_tokens`, in document order.
+        """
+        passages = []
+        for doc in documents:
+            source = self.source(doc)
+            text, tokens = [], 0
+            for paragraph in re.split(r"\n\s*\n", doc.page_content):
+                paragraph = paragraph.strip()
+                if not paragraph:
+                    continue
+                size = self.count_tokens(paragraph)
+                if text and tokens + size > self.passage_tokens:
+                    passages.append((source, "\n".join(text), tokens))
+                    text, tokens = [], 0
+                text.append(paragraph)
+                tokens += size
+            if text:
+                passages.append((source, "\n".join(text), tokens))
+        return passages
+
+    @staticmethod
+    def shingles(words, size=3):
+        if len(words) <= size:
+            return {tuple(words)}
+        return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    def build(self, question, documents):
+        """
+        Returns the context text and a report of what was kept.
+
+        A passage is a near-duplicate when most of its word shingles already appear in a
+        better-ranked passage, which also catches overlapping chunks and web results quoting
+        an indexed page.
+
+        Returns:
+            tuple: (context, report) where the report compares the tokens of the documents
+                joined as they are (`input_tokens`) with those of the context (`context_tokens`),
+                and counts the passages dropped as duplicates or over budget.
+        """
+        passages = self.passages(documents)
+        words = [tokenize(text) for _, text, _ in passages]
+        terms = set(tokenize(question))
+
+        def relevance(index):
+            overlap = len(terms.intersection(words[index])) / len(terms) if terms else 0.0
+            # Ties keep the retrieval order
+            return -overlap, index
+
+        kept, kept_shingles, duplicates, over_budget = [], [], 0, 0
+        used = 0
+        for index in sorted(range(len(passages)), key=relevance):
+            source, text, tokens = passages[index]
+            shingles = self.shingles(words[index])
+            if any(len(shingles & other) >= self.duplicate_threshold * len(shingles) for other in kept_shingles):
+                duplicates += 1
+                continue
+            if self.token_budget is not None and used + tokens > self.token_budget:
+                remaining = self.token_budget - used
+                if remaining < self.min_passage_tokens:
+                    over_budget += 1
+                    continue
+                text = self.truncate(text, remaining) + " ..."
+                tokens = remaining
+            kept.append((source, text))
+            kept_shingles.append(shingles)
+            used += tokens
+
+        context = "\n\n".join(f"[{i}] (source: {source})\n{text}" for i, (source, text) in enumerate(kept, start=1))
+        input_tokens = self.count_tokens("\n\n".join(doc.page_content for doc in documents))
+        context_tokens = self.count_tokens(context)
+        return context, {
+            "passages": len(passages),
+            "kept": len(kept),
+            "duplicates": duplicates,
+            "over_budget": over_budget,
+            "input_tokens": input_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": input_tokens - context_tokens,
+        }
@@ -1,85 +1,470 @@
 import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+import numpy as np
 from PyPDF2 import PdfReader
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
+from embedding_cache import CachedEmbeddings
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from mmap_store import MmapVectorStore
+from telemetry import logger
+
+
+def extract_pdf_pages(pdf_path):
+    """
+    Extracts the text of every page of a PDF. Runs inside worker processes.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+
+    Returns:
+        list: (page_number, text) tuples with 1-based page numbers, skipping empty pages.
+    """
+    pages = []
+    for number, page in enumerate(PdfReader(pdf_path).pages, start=1):
+        text = page.extract_text() or ""
+        if text.strip():
+            pages.append((number, text))
+    return pages
+
 
 class DataLoader:
-    def __init__(self, pdf_directory="docs", persist_directory="./wikipedia_db", chunk_size=2000, chunk_overlap=300):
+    COLLECTION_NAME = 'rag_wikipedia_db'
+    EMBEDDING_MODEL_NAME = 'text-embedding-3-small'
+    MANIFEST_FILE = 'manifest.json'
+    EMBEDDING_CACHE_FILE = 'embedding_cache.db'
+    LEXICAL_INDEX_FILE = 'bm25_index.json'
+    MMAP_DIRECTORY = 'mmap_index'
+    RETRIEVAL_MODES = ("vector", "hybrid")
+    VECTOR_BACKENDS = ("chroma", "mmap")
+
+    def __init__(self, pdf_directory="docs", persist_directory="./wikipedia_db", chunk_size=2000, chunk_overlap=300, incremental=True,
+                 max_workers=None, window_files=8, embed_batch_size=256, embedding_model=None,
+                 embedding_cache=True, embedding_cache_size=200_000, retrieval_mode="vector",
+                 candidate_k=10, rrf_k=60, latency_budget_ms=500, vector_backend="chroma", vector_dtype="float32"):
         """
         Initializes the DataLoader class with required parameters.
         
         Args:
             pdf_directory (str): Directory containing PDF files.
-            embedding_model: Embedding model for Chroma.
+            embedding_model: Embedding model for the vector DB. Defaults to OpenAI's text-embedding-3-small.
             persist_directory (str): Directory for storing the vector DB.
             chunk_size (int): Maximum size of text chunks.
             chunk_overlap (int): Overlap size between chunks.
+            incremental (bool): Sync the persisted index against a manifest of file and
+                chunk hashes instead of re-embedding the whole corpus.
+            max_workers (int): Processes used for PDF text extraction. Defaults to the CPU count.
+            window_files (int): Maximum number of PDF files extracted ahead of the consumer.
+                It counts files, not pages or bytes: each file is held whole, so memory
+                grows with the size of the largest files in the window.
+            embed_batch_size (int): Number of chunks embedded and written per batch.
+            embedding_cache (bool): Serve repeated chunk and question embeddings from an
+                on-disk cache in the persist directory.
+            embedding_cache_size (int): Maximum number of cached vectors.
+            retrieval_mode (str): 'vector' for similarity search only, 'hybrid' to fuse it
+                with BM25 lexical search by reciprocal rank fusion.
+            candidate_k (int): Candidates taken from each retriever before fusion.
+            rrf_k (int): Rank offset of reciprocal rank fusion.
+            latency_budget_ms (float): Time a hybrid search may take; lexical results that
+                are not ready once it is spent are left out.
+            vector_backend (str): 'chroma', or 'mmap' for exact search over memory-mapped
+                vectors (see `MmapVectorStore`), which opens in milliseconds and is shared
+                between processes through the page cache.
+            vector_dtype (str): Storage type of the 'mmap' backend: 'float32', 'float16' or 'int8'.
+                The smaller types cut memory and disk by 2x and 4x, but are converted to float32
+                block by block on every search; see `bench_vector_store.py`.
         """
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}'. Expected one of {self.RETRIEVAL_MODES}.")
+        if vector_backend not in self.VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{vector_backend}'. Expected one of {self.VECTOR_BACKENDS}.")
         self.pdf_directory = pdf_directory
-        self.embedding_model = OpenAIEmbeddings(model='text-embedding-3-small')
+        if embedding_model is None:
+            embedding_model = OpenAIEmbeddings(model=self.EMBEDDING_MODEL_NAME)
+        self.embedding_model_name = getattr(embedding_model, "model", type(embedding_model).__name__)
+        self.embedding_dimensions = getattr(embedding_model, "dimensions", None)
+        if embedding_cache:
+            embedding_model = CachedEmbeddings(
+                embedding_model,
+                os.path.join(persist_directory, self.EMBEDDING_CACHE_FILE),
+                model_name=self.embedding_model_name,
+                max_entries=embedding_cache_size,
+            )
+        self.embedding_model = embedding_model
         self.persist_directory = persist_directory
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.window_files = max(1, window_files)
+        self.embed_batch_size = embed_batch_size
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+        self.retrieval_mode = retrieval_mode
+        self.candidate_k = candidate_k
+        self.rrf_k = rrf_k
+        self.latency_budget_ms = latency_budget_ms
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
+        self.lexical_index_path = os.path.join(persist_directory, self.LEXICAL_INDEX_FILE)
+        self.lexical_index = None
+        self.lexical_index_lock = threading.Lock()
+        self.search_executor = None
+        self.ingest_stats = {}
+        self.manifest_path = os.path.join(persist_directory, self.MANIFEST_FILE)
+        self.manifest = {}
         self.docs = []
         self.chunked_docs = []
-        self.chroma_db = None
+        self.vector_db = None
         self.retriever = None
 
-        self.load_pdfs()
-        self.chunk_documents()
-        self.setup_vector_db()
+        if incremental:
+            self.sync_vector_db()
+        else:
+            self.load_pdfs()
+            self.chunk_documents()
+            self.setup_vector_db()
+            # The vector DB holds the chunks now; keeping the corpus would cost every process its size
+            self.docs, self.chunked_docs = [], []
+        if retrieval_mode == "hybrid":
+            self.setup_lexical_index()
         self.setup_retriever()
 
 
-    def load_pdfs(self):
+    def list_pdfs(self):
+        """
+        Returns the sorted names of the PDF files in the PDF directory.
+        """
+        return sorted(f for f in os.listdir(self.pdf_directory) if f.endswith(".pdf"))
+
+    def iter_pages(self, filenames):
+        """
+        Extracts PDF pages across a process pool and yields them file by file.
+
+        At most `window_files` files are extracted ahead of the consumer, so the page
+        text held in memory depends on the size of those files rather than the corpus.
+
+        Args:
+            filenames (list): Names of the PDF files to extract.
+
+        Yields:
+            tuple: (filename, list of page Documents with `file_name` and `page` metadata).
+        """
+        def to_docs(filename, pages):
+            return [
+                Document(page_content=text, metadata={"file_name": filename, "page": number})
+                for number, text in pages
+            ]
+
+        paths = [(f, os.path.join(self.pdf_directory, f)) for f in filenames if f.endswith(".pdf")]
+        if self.max_workers == 1 or len(paths) <= 1:
+            for filename, path in paths:
+                yield filename, to_docs(filename, extract_pdf_pages(path))
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(paths))) as pool:
+            pending = deque()
+            remaining = iter(paths)
+            for filename, path in remaining:
+                pending.append((filename, pool.submit(extract_pdf_pages, path)))
+                if len(pending) >= self.window_files:
+                    break
+            while pending:
+                filename, future = pending.popleft()
+                pages = future.result()
+                next_path = next(remaining, None)
+                if next_path:
+                    pending.append((next_path[0], pool.submit(extract_pdf_pages, next_path[1])))
+                yield filename, to_docs(filename, pages)
+
+    def iter_chunks(self, filenames):
+        """
+        Streams page text straight into the splitter.
+
+        Args:
+            filenames (list): Names of the PDF files to chunk.
+
+        Yields:
+            tuple: (filename, list of chunk Documents carrying their page number).
+        """
+        for filename, pages in self.iter_pages(filenames):
+            self.ingest_stats["files"] = self.ingest_stats.get("files", 0) + 1
+            self.ingest_stats["pages"] = self.ingest_stats.get("pages", 0) + len(pages)
+            chunks = self.splitter.split_documents(pages)
+            self.ingest_stats["chunks"] = self.ingest_stats.get("chunks", 0) + len(chunks)
+            yield filename, chunks
+
+    def report_throughput(self, started):
+        """
+        Records and prints extraction and chunking throughput since `started`.
+        """
+        seconds = max(time.perf_counter() - started, 1e-9)
+        self.ingest_stats["seconds"] = round(seconds, 3)
+        self.ingest_stats["pages_per_s"] = round(self.ingest_stats.get("pages", 0) / seconds, 2)
+        self.ingest_stats["chunks_per_s"] = round(self.ingest_stats.get("chunks", 0) / seconds, 2)
+        logger.info(f"Ingested {self.ingest_stats.get('files', 0)} file(s), "
+                    f"{self.ingest_stats.get('pages', 0)} page(s), {self.ingest_stats.get('chunks', 0)} chunk(s) "
+                    f"in {seconds:.2f}s ({self.ingest_stats['pages_per_s']} pages/s, "
+                    f"{self.ingest_stats['chunks_per_s']} chunks/s).")
+
+    def load_pdfs(self, filenames=None):
+        """
+        Loads PDFs from the specified directory and converts them into one Document per page.
+
+        Args:
+            filenames (list): Names of the PDF files to load. Defaults to every PDF in the directory.
+        """
+        if filenames is None:
+            filenames = self.list_pdfs()
+        for _, pages in self.iter_pages(filenames):
+            self.docs.extend(pages)
+        logger.info(f"Loaded {len(self.docs)} page(s) from {self.pdf_directory}.")
+
+    @staticmethod
+    def hash_file(path):
+        """
+        Returns the SHA-256 hex digest of a file's contents.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunk_id(doc):
         """
-        Loads PDFs from the specified directory and converts them into Document objects.
+        Returns a content-addressed ID for a chunk, stable across restarts.
         """
-        for filename in os.listdir(self.pdf_directory):
-            if filename.endswith(".pdf"):  # Process only PDF files
-                pdf_path = os.path.join(self.pdf_directory, filename)
-                pdf_reader = PdfReader(pdf_path)
+        key = f"{doc.metadata.get('file_name', '')}\0{doc.page_content}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-                # Combine text from all pages
-                full_text = "".join([page.extract_text() for page in pdf_reader.pages])
+    def chunk_ids(self, docs):
+        """
+        Computes chunk IDs for the given documents, dropping repeated chunks.
 
-                # Create a Document object for the PDF
-                self.docs.append(
-                    Document(
-                        page_content=full_text,
-                        metadata={"file_name": filename} 
-                    )
-                )
-        print(f"[INFO] Loaded {len(self.docs)} PDF(s) from {self.pdf_directory}.")
+        Returns:
+            tuple: (unique documents, their IDs) in input order.
+        """
+        unique_docs, ids, seen = [], [], set()
+        for doc in docs:
+            doc_id = self.chunk_id(doc)
+            if doc_id not in seen:
+                seen.add(doc_id)
+                unique_docs.append(doc)
+                ids.append(doc_id)
+        return unique_docs, ids
 
     def chunk_documents(self):
         """
         Splits the loaded documents into smaller chunks using RecursiveCharacterTextSplitter.
         """
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size, 
-            chunk_overlap=self.chunk_overlap
-        )
-        self.chunked_docs = splitter.split_documents(self.docs)
-        print(f"[INFO] Chunked documents into {len(self.chunked_docs)} smaller pieces.")
+        self.chunked_docs = self.splitter.split_documents(self.docs)
+        logger.info(f"Chunked documents into {len(self.chunked_docs)} smaller pieces.")
 
     def setup_vector_db(self):
         """
-        Sets up the Chroma vector database using the chunked documents.
+        Sets up the vector database using the chunked documents.
         """
         if not self.chunked_docs:
             raise ValueError("No chunked documents found. Please run `chunk_documents()` first.")
         
-        self.chroma_db = Chroma.from_documents(
-            documents=self.chunked_docs,
-            collection_name='rag_wikipedia_db',
+        docs, ids = self.chunk_ids(self.chunked_docs)
+        if self.vector_backend == "mmap":
+            self.vector_db = self.open_vector_db()
+            self.vector_db.add_documents(docs, ids=ids)
+            logger.info("Vector database setup completed and persisted.")
+            return
+        from langchain_chroma import Chroma
+        self.vector_db = Chroma.from_documents(
+            documents=docs,
+            ids=ids,
+            collection_name=self.COLLECTION_NAME,
             embedding=self.embedding_model,
             collection_metadata={"hnsw:space": "cosine"},
             persist_directory=self.persist_directory
         )
-        print("[INFO] Vector database setup completed and persisted.")
+        logger.info("Vector database setup completed and persisted.")
+
+    def open_vector_db(self):
+        """
+        Opens (or creates) the persisted vector store without embedding anything.
+        """
+        if self.vector_backend == "mmap":
+            return MmapVectorStore(
+                os.path.join(self.persist_directory, self.MMAP_DIRECTORY),
+                self.embedding_model,
+                dtype=self.vector_dtype,
+            )
+        # Imported on use: the mmap backend does not need chromadb
+        from langchain_chroma import Chroma
+        return Chroma(
+            collection_name=self.COLLECTION_NAME,
+            embedding_function=self.embedding_model,
+            collection_metadata={"hnsw:space": "cosine"},
+            persist_directory=self.persist_directory
+        )
+
+    def index_settings(self):
+        """
+        Returns the settings that determine chunk boundaries and vectors.
+        A change in any of them invalidates every stored chunk.
+        """
+        settings = {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "chunk_unit": "page",
+            "embedding_model": self.embedding_model_name,
+        }
+        if self.embedding_dimensions:
+            # Shortened vectors of the same model cannot be mixed with the stored ones
+            settings["embedding_dimensions"] = self.embedding_dimensions
+        if self.vector_backend != "chroma":
+            # Each backend keeps its own vectors; switching rebuilds from the embedding cache
+            settings["vector_backend"] = f"{self.vector_backend}:{self.vector_dtype}"
+        return settings
+
+    def vector_count(self):
+        """
+        Returns the number of vectors in the vector store.
+        """
+        if self.vector_backend == "mmap":
+            return len(self.vector_db)
+        return self.vector_db._collection.count()
+
+    def load_manifest(self):
+        """
+        Loads the ingestion manifest, or returns an empty one if none is persisted.
+        """
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        """
+        Atomically persists the ingestion manifest next to the vector DB.
+        """
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def index_version(self):
+        """
+        Returns an identifier of the indexed content; it changes whenever chunks are added or removed.
+        """
+        return self.manifest.get("index_version", "")
+
+    def update_index_version(self):
+        """
+        Recomputes the index version from the chunk IDs tracked in the manifest.
+        """
+        digest = hashlib.sha256(json.dumps(self.index_settings(), sort_keys=True).encode("utf-8"))
+        for chunk_id in sorted(i for f in self.manifest["files"].values() for i in f["chunk_ids"]):
+            digest.update(chunk_id.encode("ascii"))
+        self.manifest["index_version"] = digest.hexdigest()[:16]
+
+    def sync_vector_db(self):
+        """
+        Brings the persisted vector store in line with the PDF directory.
+
+        Files are tracked by content hash and chunks by content-addressed IDs, so only
+        new or changed chunks are embedded and vectors of removed or changed files are
+        deleted. When nothing changed the existing collection is opened as is.
+        """
+        manifest = self.load_manifest()
+        self.vector_db = self.open_vector_db()
+
+        if manifest.get("settings") != self.index_settings():
+            if self.vector_count():
+                # Vectors without a matching manifest cannot be reconciled; start over.
+                logger.info("Index settings changed or manifest missing. Rebuilding the vector database.")
+                self.vector_db.delete_collection()
+                self.vector_db = self.open_vector_db()
+            manifest = {"settings": self.index_settings(), "files": {}}
+        self.manifest = manifest
+
+        tracked = manifest["files"]
+        current = {f: self.hash_file(os.path.join(self.pdf_directory, f)) for f in self.list_pdfs()}
+        removed = [f for f in tracked if f not in current]
+        to_load = [f for f, sha in current.items() if tracked.get(f, {}).get("sha256") != sha]
+
+        if not removed and not to_load:
+            if "index_version" not in manifest:
+                self.update_index_version()
+                self.save_manifest()
+            logger.info("Vector database is up to date. Opened existing collection.")
+            return
+
+        stale_ids = [i for f in removed for i in tracked.pop(f)["chunk_ids"]]
+        embedded = 0
+        batch_docs, batch_ids = [], []
+        started = time.perf_counter()
+        self.ingest_stats = {}
+        for filename, chunks in self.iter_chunks(to_load):
+            docs, ids = self.chunk_ids(chunks)
+            old_ids = set(tracked.get(filename, {}).get("chunk_ids", []))
+            stale_ids.extend(old_ids.difference(ids))
+            for doc, doc_id in zip(docs, ids):
+                if doc_id not in old_ids:
+                    batch_docs.append(doc)
+                    batch_ids.append(doc_id)
+            tracked[filename] = {"sha256": current[filename], "chunk_ids": ids}
+            if len(batch_docs) >= self.embed_batch_size:
+                self.vector_db.add_documents(batch_docs, ids=batch_ids)
+                embedded += len(batch_ids)
+                batch_docs, batch_ids = [], []
+        if batch_docs:
+            self.vector_db.add_documents(batch_docs, ids=batch_ids)
+            embedded += len(batch_ids)
+        if to_load:
+            self.report_throughput(started)
+
+        if stale_ids:
+            self.vector_db.delete(ids=stale_ids)
+        self.update_index_version()
+        self.save_manifest()
+        logger.info(f"Vector database synced: {embedded} chunk(s) embedded, "
+                    f"{len(stale_ids)} removed, {len(removed)} file(s) dropped.")
+
+    def setup_lexical_index(self):
+        """
+        Loads the persisted BM25 index and reconciles it with the vector DB. Runs at startup
+        in hybrid mode and on the first hybrid search otherwise, so processes retrieving by
+        vector only never hold the index.
+
+        Chunks missing from the index are read back from the vector DB, which needs no
+        embedding calls, and chunks no longer in the vector DB are dropped.
+        """
+        index = BM25Index.load(self.lexical_index_path)
+        expected = set(self.vector_db.get(include=[])["ids"])
+        indexed = index.ids()
+        missing = list(expected - indexed)
+        for doc_id in indexed - expected:
+            index.remove(doc_id)
+        for start in range(0, len(missing), self.embed_batch_size):
+            batch = self.vector_db.get(ids=missing[start:start + self.embed_batch_size], include=["documents"])
+            for doc_id, text in zip(batch["ids"], batch["documents"]):
+                index.add(doc_id, text)
+        if missing or indexed - expected:
+            index.save(self.lexical_index_path)
+            logger.info(f"Lexical index updated: {len(missing)} chunk(s) added, {len(indexed - expected)} removed.")
+        else:
+            logger.info("Lexical index is up to date.")
+        # Published once reconciled, as hybrid searches load it lazily from several threads
+        self.lexical_index = index
 
     def setup_retriever(self, k=3, score_threshold=0.3):
         """
@@ -89,15 +474,142 @@ class DataLoader:
             k (int): Number of top results to return.
             score_threshold (float): Threshold for similarity score.
         """
-        if not self.chroma_db:
-            raise ValueError("Chroma DB not initialized. Please run `setup_vector_db()` first.")
+        if self.vector_db is None:
+            raise ValueError("Vector DB not initialized. Please run `setup_vector_db()` first.")
         
-        self.retriever = self.chroma_db.as_retriever(
+        self.search_kwargs = {"k": k, "score_threshold": score_threshold}
+        self.retriever = self.vector_db.as_retriever(
             search_type="similarity_score_threshold",
-            search_kwargs={"k": k, "score_threshold": score_threshold}
+            search_kwargs=self.search_kwargs
         )
-        print("[INFO] Retriever setup completed.")
-        
+        logger.info("Retriever setup completed.")
+
+    def index_web_results(self, results, query):
+        """
+        Chunks web search results and indexes the chunks that are not in the vector DB yet,
+        so that later questions can be answered from local retrieval.
+
+        Chunks are deduplicated by content across URLs and tagged with their source URL
+        and fetch time. They are tracked apart from the PDF chunks and do not change the
+        index version.
+
+        Args:
+            results (list): Search results with 'url' and 'content' keys.
+            query (str): The query the results were fetched for.
+
+        Returns:
+            int: Number of chunks added.
+        """
+        fetched_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        pages = [
+            Document(
+                page_content=result["content"],
+                metadata={"file_name": "web", "source": result.get("url", ""), "origin": "web",
+                          "fetched_at": fetched_at, "query": query}
+            )
+            for result in results if result.get("content")
+        ]
+        docs, ids = self.chunk_ids(self.splitter.split_documents(pages))
+        if not ids:
+            return 0
+        existing = set(self.vector_db.get(ids=ids, include=[])["ids"])
+        new = [(doc, doc_id) for doc, doc_id in zip(docs, ids) if doc_id not in existing]
+        if new:
+            self.vector_db.add_documents([doc for doc, _ in new], ids=[doc_id for _, doc_id in new])
+            self.manifest.setdefault("web_chunk_ids", []).extend(doc_id for _, doc_id in new)
+            self.save_manifest()
+            if self.lexical_index is not None:
+                # Otherwise the index picks the chunks up from the vector DB when it is loaded
+                for doc, doc_id in new:
+                    self.lexical_index.add(doc_id, doc.page_content)
+                self.lexical_index.save(self.lexical_index_path)
+        logger.info(f"Indexed {len(new)} new web chunk(s) for query: {query}")
+        return len(new)
+
+    def search(self, question):
+        """
+        Runs the retriever's search but keeps the relevance scores.
+
+        Args:
+            question (str): The query text.
+
+        Returns:
+            list: (Document, relevance score) tuples, most relevant first.
+        """
+        if not self.retriever:
+            raise ValueError("Retriever not initialized. Please run `setup_retriever()` first.")
+        if self.retrieval_mode == "hybrid":
+            return self.hybrid_search(question)
+        return self.vector_db.similarity_search_with_relevance_scores(question, **self.search_kwargs)
+
+    def search_batch(self, questions):
+        """
+        Runs `search` for several questions. The mmap backend embeds them in one call
+        and scores them in one pass over the vectors.
+
+        Returns:
+            list: For each question, (Document, relevance score) tuples, most relevant first.
+        """
+        if self.vector_backend == "mmap" and self.retrieval_mode == "vector":
+            return self.vector_db.similarity_search_batch(questions, **self.search_kwargs)
+        return [self.search(question) for question in questions]
+
+    async def asearch(self, question):
+        """
+        Async version of `search`.
+        """
+        if not self.retriever:
+            raise ValueError("Retriever not initialized. Please run `setup_retriever()` first.")
+        if self.retrieval_mode == "hybrid":
+            return await asyncio.to_thread(self.hybrid_search, question)
+        return await self.vector_db.asimilarity_search_with_relevance_scores(question, **self.search_kwargs)
+
+    def hybrid_search(self, question):
+        """
+        Fuses vector and BM25 results with reciprocal rank fusion.
+
+        Lexical search runs alongside the vector search. Lexical-only hits bypass the
+        score threshold, which is how exact drug names, dosages and acronyms missed by
+        the embedding are recovered. They still get their cosine relevance score, and are
+        marked with `retrieval: 'lexical'` in their metadata so that score-based triage
+        does not reject them for it.
+
+        Returns:
+            list: (Document, relevance score) tuples in fused order.
+        """
+        started = time.perf_counter()
+        if self.search_executor is None:
+            self.search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lexical-search")
+        if self.lexical_index is None:
+            with self.lexical_index_lock:
+                if self.lexical_index is None:
+                    self.setup_lexical_index()
+        lexical_future = self.search_executor.submit(self.lexical_index.search, question, self.candidate_k)
+        vector_results = self.vector_db.similarity_search_with_relevance_scores(
+            question, k=self.candidate_k, score_threshold=self.search_kwargs["score_threshold"]
+        )
+        remaining = self.latency_budget_ms / 1000 - (time.perf_counter() - started)
+        try:
+            lexical_results = lexical_future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            logger.info("Lexical search exceeded the latency budget. Using vector results only.")
+            lexical_results = []
+
+        by_id = {self.chunk_id(doc): (doc, score) for doc, score in vector_results}
+        fused = reciprocal_rank_fusion(
+            [list(by_id), [doc_id for doc_id, _ in lexical_results]], k=self.rrf_k
+        )[:self.search_kwargs["k"]]
+
+        lexical_only = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if lexical_only:
+            query = np.asarray(self.embedding_model.embed_query(question), dtype=np.float32)
+            found = self.vector_db.get(ids=lexical_only, include=["documents", "metadatas", "embeddings"])
+            for doc_id, text, metadata, vector in zip(found["ids"], found["documents"], found["metadatas"], found["embeddings"]):
+                vector = np.asarray(vector, dtype=np.float32)
+                score = float(query @ vector / (np.linalg.norm(query) * np.linalg.norm(vector) or 1.0))
+                by_id[doc_id] = (Document(page_content=text, metadata={**(metadata or {}), "retrieval": "lexical"}), score)
+        return [by_id[doc_id] for doc_id, _ in fused if doc_id in by_id]
+
 
     def get_retriever(self):
         """
@@ -106,7 +618,7 @@ class DataLoader:
         
         if not self.retriever:
             raise ValueError("Retriever not initialized. Please run `setup_retriever()` first.")
-        print("[INFO] Retriever present.")
+        logger.info("Retriever present.")
         return self.retriever
 
 if __name__ == "__main__":
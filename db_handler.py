@@ -1,10 +1,44 @@
+import time
+import queue
+import atexit
 import sqlite3
+import argparse
+import threading
 import pandas as pd
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta
+from telemetry import logger
+
+# Tells the writer thread to flush and exit
+_STOP = object()
+
 
 class CategoryDB:
-    def __init__(self, db_path="categories.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+    # Seconds a connection waits on another writer's lock before "database is locked"
+    CONNECT_TIMEOUT = 30.0
+    # Attempts at a batch still locked out after the connect timeout, with doubling backoff
+    WRITE_ATTEMPTS = 5
+    RETRY_BACKOFF = 0.5
+
+    def __init__(self, db_path="categories.db", queue_size=10000, batch_size=200, flush_interval=0.5):
+        """
+        Questions are logged through a bounded queue drained by a background writer,
+        which commits them in batched transactions. Requests never wait on disk.
+        The writer also maintains rollup tables of counts per category, month and day,
+        so the dashboard never scans the raw table.
+
+        Args:
+            db_path (str): SQLite database file.
+            queue_size (int): Maximum number of questions waiting to be written.
+            batch_size (int): Maximum number of questions written per transaction.
+            flush_interval (float): Seconds the writer waits to fill a batch.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(db_path, timeout=self.CONNECT_TIMEOUT, check_same_thread=False)
+        # WAL lets the dashboard read while the writer commits
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self.conn.execute(
             """
             CREATE TABLE IF NOT EXISTS categories (
@@ -15,37 +49,297 @@ class CategoryDB:
             )
             """
         )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(categories)")]
+        if "day" not in columns:
+            self.conn.execute("ALTER TABLE categories ADD COLUMN day TEXT")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS category_counts (
+                category TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS monthly_counts (
+                year_month TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS daily_category_counts (
+                day TEXT,
+                category TEXT,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, category)
+            );
+            """
+        )
+        self.conn.commit()
+        self.read_lock = threading.Lock()
+        rollup_rows = self.conn.execute("SELECT COUNT(*) FROM category_counts").fetchone()[0]
+        raw_rows = self.conn.execute("SELECT EXISTS (SELECT 1 FROM categories)").fetchone()[0]
+        if raw_rows and not rollup_rows:
+            self.rebuild_rollups()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, name="category-db-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
 
     def save_category(self, question, category):
+        # Get the current date in the format YYYY-MM
+        now = datetime.now()
+        current_date = now.strftime("%Y-%m")
         try:
-            # Get the current date in the format YYYY-MM
-            current_date = datetime.now().strftime("%Y-%m")
-            
+            self.queue.put_nowait((question, category, current_date, now.strftime("%Y-%m-%d")))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.error(f"Database error: write queue is full, {self.dropped} question(s) not logged.")
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.CONNECT_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            batch = []
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            self._write_batch(conn, batch)
+            for _ in range(len(batch) + stopping):
+                self.queue.task_done()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        """
+        Commits a batch, retrying with backoff while the database is locked or busy. A
+        batch is only dropped, and counted as such, once every attempt failed.
+        """
+        if not batch:
+            return
+        for attempt in range(self.WRITE_ATTEMPTS):
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO categories (question, category, year_month, day) VALUES (?, ?, ?, ?)",
+                        batch
+                    )
+                    self._update_rollups(conn, batch)
+                self.written += len(batch)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt + 1 == self.WRITE_ATTEMPTS:
+                    error = e
+                    break
+                delay = self.RETRY_BACKOFF * 2 ** attempt
+                logger.warning(f"Database error: {e}, retrying batch of {len(batch)} in {delay:.1f}s.")
+                time.sleep(delay)
+            except sqlite3.Error as e:
+                error = e
+                break
+        self.dropped += len(batch)
+        logger.error(f"Database error: {error}, {len(batch)} question(s) not logged.")
+
+    @staticmethod
+    def _update_rollups(conn, batch):
+        """
+        Adds a batch of logged questions to the rollup tables, in the caller's transaction.
+        """
+        categories = Counter(category for _, category, _, _ in batch)
+        months = Counter(year_month for _, _, year_month, _ in batch)
+        days = Counter((day, category) for _, category, _, day in batch)
+        conn.executemany(
+            """
+            INSERT INTO category_counts (category, count) VALUES (?, ?)
+            ON CONFLICT (category) DO UPDATE SET count = count + excluded.count
+            """,
+            categories.items()
+        )
+        conn.executemany(
+            """
+            INSERT INTO monthly_counts (year_month, count) VALUES (?, ?)
+            ON CONFLICT (year_month) DO UPDATE SET count = count + excluded.count
+            """,
+            months.items()
+        )
+        conn.executemany(
+            """
+            INSERT INTO daily_category_counts (day, category, count) VALUES (?, ?, ?)
+            ON CONFLICT (day, category) DO UPDATE SET count = count + excluded.count
+            """,
+            [(day, category, count) for (day, category), count in days.items()]
+        )
+
+    def rebuild_rollups(self):
+        """
+        Recomputes the rollup tables from the raw categories table in one transaction.
+        Rows logged before daily tracking have no day and only count towards the
+        category and month totals.
+        """
+        with self.read_lock, self.conn:
+            self.conn.execute("DELETE FROM category_counts")
+            self.conn.execute("DELETE FROM monthly_counts")
+            self.conn.execute("DELETE FROM daily_category_counts")
+            self.conn.execute(
+                "INSERT INTO category_counts SELECT category, COUNT(*) FROM categories GROUP BY category"
+            )
+            self.conn.execute(
+                "INSERT INTO monthly_counts SELECT year_month, COUNT(*) FROM categories GROUP BY year_month"
+            )
             self.conn.execute(
-                "INSERT INTO categories (question, category, year_month) VALUES (?, ?, ?)",
-                (question, category, current_date)
+                """
+                INSERT INTO daily_category_counts
+                SELECT day, category, COUNT(*) FROM categories WHERE day IS NOT NULL GROUP BY day, category
+                """
             )
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
+        logger.info("Analytics rollups rebuilt from the categories table.")
 
-    def read_sql(self):
-        query = """
-        SELECT category, COUNT(*) AS Count
-        FROM categories
-        GROUP BY category
-        ORDER BY Count DESC;
+    def recategorize(self, categorizer, batch_size=5000):
+        """
+        Re-classifies every logged question, e.g. after a taxonomy change, then rebuilds
+        the rollups.
+
+        Args:
+            categorizer (QuestionCategorizer): Categorizer whose `classify_batch` is applied.
+            batch_size (int): Questions classified and updated per transaction.
+
+        Returns:
+            int: Number of questions whose category changed.
+        """
+        self.flush()
+        changed = 0
+        last_id = 0
+        while True:
+            with self.read_lock:
+                rows = self.conn.execute(
+                    "SELECT id, question, category FROM categories WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            categories = categorizer.classify_batch([question or "" for _, question, _ in rows])
+            updates = [(new, row_id) for (row_id, _, old), new in zip(rows, categories) if new != old]
+            with self.read_lock, self.conn:
+                self.conn.executemany("UPDATE categories SET category = ? WHERE id = ?", updates)
+            changed += len(updates)
+        self.rebuild_rollups()
+        logger.info(f"Re-categorized questions: {changed} changed.")
+        return changed
+
+    def flush(self, timeout=None):
         """
-        self.df_queries = pd.read_sql(query, self.conn)
+        Blocks until every queued question has been written, the writer thread has
+        stopped, e.g. after `close()`, or `timeout` seconds have passed.
+
+        Returns:
+            bool: Whether every queued question was written.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                if not self.writer.is_alive():
+                    logger.error(f"Database error: writer stopped with {self.queue.unfinished_tasks} question(s) queued.")
+                    return False
+                wait = 0.5 if deadline is None else min(deadline - time.monotonic(), 0.5)
+                if wait <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(wait)
+        return True
+
+    def close(self):
+        """
+        Writes the queued questions and stops the writer thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.writer.join()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _read(self, query, params=()):
+        with self.read_lock:
+            return pd.read_sql(query, self.conn, params=params)
+
+    def read_sql(self, days=None):
+        """
+        Question counts per category, over all time or the last `days` days.
+        """
+        if days is None:
+            query = """
+            SELECT category, count AS Count
+            FROM category_counts
+            ORDER BY Count DESC;
+            """
+            self.df_queries = self._read(query)
+        else:
+            query = """
+            SELECT category, SUM(count) AS Count
+            FROM daily_category_counts
+            WHERE day >= ?
+            GROUP BY category
+            ORDER BY Count DESC;
+            """
+            since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+            self.df_queries = self._read(query, (since,))
         return self.df_queries
 
-    def read_qns(self):
+    def read_qns(self, months=None):
+        """
+        Question counts per month, over all time or the last `months` months.
+        """
         ask = """
-        SELECT year_month, COUNT(*) AS Count
-        FROM categories
-        GROUP BY year_month
-        ORDER BY year_month DESC;
+        SELECT year_month, count AS Count
+        FROM monthly_counts
+        ORDER BY year_month DESC
+        LIMIT ?;
         """
-        self.no_queries = pd.read_sql(ask, self.conn)
+        self.no_queries = self._read(ask, (-1 if months is None else months,))
         self.no_queries['year_month']=self.no_queries['year_month'].astype(str)
         return self.no_queries
+
+    def read_daily(self, days=30):
+        """
+        Question counts per day over the last `days` days.
+        """
+        query = """
+        SELECT day, SUM(count) AS Count
+        FROM daily_category_counts
+        WHERE day >= ?
+        GROUP BY day
+        ORDER BY day;
+        """
+        since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        return self._read(query, (since,))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the question analytics database.")
+    parser.add_argument("--db-path", default="categories.db")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="Backfill the rollup tables from the raw table.")
+    parser.add_argument("--recategorize", action="store_true", help="Re-classify every logged question with the keyword categorizer.")
+    args = parser.parse_args()
+
+    db = CategoryDB(args.db_path)
+    if args.recategorize:
+        from classifier import QuestionCategorizer
+        db.recategorize(QuestionCategorizer())
+    elif args.rebuild_rollups:
+        db.rebuild_rollups()
+    print(db.read_sql())
+    db.close()
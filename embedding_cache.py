@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from telemetry import telemetry
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, on-disk cache in front of an embedding model.
+
+    Vectors are keyed by the model name and output dimensions plus the SHA-256 of the
+    text, so a model or dimension change never serves stale vectors, and identical
+    chunks are embedded once across rebuilds and repeated questions once across
+    requests. Misses of a batch are embedded in one call, and the least recently used
+    vectors are evicted once the cache holds more than `max_entries`.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    QUERY_BATCH = 900
+
+    def __init__(self, embeddings, cache_path, model_name=None, max_entries=200_000):
+        """
+        Args:
+            embeddings (Embeddings): The underlying embedding model.
+            cache_path (str): SQLite file the vectors are persisted to.
+            model_name (str): Name used in cache keys. Defaults to the model's `model` attribute.
+                The model's `dimensions`, when set, are part of the keys too.
+            max_entries (int): Maximum number of cached vectors.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        dimensions = getattr(embeddings, "dimensions", None)
+        self.namespace = f"{self.model_name}@{dimensions}" if dimensions else self.model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                key TEXT PRIMARY KEY,
+                vector BLOB,
+                last_used REAL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_last_used ON vectors (last_used)")
+        self.conn.commit()
+
+    def key(self, text, kind):
+        """
+        Returns the cache key of a text; documents and queries are kept apart because
+        some models embed them differently.
+        """
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{kind}:{digest}"
+
+    def _lookup(self, keys):
+        """
+        Returns the cached vectors for the given keys and refreshes their recency.
+        """
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self.lock:
+            for start in range(0, len(unique), self.QUERY_BATCH):
+                batch = unique[start:start + self.QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+                if rows:
+                    self.conn.execute(
+                        f"UPDATE vectors SET last_used = ? WHERE key IN ({placeholders})", [time.time(), *batch]
+                    )
+            self.conn.commit()
+        return found
+
+    def _store(self, items):
+        """
+        Persists (key, vector) pairs and evicts the least recently used vectors beyond the size bound.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+            )
+            self.conn.execute(
+                """
+                DELETE FROM vectors WHERE key IN (
+                    SELECT key FROM vectors ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def embed_documents(self, texts):
+        """
+        Embeds documents, calling the underlying model once for all cache misses.
+        """
+        keys = [self.key(text, "doc") for text in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        misses = sum(1 for key in keys if key in missing)
+        self.hits += len(texts) - misses
+        self.misses += misses
+        telemetry.count("ana_cache_requests_total", len(texts) - misses, cache="embedding", result="hit")
+        telemetry.count("ana_cache_requests_total", misses, cache="embedding", result="miss")
+        if missing:
+            started = time.perf_counter()
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            telemetry.record_call("embedding", self.model_name, time.perf_counter() - started, texts=len(missing))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh.items())
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        """
+        Embeds a query, serving repeated questions from the cache.
+        """
+        key = self.key(text, "query")
+        found = self._lookup([key])
+        telemetry.record_cache("embedding", key in found)
+        if key in found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        started = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        telemetry.record_call("embedding", self.model_name, time.perf_counter() - started, texts=1)
+        self._store([(key, vector)])
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Embeds several queries, calling the underlying model once for all cache misses.
+
+        The misses are embedded as documents, which is the same call for OpenAI embeddings.
+        """
+        keys = [self.key(text, "query") for text in texts]
+        found = self._lookup(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        misses = sum(1 for key in keys if key in missing)
+        self.hits += len(texts) - misses
+        self.misses += misses
+        telemetry.count("ana_cache_requests_total", len(texts) - misses, cache="embedding", result="hit")
+        telemetry.count("ana_cache_requests_total", misses, cache="embedding", result="miss")
+        if missing:
+            started = time.perf_counter()
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            telemetry.record_call("embedding", self.model_name, time.perf_counter() - started, texts=len(missing))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh.items())
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    @property
+    def hit_ratio(self):
+        """
+        Returns the fraction of embedded texts served from the cache.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of cached vectors.
+        """
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio, "entries": entries}
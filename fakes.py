@@ -0,0 +1,197 @@
+import re
+import time
+import asyncio
+import hashlib
+import numpy as np
+from typing import Any, Callable, Union
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for OpenAIEmbeddings.
+
+    Texts are embedded by hashing their words into a fixed number of dimensions, so
+    texts sharing words get similar vectors and retrieval still behaves sensibly.
+    """
+
+    def __init__(self, size=256, latency=0.0, model="fake-embedding"):
+        """
+        Args:
+            size (int): Number of dimensions of the vectors.
+            latency (float): Seconds to sleep per call, to mimic a remote model.
+            model (str): Model name reported to caches.
+        """
+        self.size = size
+        self.latency = latency
+        self.model = model
+        self.calls = 0
+        self.texts_embedded = 0
+
+    @property
+    def dimensions(self):
+        # Reported like OpenAIEmbeddings.dimensions, which caches key their vectors on
+        return self.size
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+            vector[digest % self.size] += 1.0 if (digest >> 64) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic, offline stand-in for ChatOpenAI.
+
+    Plain calls answer with `response`; structured calls (the graders) grade documents
+    relevant with probability `relevance`, decided by hashing the prompt so that runs are
+    repeatable. Token usage is reported like OpenAI's, so usage tracking keeps working.
+    """
+
+    response: Union[str, Callable[[str], str]] = "Regular exercise, balanced meals and enough sleep keep you healthy."
+    relevance: float = 0.5
+    latency: float = 0.0
+    token_latency: float = 0.0
+    model_name: str = "fake-chat"
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    @staticmethod
+    def prompt_text(messages):
+        return "\n".join(str(message.content) for message in messages)
+
+    def respond(self, messages):
+        """
+        Returns the prompt text and the answer to it.
+        """
+        self.calls += 1
+        text = self.prompt_text(messages)
+        return text, self.response(text) if callable(self.response) else self.response
+
+    def result(self, prompt, content):
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split())}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={"token_usage": usage, "model_name": self.model_name},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.result(*self.respond(messages))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.result(*self.respond(messages))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        _, content = self.respond(messages)
+        for token in re.findall(r"\S+\s*", content):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        _, content = self.respond(messages)
+        for token in re.findall(r"\S+\s*", content):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def grade(self, text, salt=""):
+        digest = int(hashlib.md5((text + salt).encode("utf-8")).hexdigest(), 16)
+        return "yes" if digest % 1000 < self.relevance * 1000 else "no"
+
+    def parse(self, schema, text):
+        """
+        Builds a response of a structured output schema from the prompt text.
+        """
+        fields = schema.__fields__
+        if "grades" in fields:
+            # Listwise grading: one grade per id-tagged document of the prompt
+            grade_schema = fields["grades"].type_
+            doc_ids = [int(doc_id) for doc_id in re.findall(r"<document id=(\d+)>", text)]
+            return schema(grades=[grade_schema(doc_id=i, binary_score=self.grade(text, str(i))) for i in doc_ids])
+        return schema(**{name: self.grade(text) for name in fields})
+
+    def with_structured_output(self, schema, *, include_raw=False, **kwargs: Any):
+        def to_messages(prompt):
+            return prompt.to_messages() if hasattr(prompt, "to_messages") else prompt
+
+        def structured(prompt):
+            messages = to_messages(prompt)
+            raw = self.invoke(messages)
+            parsed = self.parse(schema, self.prompt_text(messages))
+            return {"raw": raw, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+        async def astructured(prompt):
+            messages = to_messages(prompt)
+            raw = await self.ainvoke(messages)
+            parsed = self.parse(schema, self.prompt_text(messages))
+            return {"raw": raw, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+        return RunnableLambda(structured, afunc=astructured)
+
+
+class FakeSearch:
+    """
+    Offline stand-in for the Tavily search tool, returning `results` made-up pages per query.
+    """
+
+    def __init__(self, results=3, latency=0.0):
+        """
+        Args:
+            results (int): Number of results per query.
+            latency (float): Seconds to sleep per search, to mimic the remote API.
+        """
+        self.results = results
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        slug = re.sub(r"\W+", "-", query.lower()).strip("-")
+        return [
+            {"url": f"https://example.com/{slug}/{i}", "content": f"Web result {i} about {query}"}
+            for i in range(self.results)
+        ]
+
+    def invoke(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.search(query)
+
+    async def ainvoke(self, query):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.search(query)
@@ -1,6 +1,30 @@
+import asyncio
+import threading
+from typing import List
+from contextlib import contextmanager
+from concurrent.futures import as_completed
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
+from llm_pool import get_pool
+from langchain_community.callbacks import get_openai_callback
+from telemetry import logger
+
+
+class DocumentGrade(BaseModel):
+    """Binary relevance score for one document of a list."""
+    doc_id: int = Field(description="Id of the graded document")
+    binary_score: str = Field(
+        description="Document is relevant to the question, 'yes' or 'no'"
+    )
+
+
+class GradeDocumentList(BaseModel):
+    """Binary scores for relevance check on a list of retrieved documents."""
+    grades: List[DocumentGrade] = Field(
+        description="One grade per retrieved document"
+    )
+
 
 class DocGrader:
     """
@@ -13,15 +37,19 @@ class DocGrader:
             description="Documents are relevant to the question, 'yes' or 'no'"
         )
 
-    def __init__(self, model_name="gpt-4o", temperature=0):
+    GRADING_MODES = ("pointwise", "listwise")
+
+    def __init__(self, model_name="gpt-4o", temperature=0, llm=None):
         """
         Initializes the DocumentGrader with the specified model and temperature.
 
         Args:
             model_name (str): The name of the LLM model to use.
             temperature (float): Sampling temperature for the LLM.
+            llm: Chat model to use instead of the pooled ChatOpenAI, e.g. `fakes.FakeChatModel`.
         """
-        self.llm = ChatOpenAI(model=model_name, temperature=temperature)
+        # Grading yields to rewriting and answering when the model is rate limited
+        self.llm = llm or get_pool().chat_model(model_name, temperature, priority="grading")
         self.structured_llm_grader = self.llm.with_structured_output(self.GradeDocuments)
 
         # system prompt for the grader
@@ -36,6 +64,25 @@ class DocGrader:
         # Generate the grade
         self.grader_chain = self.prompt | self.structured_llm_grader
 
+        # Grade all documents in a single call; the raw message is kept so that
+        # unparseable responses fall back to per-document grading instead of raising.
+        self.LISTWISE_SYS_PROMPT = """You are an expert grader assessing relevance of retrieved documents to a user question.
+        Follow these instructions for grading:
+          - Grade every document independently, referring to it by its id.
+          - If a document contains keyword(s) or semantic meaning related to the question, grade it as relevant.
+          - Each grade should be either 'yes' or 'no' to indicate whether the document is relevant to the question or not.
+        """
+        self.listwise_chain = self.build_listwise_prompt() | self.llm.with_structured_output(
+            GradeDocumentList, include_raw=True
+        )
+
+        # Per-mode LLM usage, to compare the cost of the grading modes
+        self.usage_lock = threading.Lock()
+        self.usage = {
+            mode: {"calls": 0, "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_cost": 0.0}
+            for mode in self.GRADING_MODES
+        }
+
     def build_prompt(self):
         """
         Builds a ChatPromptTemplate for grading documents.
@@ -52,7 +99,214 @@ class DocGrader:
             ]
         )
 
-    
+    def build_listwise_prompt(self):
+        """
+        Builds a ChatPromptTemplate for grading a list of documents in one call.
+        """
+        return ChatPromptTemplate.from_messages(
+            [
+                ("system", self.LISTWISE_SYS_PROMPT),
+                ("human", """Retrieved documents:
+                             {documents}
+
+                             User question:
+                             {question}
+                          """),
+            ]
+        )
+
+    @staticmethod
+    def format_documents(documents):
+        """
+        Formats documents as id-tagged blocks for the listwise prompt.
+        """
+        return "\n\n".join(
+            f"<document id={doc_id}>\n{doc.page_content}\n</document>"
+            for doc_id, doc in enumerate(documents)
+        )
+
+    @contextmanager
+    def track_usage(self, mode):
+        """
+        Accumulates the token usage and cost of the LLM calls made inside the block under `mode`.
+        """
+        with get_openai_callback() as cb:
+            yield
+        # Grading calls of concurrent questions finish in other threads
+        with self.usage_lock:
+            usage = self.usage[mode]
+            usage["calls"] += 1
+            usage["requests"] += cb.successful_requests
+            usage["prompt_tokens"] += cb.prompt_tokens
+            usage["completion_tokens"] += cb.completion_tokens
+            usage["total_cost"] += cb.total_cost
+
+    def usage_per_call(self):
+        """
+        Returns the average requests, tokens and cost per grading call for each mode.
+        """
+        report = {}
+        with self.usage_lock:
+            usages = {mode: dict(usage) for mode, usage in self.usage.items()}
+        for mode, usage in usages.items():
+            calls = usage["calls"] or 1
+            report[mode] = {key: value / calls for key, value in usage.items() if key != "calls"}
+            report[mode]["calls"] = usage["calls"]
+        return report
+
+    def grade_listwise(self, question, documents):
+        """
+        Grades all documents with a single structured-output call.
+
+        Returns:
+            list: 'yes'/'no' grades in document order, with None for every document the
+                response did not grade. All None if the response could not be parsed.
+        """
+        result = self.listwise_chain.invoke(
+            {"question": question, "documents": self.format_documents(documents)}
+        )
+        return self.parse_listwise(result, len(documents))
+
+    async def agrade_listwise(self, question, documents):
+        """
+        Async version of `grade_listwise`.
+        """
+        result = await self.listwise_chain.ainvoke(
+            {"question": question, "documents": self.format_documents(documents)}
+        )
+        return self.parse_listwise(result, len(documents))
+
+    @staticmethod
+    def parse_listwise(result, num_documents):
+        """
+        Maps a raw listwise grading result to grades in document order.
+        """
+        grades = [None] * num_documents
+        parsed = result.get("parsed")
+        if parsed is None:
+            logger.warning(f"---LISTWISE GRADING UNPARSEABLE: {result.get('parsing_error')}---")
+            return grades
+        for grade in parsed.grades:
+            if 0 <= grade.doc_id < num_documents:
+                grades[grade.doc_id] = grade.binary_score
+        return grades
+
+    def grade_documents(self, question, documents, max_concurrency=4, stop_on_irrelevant=False, mode="pointwise"):
+        """
+        Grades documents against the question.
+
+        Args:
+            question (str): The user question.
+            documents (list): Documents with a 'page_content' attribute.
+            max_concurrency (int): Maximum number of grading calls in flight.
+            stop_on_irrelevant (bool): Stop grading as soon as one document is graded
+                irrelevant, since that alone decides that a web search is needed.
+            mode (str): 'pointwise' grades each document in its own call, 'listwise'
+                grades them all in one call and falls back to pointwise grading for
+                any document the response did not grade.
+
+        Returns:
+            list: 'yes'/'no' grades in document order; None for documents left ungraded
+                after an early exit.
+        """
+        if mode not in self.GRADING_MODES:
+            raise ValueError(f"Unknown grading mode '{mode}'. Expected one of {self.GRADING_MODES}.")
+        if not documents:
+            return []
+        if mode == "listwise":
+            # Fallback calls are counted as listwise usage: they are part of its cost.
+            with self.track_usage("listwise"):
+                grades = self.grade_listwise(question, documents)
+                missing = [i for i, grade in enumerate(grades) if grade is None]
+                if missing:
+                    fallback = self.grade_pointwise(
+                        question, [documents[i] for i in missing], max_concurrency, stop_on_irrelevant
+                    )
+                    for index, grade in zip(missing, fallback):
+                        grades[index] = grade
+            return grades
+        with self.track_usage("pointwise"):
+            return self.grade_pointwise(question, documents, max_concurrency, stop_on_irrelevant)
+
+    def grade_pointwise(self, question, documents, max_concurrency=4, stop_on_irrelevant=False):
+        """
+        Grades documents concurrently, one grading call per document.
+        See `grade_documents` for the arguments and return value.
+        """
+        inputs = [{"question": question, "document": doc.page_content} for doc in documents]
+        if not stop_on_irrelevant:
+            scores = self.grader_chain.batch(inputs, config={"max_concurrency": max_concurrency})
+            return [score.binary_score for score in scores]
+
+        grades = [None] * len(inputs)
+        executor = ContextThreadPoolExecutor(max_workers=max(1, max_concurrency))
+        try:
+            futures = {
+                executor.submit(self.grader_chain.invoke, grader_input): index
+                for index, grader_input in enumerate(inputs)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                grades[index] = future.result().binary_score
+                if grades[index] != "yes":
+                    break
+        finally:
+            # Drop queued calls; calls already in flight finish in the background.
+            executor.shutdown(wait=False, cancel_futures=True)
+        return grades
+
+    async def agrade_documents(self, question, documents, max_concurrency=4, stop_on_irrelevant=False, mode="pointwise"):
+        """
+        Async version of `grade_documents`.
+        """
+        if mode not in self.GRADING_MODES:
+            raise ValueError(f"Unknown grading mode '{mode}'. Expected one of {self.GRADING_MODES}.")
+        if not documents:
+            return []
+        if mode == "listwise":
+            with self.track_usage("listwise"):
+                grades = await self.agrade_listwise(question, documents)
+                missing = [i for i, grade in enumerate(grades) if grade is None]
+                if missing:
+                    fallback = await self.agrade_pointwise(
+                        question, [documents[i] for i in missing], max_concurrency, stop_on_irrelevant
+                    )
+                    for index, grade in zip(missing, fallback):
+                        grades[index] = grade
+            return grades
+        with self.track_usage("pointwise"):
+            return await self.agrade_pointwise(question, documents, max_concurrency, stop_on_irrelevant)
+
+    async def agrade_pointwise(self, question, documents, max_concurrency=4, stop_on_irrelevant=False):
+        """
+        Async version of `grade_pointwise`; on an early exit the outstanding calls are cancelled.
+        """
+        inputs = [{"question": question, "document": doc.page_content} for doc in documents]
+        if not stop_on_irrelevant:
+            scores = await self.grader_chain.abatch(inputs, config={"max_concurrency": max_concurrency})
+            return [score.binary_score for score in scores]
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def grade(grader_input):
+            async with semaphore:
+                return (await self.grader_chain.ainvoke(grader_input)).binary_score
+
+        grades = [None] * len(inputs)
+        tasks = {asyncio.ensure_future(grade(grader_input)): index for index, grader_input in enumerate(inputs)}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    grades[tasks[task]] = task.result()
+                if any(grades[tasks[task]] != "yes" for task in done):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        return grades
+
 
 if __name__ == "__main__":
 # Initialize the grader
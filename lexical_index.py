@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+
+# Keeps drug names, dosages and acronyms whole, e.g. "5mg", "b12", "covid-19", "2.5"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or should "
+    "that the this to what when which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms, dropping stop words.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over chunk IDs, persisted as JSON.
+
+    Only term frequencies are stored; the chunk text itself stays in the vector DB.
+    Reads and updates are serialized by a lock, so chunks can be added, e.g. by web
+    write-back, while searches run.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Args:
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.postings = {}
+        self.total_length = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_terms
+
+    def ids(self):
+        """
+        Returns the set of indexed chunk IDs.
+        """
+        with self.lock:
+            return set(self.doc_terms)
+
+    def add(self, doc_id, text):
+        """
+        Indexes a chunk, replacing any previous version with the same ID.
+        """
+        terms = Counter(tokenize(text))
+        with self.lock:
+            if doc_id in self.doc_terms:
+                self.remove(doc_id)
+            self.doc_terms[doc_id] = dict(terms)
+            self.doc_lengths[doc_id] = sum(terms.values())
+            self.total_length += self.doc_lengths[doc_id]
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        """
+        Removes a chunk from the index, if present.
+        """
+        with self.lock:
+            terms = self.doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            for term in terms:
+                posting = self.postings[term]
+                del posting[doc_id]
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query, k=10):
+        """
+        Returns the k best-matching chunks for a query.
+
+        Returns:
+            list: (chunk ID, BM25 score) tuples, best first.
+        """
+        query_terms = set(tokenize(query))
+        scores = {}
+        with self.lock:
+            if not self.doc_terms:
+                return []
+            num_docs = len(self.doc_terms)
+            avg_length = self.total_length / num_docs or 1.0
+            for term in query_terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, path):
+        """
+        Atomically persists the index to a JSON file.
+        """
+        tmp_path = path + ".tmp"
+        with self.lock, open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_terms": self.doc_terms}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index persisted with `save`, or returns an empty index if the file is missing.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        for doc_id, terms in data["doc_terms"].items():
+            index.doc_terms[doc_id] = terms
+            index.doc_lengths[doc_id] = sum(terms.values())
+            index.total_length += index.doc_lengths[doc_id]
+            for term, tf in terms.items():
+                index.postings.setdefault(term, {})[doc_id] = tf
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses several rankings of IDs with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Lists of IDs, each ordered best first.
+        k (int): Rank offset damping the weight of the top ranks.
+
+    Returns:
+        list: (ID, fused score) tuples, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalReranker:
+    """
+    Cheap local reranker scoring documents by the share of question terms they contain.
+    """
+
+    def score(self, question, documents):
+        """
+        Returns a score in [0, 1] per document, in document order.
+        """
+        terms = set(tokenize(question))
+        if not terms:
+            return [0.0] * len(documents)
+        return [len(terms.intersection(tokenize(doc.page_content))) / len(terms) for doc in documents]
@@ -0,0 +1,405 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from typing import Any
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+from telemetry import logger, telemetry
+
+# Lower runs first: answers the user is waiting on beat query rewriting, which beats grading
+PRIORITIES = {"generation": 0, "rewrite": 1, "grading": 2}
+
+# Requests and tokens per minute per model; override with ANA_LLM_LIMITS to match the account tier
+DEFAULT_LIMITS = {
+    "gpt-4o": (500, 30_000),
+    "gpt-3.5-turbo": (3_500, 200_000),
+}
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucketLimiter:
+    """
+    Request and token buckets of one model, refilled continuously at the per-minute limits.
+
+    Callers wait in priority order: a request is only admitted when it is the
+    highest-priority waiter and both buckets can cover it.
+    """
+
+    def __init__(self, model, requests_per_minute, tokens_per_minute):
+        """
+        Args:
+            model (str): Model name, used as metric label.
+            requests_per_minute (float): Request limit of the model.
+            tokens_per_minute (float): Token limit of the model.
+        """
+        self.model = model
+        self.request_capacity = requests_per_minute
+        self.token_capacity = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiters = []
+        # Entry -> (event loop, asyncio.Event) of the coroutines among the waiters
+        self.async_waiters = {}
+        self.sequence = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_capacity / 60)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_capacity / 60)
+
+    def _wait_time(self, tokens):
+        """
+        Seconds until both buckets can cover one request of `tokens` tokens.
+        """
+        missing_requests = max(0.0, 1 - self.requests)
+        missing_tokens = max(0.0, tokens - self.tokens)
+        return max(missing_requests * 60 / self.request_capacity, missing_tokens * 60 / self.token_capacity)
+
+    def _enqueue(self, entry):
+        heapq.heappush(self.waiters, entry)
+        telemetry.gauge("ana_llm_queue_depth", len(self.waiters), model=self.model)
+
+    def _dequeue(self, entry):
+        self.waiters.remove(entry)
+        heapq.heapify(self.waiters)
+        self.async_waiters.pop(entry, None)
+        telemetry.gauge("ana_llm_queue_depth", len(self.waiters), model=self.model)
+        self._wake()
+
+    def _wake(self):
+        """
+        Wakes every waiter, threads and coroutines, to re-check whether it is admitted.
+        """
+        self.condition.notify_all()
+        for loop, event in self.async_waiters.values():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop already closed; its waiter is gone with it
+                pass
+
+    def _admit(self, entry, tokens):
+        """
+        Takes one request of `tokens` tokens from the buckets if `entry` is the head waiter
+        and they cover it. Caller holds the condition.
+
+        Returns:
+            tuple: (admitted, seconds to wait before re-checking, None to wait for a wake-up).
+        """
+        self._refill()
+        wait = self._wait_time(tokens)
+        if self.waiters[0] != entry:
+            # Everyone but the head waits for the head to be admitted
+            return False, None
+        if wait > 0:
+            return False, wait
+        self.requests -= 1
+        self.tokens -= tokens
+        return True, None
+
+    def acquire(self, tokens, priority=1):
+        """
+        Blocks until a request of an estimated `tokens` tokens may be sent.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        # A request larger than the whole bucket would never be admitted
+        tokens = min(tokens, self.token_capacity)
+        started = time.monotonic()
+        entry = (priority, next(self.sequence))
+        with self.condition:
+            self._enqueue(entry)
+            try:
+                while True:
+                    admitted, wait = self._admit(entry, tokens)
+                    if admitted:
+                        break
+                    self.condition.wait(timeout=wait)
+            finally:
+                self._dequeue(entry)
+        waited = time.monotonic() - started
+        telemetry.observe("ana_llm_queue_wait_seconds", waited, model=self.model)
+        return waited
+
+    async def aacquire(self, tokens, priority=1):
+        """
+        Awaits until a request of an estimated `tokens` tokens may be sent, in the same
+        priority queue as `acquire` but without holding a thread while waiting.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        tokens = min(tokens, self.token_capacity)
+        started = time.monotonic()
+        entry = (priority, next(self.sequence))
+        event = asyncio.Event()
+        with self.condition:
+            self._enqueue(entry)
+            self.async_waiters[entry] = (asyncio.get_running_loop(), event)
+        try:
+            while True:
+                with self.condition:
+                    admitted, wait = self._admit(entry, tokens)
+                    if admitted:
+                        break
+                    # Cleared under the lock, so a wake-up after this check is never lost
+                    event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.condition:
+                self._dequeue(entry)
+        waited = time.monotonic() - started
+        telemetry.observe("ana_llm_queue_wait_seconds", waited, model=self.model)
+        return waited
+
+    def settle(self, estimated, actual):
+        """
+        Corrects the token bucket once the actual usage of a request is known.
+        """
+        with self.condition:
+            self.tokens = min(self.token_capacity, self.tokens + min(estimated, self.token_capacity) - actual)
+            self._wake()
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.waiters)
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose calls go through the pool's rate limiter and retry policy.
+
+    The OpenAI client's own retries are disabled, so that every attempt, retries
+    included, is paced by the limiter.
+    """
+
+    pool: Any = None
+    priority: int = 1
+
+    def estimate_tokens(self, messages):
+        # Roughly 4 characters per token, plus the completion
+        prompt = sum(len(str(message.content)) for message in messages) // 4
+        return prompt + (self.max_tokens or self.pool.completion_estimate)
+
+    def record_usage(self, estimate, result):
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        if usage.get("total_tokens"):
+            self.pool.limiter(self.model_name).settle(estimate, usage["total_tokens"])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # Goes through `_stream`, which is limited itself
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        limiter = self.pool.limiter(self.model_name)
+        estimate = self.estimate_tokens(messages)
+        for attempt in itertools.count():
+            limiter.acquire(estimate, self.priority)
+            try:
+                result = super()._generate(messages, stop, run_manager, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self.pool.retry_delay(self.model_name, attempt, e))
+                continue
+            self.record_usage(estimate, result)
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        limiter = self.pool.limiter(self.model_name)
+        estimate = self.estimate_tokens(messages)
+        for attempt in itertools.count():
+            await limiter.aacquire(estimate, self.priority)
+            try:
+                result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self.pool.retry_delay(self.model_name, attempt, e))
+                continue
+            self.record_usage(estimate, result)
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = self.pool.limiter(self.model_name)
+        estimate = self.estimate_tokens(messages)
+        for attempt in itertools.count():
+            limiter.acquire(estimate, self.priority)
+            chunks = super()._stream(messages, stop, run_manager, **kwargs)
+            # Only retried until the first chunk; after that the caller has seen output
+            try:
+                first = next(chunks)
+            except StopIteration:
+                return
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self.pool.retry_delay(self.model_name, attempt, e))
+                continue
+            yield first
+            yield from chunks
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = self.pool.limiter(self.model_name)
+        estimate = self.estimate_tokens(messages)
+        for attempt in itertools.count():
+            await limiter.aacquire(estimate, self.priority)
+            chunks = super()._astream(messages, stop, run_manager, **kwargs)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self.pool.retry_delay(self.model_name, attempt, e))
+                continue
+            yield first
+            async for chunk in chunks:
+                yield chunk
+            return
+
+
+class LLMPool:
+    """
+    Process-wide registry of chat models sharing HTTP connections, rate limits and retry policy.
+    """
+
+    def __init__(self, limits=None, default_limits=(500, 30_000), max_connections=64, max_retries=4,
+                 backoff_base=0.5, backoff_cap=20.0, completion_estimate=256, base_url=None, timeout=60.0):
+        """
+        Args:
+            limits (dict): Model name -> (requests per minute, tokens per minute).
+            default_limits (tuple): Limits of models missing from `limits`.
+            max_connections (int): Maximum open HTTP connections to the API.
+            max_retries (int): Retries of a failed call before the error is raised.
+            backoff_base (float): Seconds of the first retry backoff, doubled per attempt.
+            backoff_cap (float): Maximum retry backoff in seconds.
+            completion_estimate (int): Completion tokens reserved per call without `max_tokens`.
+            base_url (str): API base URL, e.g. a local stub server. Defaults to OpenAI's.
+            timeout (float): Seconds before a call times out.
+        """
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.default_limits = default_limits
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.completion_estimate = completion_estimate
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.limiters = {}
+        self.models = {}
+        connection_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.http_client = httpx.Client(limits=connection_limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=connection_limits, timeout=timeout)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the pool from ANA_LLM_LIMITS ("gpt-4o=500:30000,gpt-3.5-turbo=3500:200000")
+        and OPENAI_BASE_URL.
+        """
+        limits = {}
+        for entry in filter(None, os.getenv("ANA_LLM_LIMITS", "").split(",")):
+            model, _, values = entry.partition("=")
+            rpm, _, tpm = values.partition(":")
+            limits[model.strip()] = (float(rpm), float(tpm))
+        return cls(limits=limits, base_url=os.getenv("OPENAI_BASE_URL"))
+
+    def limiter(self, model):
+        """
+        Returns the rate limiter shared by every caller of a model.
+        """
+        with self.lock:
+            if model not in self.limiters:
+                rpm, tpm = self.limits.get(model, self.default_limits)
+                self.limiters[model] = TokenBucketLimiter(model, rpm, tpm)
+            return self.limiters[model]
+
+    def chat_model(self, model="gpt-4o", temperature=0, priority="generation"):
+        """
+        Returns the pooled chat model for a model, temperature and priority, built once per process.
+
+        Args:
+            model (str): OpenAI model name.
+            temperature (float): Sampling temperature.
+            priority (str): One of `PRIORITIES`; decides who goes first when the model is rate limited.
+        """
+        key = (model, temperature, priority)
+        # Streamed responses report their token usage in a last chunk, where supported
+        stream_usage = {"stream_usage": True} if "stream_usage" in ChatOpenAI.__fields__ else {}
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = PooledChatOpenAI(
+                    **stream_usage,
+                    model=model,
+                    temperature=temperature,
+                    base_url=self.base_url,
+                    max_retries=0,
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client,
+                    pool=self,
+                    priority=PRIORITIES[priority],
+                )
+            return self.models[key]
+
+    def retry_delay(self, model, attempt, error):
+        """
+        Returns the backoff before retrying a failed call, or re-raises once retries are exhausted.
+
+        Backoff is exponential with full jitter, so callers throttled together do not retry
+        together; a Retry-After header sent by the API is honoured as a minimum.
+        """
+        if attempt >= self.max_retries:
+            raise error
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        telemetry.count("ana_llm_retries_total", model=model, error=type(error).__name__)
+        logger.info(f"{type(error).__name__} from {model}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s.")
+        return delay
+
+    def stats(self):
+        """
+        Returns the queue depth and remaining bucket capacity of each model.
+        """
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {
+            model: {"queue_depth": limiter.queue_depth(), "requests": limiter.requests, "tokens": limiter.tokens}
+            for model, limiter in limiters.items()
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the process-wide LLM pool, built from the environment on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LLMPool.from_env()
+        return _pool
@@ -0,0 +1,365 @@
+import os
+import json
+import shutil
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from chunk_store import ChunkStore, FileLock
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Exact-search vector store over memory-mapped NumPy matrices.
+
+    Vectors are L2-normalized and appended to a flat row file in float32, float16 or
+    int8 (quantized per row with a float32 scale). Row i of the matrix belongs to row i
+    of a `ChunkStore` holding the IDs, texts and metadata. Queries are answered by one
+    matrix multiply over all rows, in blocks, followed by a top-k selection, so results
+    are exact and a batch of queries costs one pass over the matrix; only the returned
+    chunks are read.
+
+    Opening maps the files read-only without reading them, which takes milliseconds,
+    and processes opening the same directory share the pages through the OS page
+    cache. Deletes are tombstones; the files are compacted once dead rows outnumber
+    live ones.
+
+    Writers in any process serialize on a lock file and append after the rows
+    committed on disk. Every commit replaces the chunk state file, so a search that
+    finds it replaced since the last load maps the rows other processes committed
+    first. A search reads the chunks of the mapping it searched, so a compaction in
+    this or another process never mixes up rows.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    STORE_FILE = "store.json"
+    VECTORS_FILE = "vectors.bin"
+    SCALES_FILE = "scales.bin"
+    LOCK_FILE = "store.lock"
+    # Rows multiplied at once: bounds the float32 copy made of float16 and int8 blocks
+    BLOCK_ROWS = 16384
+
+    def __init__(self, directory, embedding, dtype="float32"):
+        """
+        Args:
+            directory (str): Directory of the store files, created if missing.
+            embedding (Embeddings): Model embedding added texts and queries.
+            dtype (str): One of `DTYPES`, used when the store is created. An existing
+                store keeps the dtype it was built with.
+        """
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}'. Expected one of {self.DTYPES}.")
+        self.directory = directory
+        self.embedding_model = embedding
+        self.lock = threading.Lock()
+        self.info = {"dtype": dtype, "dim": None}
+        os.makedirs(directory, exist_ok=True)
+        self.file_lock = FileLock(self.path(self.LOCK_FILE))
+        self.reload()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def embeddings(self):
+        return self.embedding_model
+
+    @property
+    def dtype(self):
+        return self.info["dtype"]
+
+    def reload(self):
+        """
+        Maps the rows committed by the chunk store. The chunk store is a new object, so
+        searches holding the previous mapping keep reading the rows they found.
+        """
+        # Taken first: a commit landing while the files are read only costs a second reload
+        stamp = self.committed_stamp()
+        if os.path.exists(self.path(self.STORE_FILE)):
+            with open(self.path(self.STORE_FILE), "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+        chunks = ChunkStore(self.directory, lock=self.file_lock)
+        count, dim = chunks.count, self.info["dim"]
+        vectors = scales = None
+        if count:
+            vectors = np.memmap(self.path(self.VECTORS_FILE), dtype=self.dtype, mode="r", shape=(count, dim))
+            if self.dtype == "int8":
+                scales = np.memmap(self.path(self.SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+        self.vectors, self.scales, self.chunks, self.stamp = vectors, scales, chunks, stamp
+
+    def committed_stamp(self):
+        """
+        Identifies the last commit on disk, by any process: the inode and mtime of the
+        chunk state file, which each commit replaces.
+        """
+        try:
+            stat = os.stat(self.path(ChunkStore.STATE_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self):
+        """
+        Reloads if another process committed since the last load. Called by writers
+        holding `file_lock`.
+        """
+        if self.chunks.committed_state() != self.chunks.state:
+            self.reload()
+
+    def snapshot(self):
+        """
+        Returns the (vectors, scales, chunks) of the current mapping, which stay
+        consistent with each other whatever writers do next. Rows committed by other
+        processes since the last load are mapped first.
+        """
+        with self.lock:
+            if self.committed_stamp() != self.stamp:
+                # Under the file lock, so a compaction moving its files in is never half seen
+                with self.file_lock:
+                    self.reload()
+            return self.vectors, self.scales, self.chunks
+
+    def save_info(self):
+        tmp_path = self.path(self.STORE_FILE) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f)
+        os.replace(tmp_path, self.path(self.STORE_FILE))
+
+    def append_file(self, name, data, committed):
+        with open(self.path(name), "ab") as f:
+            f.truncate(committed)
+            f.write(data)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def encode(self, vectors):
+        """
+        Returns the stored rows, and their scales for int8, of normalized float32 vectors.
+        """
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    def decode(self, rows):
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        """
+        Appends precomputed vectors. Rows of existing IDs are replaced.
+
+        Returns:
+            list: IDs of the added rows.
+        """
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        if not texts:
+            return []
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate IDs in one add.")
+        vectors = self.normalize(vectors)
+        with self.lock, self.file_lock:
+            self.refresh()
+            if self.info["dim"] is None:
+                self.info["dim"] = vectors.shape[1]
+                self.save_info()
+            elif vectors.shape[1] != self.info["dim"]:
+                raise ValueError(f"Expected {self.info['dim']}-dimensional vectors, got {vectors.shape[1]}.")
+            rows, scales = self.encode(vectors)
+            start = self.chunks.count
+            # Vectors first: they only count once the chunk store commits its rows
+            self.append_file(self.VECTORS_FILE, rows.tobytes(), start * rows.shape[1] * rows.itemsize)
+            if scales is not None:
+                self.append_file(self.SCALES_FILE, scales.tobytes(), start * scales.itemsize)
+            self.chunks.append(ids, texts, metadatas)
+            self.reload()
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_model.embed_documents(texts), metadatas, ids)
+
+    @property
+    def dead_rows(self):
+        """
+        Rows of deleted or replaced entries still taking space in the files.
+        """
+        return self.chunks.count - len(self.chunks)
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Deletes rows by ID. The files are compacted once dead rows outnumber live ones.
+        """
+        with self.lock, self.file_lock:
+            self.refresh()
+            self.chunks.delete(self.chunks.rows(ids or []))
+        if self.dead_rows > len(self):
+            self.compact()
+        return True
+
+    def delete_collection(self):
+        """
+        Deletes every file of the store.
+        """
+        with self.lock, self.file_lock:
+            self.vectors = self.scales = None
+            self.chunks.clear()
+            for name in (self.STORE_FILE, self.VECTORS_FILE, self.SCALES_FILE):
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+            self.info = {"dtype": self.dtype, "dim": None}
+            self.reload()
+
+    def compact(self):
+        """
+        Rewrites the store without deleted and replaced rows.
+
+        The new files are written to a temporary directory and moved in place, the
+        chunk state file last, so readers keep the old mapping until they reopen.
+        """
+        tmp_directory = self.directory.rstrip(os.sep) + ".compact"
+        with self.lock, self.file_lock:
+            self.refresh()
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            compacted = MmapVectorStore(tmp_directory, self.embedding_model, dtype=self.dtype)
+            rows = self.chunks.live_rows()
+            for start in range(0, len(rows), self.BLOCK_ROWS):
+                block = rows[start:start + self.BLOCK_ROWS]
+                ids, texts, metadatas = zip(*(self.chunks.read(row) for row in block))
+                # int8 rows are re-quantized from their dequantized values, which is lossless
+                compacted.add_embeddings(texts, self.decode(block), metadatas, ids)
+            names = [self.STORE_FILE, self.VECTORS_FILE, self.SCALES_FILE]
+            names += [name for name in ChunkStore.FILES if name != ChunkStore.STATE_FILE] + [ChunkStore.STATE_FILE]
+            for name in names:
+                if os.path.exists(compacted.path(name)):
+                    os.replace(compacted.path(name), self.path(name))
+                elif os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+            self.reload()
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    def get(self, ids=None, include=("documents", "metadatas"), **kwargs):
+        """
+        Returns rows in Chroma's `get` format: a dict of 'ids' and the requested
+        'documents', 'metadatas' and 'embeddings'.
+        """
+        with self.lock:
+            rows = self.chunks.live_rows() if ids is None else self.chunks.rows(ids)
+            records = [self.chunks.read(row) for row in rows]
+            result = {"ids": [doc_id for doc_id, _, _ in records]}
+            if "documents" in include:
+                result["documents"] = [text for _, text, _ in records]
+            if "metadatas" in include:
+                result["metadatas"] = [metadata for _, _, metadata in records]
+            if "embeddings" in include:
+                result["embeddings"] = self.decode(rows) if len(rows) else []
+        return result
+
+    def embed_queries(self, queries):
+        """
+        Embeds several queries, in one call when the model supports it.
+        """
+        if hasattr(self.embedding_model, "embed_queries"):
+            return self.embedding_model.embed_queries(queries)
+        return [self.embedding_model.embed_query(query) for query in queries]
+
+    def search_vectors(self, queries, k=4, snapshot=None):
+        """
+        Returns the exact top-k rows of each query vector.
+
+        Args:
+            queries: (n, dim) array of query vectors.
+            k (int): Results per query.
+            snapshot (tuple): Mapping to search, from `snapshot()`. Defaults to the current one.
+
+        Returns:
+            list: For each query, (row, cosine similarity) tuples, most similar first.
+        """
+        vectors, scales, chunks = snapshot or self.snapshot()
+        alive = chunks.alive
+        k = min(k, int(alive.sum()))
+        if vectors is None or k <= 0:
+            return [[] for _ in range(len(queries))]
+        queries = self.normalize(queries)
+        scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        for start in range(0, len(vectors), self.BLOCK_ROWS):
+            block = vectors[start:start + self.BLOCK_ROWS]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if scales is not None:
+            scores *= scales
+        scores[:, ~alive] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, rows in zip(scores, top):
+            rows = rows[np.argsort(-query_scores[rows])]
+            # Rounding can lift the similarity of identical vectors just above 1
+            results.append([(int(row), min(float(query_scores[row]), 1.0)) for row in rows])
+        return results
+
+    def to_documents(self, hits, snapshot=None):
+        """
+        Reads the chunks of (row, score) hits.
+
+        Args:
+            hits (list): (row, score) tuples from `search_vectors`.
+            snapshot (tuple): Mapping the hits were found in. Defaults to the current one.
+
+        Returns:
+            list: (Document, score) tuples.
+        """
+        chunks = (snapshot or self.snapshot())[2]
+        records = [(chunks.read(row), score) for row, score in hits]
+        return [(Document(page_content=text, metadata=metadata), score) for (_, text, metadata), score in records]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        snapshot = self.snapshot()
+        return self.to_documents(self.search_vectors([embedding], k, snapshot)[0], snapshot)
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding_model.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_batch(self, queries, k=4, score_threshold=None):
+        """
+        Searches several queries with one batched embedding and one pass over the matrix.
+
+        Returns:
+            list: For each query, (Document, cosine similarity) tuples, most similar first.
+        """
+        snapshot = self.snapshot()
+        hits = self.search_vectors(self.embed_queries(list(queries)), k, snapshot)
+        if score_threshold is not None:
+            hits = [[(row, score) for row, score in query_hits if score >= score_threshold] for query_hits in hits]
+        return [self.to_documents(query_hits, snapshot) for query_hits in hits]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already, as Chroma's relevance scores in cosine space
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory="mmap_index", dtype="float32", **kwargs):
+        store = cls(directory, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,17 +1,28 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from llm_pool import get_pool
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from context_builder import ContextBuilder
+from telemetry import telemetry
 from operator import itemgetter
 
 class QARAGChain:
-    def __init__(self, model_name='gpt-3.5-turbo', temperature=0):
+    # Answers the prompt prescribes when the context does not answer the question
+    REFUSALS = (
+        "I am only able to assist with healthcare-related topics",
+        "I don't know the answer",
+    )
+
+    def __init__(self, model_name='gpt-3.5-turbo', temperature=0, llm=None, context_budget=1500):
         """
         Initializes the QA RAG Chain with the model and prompt template.
         
         Args:
             model_name (str): The name of the language model to use.
             temperature (float): The sampling temperature for response generation.
+            llm: Chat model to use instead of the pooled ChatOpenAI, e.g. `fakes.FakeChatModel`.
+            context_budget (int): Maximum tokens of retrieved context in the prompt, see
+                `ContextBuilder`. None keeps every distinct passage.
         """
 
         self.prompt_template = ChatPromptTemplate.from_template(
@@ -36,12 +47,13 @@ class QARAGChain:
     """
         )
 
-        self.chatgpt = ChatOpenAI(model_name=model_name, temperature=temperature)
+        self.chatgpt = llm or get_pool().chat_model(model_name, temperature, priority="generation")
+        self.context_builder = ContextBuilder(token_budget=context_budget, model_name=model_name)
         
         # Define the RAG chain
         self.rag_chain = (
             {
-                "context": (itemgetter('context') | RunnableLambda(self.format_docs)),
+                "context": RunnableLambda(self.build_context),
                 "question": itemgetter('question'),
             }
             | self.prompt_template
@@ -61,7 +73,48 @@ class QARAGChain:
             str: Concatenated string of document contents.
         """
         return "\n\n".join(doc.page_content for doc in docs)
+
+    def build_context(self, inputs):
+        """
+        Builds the prompt context of the question within the token budget and records the tokens saved.
+
+        Args:
+            inputs (dict): Chain input with 'question' and 'context' (list of documents).
+
+        Returns:
+            str: Source-labelled passages, most relevant first.
+        """
+        context, report = self.context_builder.build(inputs["question"], inputs["context"])
+        telemetry.record_context(report)
+        return context
     
+    @classmethod
+    def is_answered(cls, generation):
+        """
+        Returns whether a generated answer actually answers the question.
+        """
+        return bool(generation) and not any(refusal in generation for refusal in cls.REFUSALS)
+
+    def stream(self, question, context):
+        """
+        Streams the answer of the QA RAG chain token by token.
+
+        Args:
+            question (str): The input question.
+            context (list): A list of context documents (each with a 'page_content' attribute).
+
+        Yields:
+            str: Answer tokens as the model produces them.
+        """
+        yield from self.rag_chain.stream({"question": question, "context": context})
+
+    async def astream(self, question, context):
+        """
+        Async version of `stream`.
+        """
+        async for token in self.rag_chain.astream({"question": question, "context": context}):
+            yield token
+
     def run(self, question, context):
         """
         Executes the QA RAG chain with the provided question and context.
@@ -1,5 +1,5 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from llm_pool import get_pool
 from langchain_core.output_parsers import StrOutputParser
 
 class QuestionRephraser:
@@ -7,15 +7,16 @@ class QuestionRephraser:
     A class to handle question rewriting using an LLM.
     """
 
-    def __init__(self, model_name="gpt-4o", temperature=0):
+    def __init__(self, model_name="gpt-4o", temperature=0, llm=None):
         """
         Initializes the QuestionRephraser with the specified model and temperature.
 
         Args:
             model_name (str): The name of the LLM model to use.
             temperature (float): Sampling temperature for the LLM.
+            llm: Chat model to use instead of the pooled ChatOpenAI, e.g. `fakes.FakeChatModel`.
         """
-        self.llm = ChatOpenAI(model=model_name, temperature=temperature)
+        self.llm = llm or get_pool().chat_model(model_name, temperature, priority="rewrite")
         self.output_parser = StrOutputParser()
 
         # system prompt for rephrasing
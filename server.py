@@ -0,0 +1,449 @@
+"""
+HTTP/JSON service around AgenticRAG, to serve ANA separately from the Streamlit UI.
+
+Questions are admitted into a bounded queue and answered by a pool of worker threads
+sharing one pipeline. When the queue is full, requests are rejected at once with a 503
+and a Retry-After header instead of waiting without bound. A request for a question
+that is already queued or running, after normalization as the web search cache does
+it and within the same session, joins that execution instead of starting another: it
+shares its retrieval, grading and generation and receives the same events.
+
+Endpoints:
+    POST /v1/answer     {"question": ..., "session_id": ...} -> the answer as JSON
+    POST /v1/stream     same body -> NDJSON events, as AgenticRAG.stream yields them
+    GET  /v1/telemetry  telemetry summary, for the dashboard of a thin client
+    GET  /v1/analytics?days=N   question counts per category and over time, for the
+                        analytics of a thin client (all time without days)
+    GET  /healthz       workers, queue depth and request counters
+    GET  /metrics       Prometheus metrics
+
+With --processes N, N forked processes share the listening socket, each with its own
+pipeline and workers (POSIX only); requests are then coalesced within a process. The
+processes share the vector store, so this needs --vector-backend mmap (Chroma is not
+safe to open from several processes); the index is synced once before forking and the
+processes only open it. --offline serves the fakes of `fakes.py` over files in a
+temporary directory, for load testing without API keys (see bench_server.py).
+
+Usage:
+    python server.py --port 8000 --workers 8 --queue-size 64
+    python server.py --offline --llm-latency 0.2 --search-latency 0.5
+    python server.py --processes 4 --vector-backend mmap
+    ANA_API_URL=http://localhost:8000 streamlit run app.py
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web_cache import WebSearchCache
+from telemetry import logger, telemetry
+
+RESPONSE_FIELDS = ("question", "generation", "category", "web_search_needed", "cache_hit")
+
+
+def to_json(response):
+    """
+    Returns the JSON-serializable part of a graph response.
+    """
+    body = {field: response.get(field) for field in RESPONSE_FIELDS}
+    body["documents"] = [
+        {"page_content": doc.page_content, "metadata": doc.metadata}
+        for doc in response.get("documents") or []
+    ]
+    return body
+
+
+class Flight:
+    """
+    One graph execution and the events it has produced so far, shared by every
+    request for its question.
+    """
+
+    def __init__(self, key, question, session_id):
+        self.key = key
+        self.question = question
+        self.session_id = session_id
+        self.events = []
+        self.done = False
+        self.condition = threading.Condition()
+
+    def publish(self, event):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def follow(self, timeout):
+        """
+        Yields every event from the first one on, waiting for new ones until the
+        execution finishes.
+
+        Raises:
+            TimeoutError: If the execution has not finished within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        index = 0
+        while True:
+            with self.condition:
+                while index == len(self.events) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No answer within {timeout:.0f}s.")
+                    self.condition.wait(remaining)
+                events, done = self.events[index:], self.done
+            index += len(events)
+            yield from events
+            # Events are published before finishing, so a finished snapshot holds them all
+            if done:
+                return
+
+
+class RAGService:
+    """
+    Admission queue, worker pool and in-flight request coalescing around one AgenticRAG.
+    """
+
+    def __init__(self, rag, workers=4, queue_size=64, request_timeout=120):
+        """
+        Args:
+            rag (AgenticRAG): The pipeline, shared by the workers.
+            workers (int): Questions answered at the same time.
+            queue_size (int): Questions waiting for a worker beyond which requests are rejected.
+            request_timeout (float): Seconds a request waits for its answer.
+        """
+        self.rag = rag
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.request_timeout = request_timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.running = 0
+        # Moving average of the seconds per question, for Retry-After
+        self.seconds_per_question = 1.0
+        self.stats = {"requests": 0, "admitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+        for i in range(workers):
+            threading.Thread(target=self.work, name=f"rag-worker-{i}", daemon=True).start()
+
+    @staticmethod
+    def key(question, session_id):
+        return WebSearchCache.normalize(question), session_id
+
+    def submit(self, question, session_id=None):
+        """
+        Joins the execution of the same question if one is in flight, otherwise queues a new one.
+
+        Returns:
+            tuple: (flight, coalesced), with flight None when the queue is full.
+        """
+        key = self.key(question, session_id)
+        with self.lock:
+            self.stats["requests"] += 1
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                result = "coalesced"
+            else:
+                flight = Flight(key, question, session_id)
+                try:
+                    self.queue.put_nowait(flight)
+                    self.flights[key] = flight
+                    self.stats["admitted"] += 1
+                    result = "admitted"
+                except queue.Full:
+                    flight = None
+                    self.stats["rejected"] += 1
+                    result = "rejected"
+        telemetry.count("ana_server_requests_total", result=result)
+        telemetry.gauge("ana_server_queue_depth", self.queue.qsize())
+        return flight, result == "coalesced"
+
+    def work(self):
+        while True:
+            flight = self.queue.get()
+            with self.lock:
+                self.running += 1
+            started = time.perf_counter()
+            outcome = "completed"
+            try:
+                for event in self.rag.stream(flight.question, session_id=flight.session_id):
+                    if event["type"] == "done":
+                        event = {"type": "done", "response": to_json(event["response"])}
+                    flight.publish(event)
+            except Exception as e:
+                logger.error(f"Answering '{flight.question}' failed: {e}")
+                flight.publish({"type": "error", "message": f"{type(e).__name__}: {e}"})
+                outcome = "failed"
+            finally:
+                seconds = time.perf_counter() - started
+                with self.lock:
+                    # Later requests start a new execution, which the answer cache can serve
+                    self.flights.pop(flight.key, None)
+                    self.running -= 1
+                    self.stats[outcome] += 1
+                    self.seconds_per_question = 0.8 * self.seconds_per_question + 0.2 * seconds
+                flight.finish()
+                telemetry.observe("ana_server_question_duration_seconds", seconds, outcome=outcome)
+                telemetry.gauge("ana_server_queue_depth", self.queue.qsize())
+
+    def retry_after(self):
+        """
+        Seconds until the queue has likely drained by one worker's share.
+        """
+        return max(1, round(self.seconds_per_question * self.queue.maxsize / self.workers))
+
+    def health(self):
+        with self.lock:
+            return {
+                "status": "ok",
+                "pid": os.getpid(),
+                "workers": self.workers,
+                "running": self.running,
+                "queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                **self.stats,
+            }
+
+    def analytics(self, days=None):
+        """
+        Returns the rollups of the questions the service logged: counts per category and
+        per day over the last `days` days, or per category and month over all time.
+        """
+        db = self.rag.agent.db
+        engagement = db.read_qns() if days is None else db.read_daily(days)
+        return {
+            "days": days,
+            "categories": db.read_sql(days).to_dict("records"),
+            "engagement": engagement.to_dict("records"),
+        }
+
+
+class RAGHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections waiting to be accepted. The admission queue bounds the work; a small
+    # backlog would reset bursts of connections before they could be answered with a 503
+    request_queue_size = 1024
+
+
+def make_handler(service):
+    class RAGHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, body, headers=()):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            path = url.path.rstrip("/")
+            if path == "/healthz":
+                self.send_json(200, service.health())
+            elif path == "/v1/telemetry":
+                self.send_json(200, telemetry.summary())
+            elif path == "/v1/analytics":
+                days = urllib.parse.parse_qs(url.query).get("days", [""])[0]
+                if days and not (days.isdigit() and int(days) > 0):
+                    self.send_json(400, {"error": "'days' must be a positive integer."})
+                    return
+                self.send_json(200, service.analytics(int(days) if days else None))
+            elif path == "/metrics":
+                data = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self.send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path not in ("/v1/answer", "/v1/stream"):
+                self.send_json(404, {"error": "Not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                question = str(request.get("question") or "").strip()
+                session_id = request.get("session_id")
+            except (ValueError, AttributeError):
+                self.send_json(400, {"error": "Expected a JSON object."})
+                return
+            if not question:
+                self.send_json(400, {"error": "Missing 'question'."})
+                return
+            flight, coalesced = service.submit(question, session_id)
+            if flight is None:
+                self.send_json(503, {"error": "Too many questions queued, retry later."},
+                               [("Retry-After", str(service.retry_after()))])
+                return
+            if path == "/v1/stream":
+                self.stream(flight)
+            else:
+                self.answer(flight, coalesced)
+
+        def answer(self, flight, coalesced):
+            try:
+                events = list(flight.follow(service.request_timeout))
+            except TimeoutError as e:
+                self.send_json(504, {"error": str(e)})
+                return
+            last = events[-1] if events else {"type": "error", "message": "No response generated."}
+            if last["type"] == "error":
+                self.send_json(500, {"error": last["message"]})
+            else:
+                self.send_json(200, {**last["response"], "coalesced": coalesced})
+
+        def stream(self, flight):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                try:
+                    for event in flight.follow(service.request_timeout):
+                        self.write_chunk(json.dumps(event) + "\n")
+                except TimeoutError as e:
+                    self.write_chunk(json.dumps({"type": "error", "message": str(e)}) + "\n")
+                self.write_chunk("")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client left; the execution goes on for the requests sharing it
+                pass
+
+        def write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return RAGHandler
+
+
+def build_data_loader(args, workdir):
+    """
+    Builds the data loader, syncing the index, over the fake embeddings with --offline.
+    """
+    from data_loader import DataLoader
+    if not args.offline:
+        return DataLoader(vector_backend=args.vector_backend)
+
+    from fakes import FakeEmbeddings
+    return DataLoader(
+        pdf_directory=os.path.abspath(args.pdf_directory),
+        persist_directory=os.path.join(workdir, "vector_db"),
+        embedding_model=FakeEmbeddings(),
+        vector_backend=args.vector_backend,
+    )
+
+
+def sync_index(args, workdir):
+    """
+    Syncs the index in a child process, so forked server processes only open it.
+
+    The parent stays free of the loader's connections and threads, which are not fork-safe.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            build_data_loader(args, workdir)
+        except BaseException:
+            logger.exception("Syncing the index failed.")
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        sys.exit("Syncing the index failed; not starting the server.")
+
+
+def build_rag(args, workdir=None):
+    """
+    Builds the pipeline, from the fakes of `fakes.py` with --offline.
+
+    Args:
+        args (argparse.Namespace): Parsed command line of the server.
+        workdir (str): Directory of the offline files, a new temporary one by default.
+    """
+    from agentic_rag import Agent, AgenticRAG
+    if not args.offline:
+        agent = Agent(data_loader=build_data_loader(args, workdir))
+        return AgenticRAG(answer_cache=not args.no_answer_cache, agent=agent)
+
+    from db_handler import CategoryDB
+    from fakes import FakeChatModel, FakeSearch
+    workdir = workdir or tempfile.mkdtemp(prefix="ana-server-")
+    agent = Agent(
+        llm=FakeChatModel(latency=args.llm_latency),
+        search_tool=FakeSearch(latency=args.search_latency),
+        data_loader=build_data_loader(args, workdir),
+        db=CategoryDB(os.path.join(workdir, "categories.db")),
+        web_cache=False,
+    )
+    return AgenticRAG(answer_cache=not args.no_answer_cache, cache_path=os.path.join(workdir, "answer_cache.db"), agent=agent)
+
+
+def serve(rag, host="127.0.0.1", port=8000, workers=4, queue_size=64, request_timeout=120):
+    """
+    Starts the service in a daemon thread and returns (server, service).
+    """
+    service = RAGService(rag, workers=workers, queue_size=queue_size, request_timeout=request_timeout)
+    server = RAGHTTPServer((host, port), make_handler(service))
+    threading.Thread(target=server.serve_forever, name="rag-server", daemon=True).start()
+    return server, service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered at the same time per process.")
+    parser.add_argument("--queue-size", type=int, default=64, help="Questions waiting per process before answering 503.")
+    parser.add_argument("--request-timeout", type=float, default=120, help="Seconds a request waits for its answer.")
+    parser.add_argument("--processes", type=int, default=1, help="Forked processes sharing the port (POSIX only).")
+    parser.add_argument("--vector-backend", choices=("chroma", "mmap"), default="chroma",
+                        help="Vector store; --processes above 1 needs 'mmap'.")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Answer every question with the graph.")
+    parser.add_argument("--offline", action="store_true", help="Serve the fake LLM, embeddings and web search.")
+    parser.add_argument("--pdf-directory", default="docs", help="PDFs indexed with --offline.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call with --offline.")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Seconds per fake web search with --offline.")
+    args = parser.parse_args()
+    if args.processes > 1 and args.vector_backend != "mmap":
+        parser.error("--processes above 1 needs --vector-backend mmap: Chroma is not safe to share between processes.")
+
+    # Offline processes share one directory, like the index files of a deployment
+    workdir = tempfile.mkdtemp(prefix="ana-server-") if args.offline else None
+    if args.processes > 1:
+        sync_index(args, workdir)
+    # Bound before forking, so every process accepts on the same socket
+    server = RAGHTTPServer((args.host, args.port), BaseHTTPRequestHandler)
+    for _ in range(args.processes - 1):
+        if os.fork() == 0:
+            break
+    # Built after forking: the pipeline's threads and connections are not fork-safe
+    service = RAGService(build_rag(args, workdir), workers=args.workers, queue_size=args.queue_size,
+                         request_timeout=args.request_timeout)
+    server.RequestHandlerClass = make_handler(service)
+    logger.info(f"Serving ANA on http://{args.host}:{args.port} (pid {os.getpid()}, {args.workers} workers).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
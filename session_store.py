@@ -0,0 +1,143 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from lexical_index import tokenize
+
+
+class SessionStore:
+    """
+    Keeps the recent turns of each conversation in memory, so follow-up questions can
+    reuse what earlier turns already retrieved, graded and searched.
+
+    A turn keeps the grades of the documents it retrieved and the documents it found
+    itself and answered from, web results included; documents it carried over from
+    earlier turns are not kept again, so a follow-up reuses at most the last
+    `max_turns` turns. Sessions are evicted least-recently-used beyond
+    `max_sessions` and expire after `ttl_seconds` without a turn; each keeps its last
+    `max_turns` turns.
+    """
+
+    FOLLOW_UP_PREFIXES = ("and ", "or ", "what about", "how about", "also ", "but ", "what if", "same ", "then ")
+    REFERENCES = frozenset("it its that this these those they them their there he she his her".split())
+    # A question referring back names at most this many things of its own ("is it safe?")
+    FOLLOW_UP_TERMS = 1
+
+    def __init__(self, max_sessions=1000, max_turns=3, ttl_seconds=30 * 60):
+        """
+        Args:
+            max_sessions (int): Maximum number of sessions kept.
+            max_turns (int): Turns kept per session, and reused by its follow-ups.
+            ttl_seconds (float): Inactivity after which a session is dropped.
+        """
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @staticmethod
+    def doc_key(doc):
+        return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def is_follow_up(cls, question):
+        """
+        Returns whether a question reads as a follow-up: it opens like one ("and what about
+        children?"), or it refers back to something without naming a topic of its own
+        ("is it safe?", "why?"). Pronouns alone do not make a follow-up: "is there a cure
+        for diabetes?" names its topic.
+        """
+        text = question.strip().lower()
+        if text.startswith(cls.FOLLOW_UP_PREFIXES):
+            return True
+        terms = [term for term in tokenize(text) if term not in cls.REFERENCES]
+        if not terms:
+            return True
+        words = {word.strip("?,.!\"'") for word in text.split()}
+        return len(terms) <= cls.FOLLOW_UP_TERMS and bool(words & cls.REFERENCES)
+
+    def turns(self, session_id):
+        """
+        Returns the recent turns of a session, oldest first, dropping it once expired.
+        """
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return []
+            if session["updated_at"] < time.time() - self.ttl_seconds:
+                del self.sessions[session_id]
+                return []
+            self.sessions.move_to_end(session_id)
+            return list(session["turns"])
+
+    def context(self, session_id, question):
+        """
+        Returns what a question can reuse from its session.
+
+        A follow-up is answered as its topic, the question that opened the thread, followed
+        by the follow-up itself, and reuses the grades and documents of the recent turns.
+        Any other question opens a new topic and reuses nothing.
+
+        Returns:
+            dict: 'question' to run the graph with, 'topic', 'follow_up', 'grades' (document
+                key to 'yes'/'no', latest turn first) and 'documents' of the recent turns.
+        """
+        turns = self.turns(session_id)
+        if not turns or not self.is_follow_up(question):
+            return {"question": question, "topic": question, "follow_up": False, "grades": {}, "documents": []}
+        topic = turns[-1]["topic"]
+        grades, documents, seen = {}, [], set()
+        for turn in reversed(turns):
+            for key, grade in turn["grades"].items():
+                grades.setdefault(key, grade)
+            for doc in turn["documents"]:
+                key = self.doc_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    documents.append(doc)
+        return {
+            "question": f"{topic} {question.strip()}",
+            "topic": topic,
+            "follow_up": True,
+            "grades": grades,
+            "documents": documents,
+        }
+
+    def record(self, session_id, context, state):
+        """
+        Adds a finished turn to its session.
+
+        Args:
+            session_id (str): The session.
+            context (dict): The turn's `context`.
+            state (dict): Final graph state, with the 'documents' answered from, the
+                'grades' given by the grading node and the keys of the documents it
+                'carried' from earlier turns.
+        """
+        carried = set(state.get("carried") or [])
+        turn = {
+            "topic": context["topic"],
+            "grades": state.get("grades") or {},
+            "documents": [doc for doc in state.get("documents") or [] if self.doc_key(doc) not in carried],
+        }
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = {"turns": deque(maxlen=self.max_turns), "updated_at": 0.0}
+            session["turns"].append(turn)
+            session["updated_at"] = time.time()
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+
+    def stats(self):
+        """
+        Returns the number of live and evicted sessions.
+        """
+        return {"sessions": len(self.sessions), "evicted": self.evicted}
@@ -0,0 +1,204 @@
+"""
+Local stand-in for the OpenAI API, to exercise the LLM pool's rate limiting and retries.
+
+Serves /v1/chat/completions (plain, streamed and tool calls for structured output)
+and /v1/embeddings with configurable latency. It enforces its own requests-per-minute
+limit, answering 429 with a Retry-After header beyond it, and can fail a share of
+requests with 500s. GET /stats returns the request and error counters.
+
+Usage:
+    python stub_openai_server.py --port 8765 --rpm 120 --latency 0.2
+    OPENAI_BASE_URL=http://localhost:8765/v1 OPENAI_API_KEY=stub python batch_runner.py questions.jsonl out.jsonl
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fakes import FakeEmbeddings
+
+ANSWER = "Regular exercise, balanced meals and enough sleep keep you healthy."
+
+
+def fill_schema(schema, prompt):
+    """
+    Builds arguments matching a JSON schema: grades say 'yes', lists of grades cover every document.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        if "grades" in properties:
+            item = properties["grades"].get("items", {})
+            doc_ids = [int(doc_id) for doc_id in re.findall(r"<document id=(\d+)>", prompt)]
+            return {"grades": [{**fill_schema(item, prompt), "doc_id": doc_id} for doc_id in doc_ids]}
+        return {name: fill_schema(prop, prompt) for name, prop in properties.items()}
+    if kind == "array":
+        return []
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return True
+    return "yes"
+
+
+class StubState:
+    def __init__(self, rpm, latency, error_rate):
+        self.rpm = rpm
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.embeddings = FakeEmbeddings()
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "completions": 0, "embeddings": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def admit(self):
+        """
+        Returns None to serve the request, or the (status, retry after) to reject it with.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.stats["requests"] += 1
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                self.stats["rate_limited"] += 1
+                return 429, 60 - (now - self.recent[0])
+            if random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, None
+            self.recent.append(now)
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        return None
+
+    def done(self, kind):
+        with self.lock:
+            self.stats["in_flight"] -= 1
+            self.stats[kind] += 1
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, body, headers=()):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with state.lock:
+                    self.send_json(200, dict(state.stats))
+            else:
+                self.send_json(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            rejected = state.admit()
+            if rejected:
+                status, retry_after = rejected
+                # Rounded up, so a client waiting that long finds the slot free
+                headers = [("Retry-After", f"{math.ceil(retry_after * 100) / 100:.2f}")] if retry_after else []
+                message = "Rate limit reached" if status == 429 else "Stub server error"
+                self.send_json(status, {"error": {"message": message, "type": "stub", "code": status}}, headers)
+                return
+            try:
+                time.sleep(state.latency)
+                if self.path.endswith("/embeddings"):
+                    self.embed(request)
+                    state.done("embeddings")
+                else:
+                    self.complete(request)
+                    state.done("completions")
+            except Exception:
+                state.done("errors")
+                raise
+
+        def embed(self, request):
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            vectors = state.embeddings.embed_documents([str(text) for text in texts])
+            self.send_json(200, {
+                "object": "list",
+                "model": request.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                "usage": {"prompt_tokens": sum(len(str(t).split()) for t in texts), "total_tokens": sum(len(str(t).split()) for t in texts)},
+            })
+
+        def complete(self, request):
+            prompt = "\n".join(str(message.get("content") or "") for message in request.get("messages", []))
+            message = {"role": "assistant", "content": ANSWER}
+            if request.get("tools"):
+                function = request["tools"][0]["function"]
+                message = {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": "call_stub", "type": "function",
+                    "function": {"name": function["name"], "arguments": json.dumps(fill_schema(function.get("parameters", {}), prompt))},
+                }]}
+            usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(ANSWER.split())}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model")}
+            if not request.get("stream"):
+                self.send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                    {"index": 0, "message": message, "finish_reason": "tool_calls" if request.get("tools") else "stop"}
+                ]})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in re.findall(r"\S+\s*", ANSWER):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}
+                ]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self.write_chunk("data: [DONE]\n\n")
+            self.write_chunk("")
+
+        def write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def serve(port=8765, rpm=0, latency=0.05, error_rate=0.0):
+    """
+    Starts the stub server in a daemon thread and returns (server, state).
+    """
+    state = StubState(rpm, latency, error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before answering 429; 0 for no limit.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 500.")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.rpm, args.latency, args.error_rate)
+    print(f"Stub OpenAI API on http://127.0.0.1:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
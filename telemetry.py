@@ -0,0 +1,495 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+import contextvars
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from langchain_community.callbacks.openai_info import (
+    MODEL_COST_PER_1K_TOKENS,
+    get_openai_token_cost_for_model,
+    standardize_model_name,
+)
+
+# Pipeline log; ANA_LOG_LEVEL=DEBUG brings back the node banners
+logger = logging.getLogger("ana")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Request trace and graph node the current code runs for
+current_trace = contextvars.ContextVar("ana_trace", default=None)
+current_node = contextvars.ContextVar("ana_node", default=None)
+
+
+def configure_logging(level=None):
+    """
+    Sends the pipeline log to stderr at `level`, by default the ANA_LOG_LEVEL environment variable or INFO.
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel((level or os.getenv("ANA_LOG_LEVEL", "INFO")).upper())
+
+
+class Trace:
+    """
+    Spans of one request: graph nodes and the LLM, embedding and search calls made in them.
+    """
+
+    def __init__(self, question):
+        self.question = question
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, kind, name, seconds, **attributes):
+        with self.lock:
+            self.spans.append({
+                "kind": kind,
+                "name": name,
+                "node": current_node.get(),
+                "offset_ms": round((time.perf_counter() - self.started) * 1000 - seconds * 1000, 3),
+                "duration_ms": round(seconds * 1000, 3),
+                **attributes,
+            })
+
+    def to_dict(self):
+        return {
+            "question": self.question,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            **self.attributes,
+            "spans": self.spans,
+        }
+
+
+class Telemetry:
+    """
+    In-process metrics and request traces of the pipeline.
+
+    Counters and latency histograms are exported in the Prometheus text format, written
+    to a file and/or served over HTTP; finished traces are kept in memory for the
+    dashboard and optionally appended to a JSONL file.
+    """
+
+    def __init__(self, trace_file=None, metrics_file=None, metrics_port=None, recent=1000):
+        """
+        Args:
+            trace_file (str): JSONL file every finished request trace is appended to.
+            metrics_file (str): File the Prometheus metrics are written to after each request.
+            metrics_port (int): Port serving the Prometheus metrics on /metrics.
+            recent (int): Number of samples and traces kept in memory per series.
+        """
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.samples = {}
+        self.recent = recent
+        self.traces = deque(maxlen=recent)
+        self.server = None
+        if metrics_port:
+            self.serve(int(metrics_port))
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the telemetry from ANA_TRACE_FILE, ANA_METRICS_FILE and ANA_METRICS_PORT.
+        """
+        return cls(
+            trace_file=os.getenv("ANA_TRACE_FILE"),
+            metrics_file=os.getenv("ANA_METRICS_FILE"),
+            metrics_port=os.getenv("ANA_METRICS_PORT"),
+        )
+
+    @staticmethod
+    def key(metric, labels):
+        return metric, tuple(sorted(labels.items()))
+
+    def count(self, metric, value=1, **labels):
+        """
+        Adds value to a counter.
+        """
+        key = self.key(metric, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, metric, value, **labels):
+        """
+        Sets a gauge to its current value.
+        """
+        key = self.key(metric, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, metric, seconds, **labels):
+        """
+        Records a duration in a latency histogram.
+        """
+        key = self.key(metric, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+                self.samples[key] = deque(maxlen=self.recent)
+            histogram["buckets"][bisect_left(BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            self.samples[key].append(seconds)
+
+    def record_call(self, kind, name, seconds, **attributes):
+        """
+        Records an LLM, embedding or search call in the metrics and the current trace.
+        """
+        self.observe("ana_call_duration_seconds", seconds, kind=kind, name=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(kind, name, seconds, **attributes)
+
+    def record_cache(self, cache, hit):
+        self.count("ana_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+        trace = current_trace.get()
+        if trace is not None:
+            with trace.lock:
+                trace.attributes.setdefault("cache_hits", {})[cache] = hit
+
+    def record_branch(self, decision):
+        self.count("ana_branch_total", decision=decision)
+        trace = current_trace.get()
+        if trace is not None:
+            with trace.lock:
+                trace.attributes["branch"] = decision
+
+    def record_context(self, report):
+        """
+        Records the prompt tokens a `ContextBuilder` kept and saved for one answer.
+        """
+        self.count("ana_context_tokens_total", report["context_tokens"], type="kept")
+        self.count("ana_context_tokens_total", max(0, report["tokens_saved"]), type="saved")
+        self.count("ana_context_passages_dropped_total", report["duplicates"], reason="duplicate")
+        self.count("ana_context_passages_dropped_total", report["over_budget"], reason="budget")
+        trace = current_trace.get()
+        if trace is not None:
+            with trace.lock:
+                trace.attributes["context"] = report
+
+    def record_session(self, follow_up=None, **calls_saved):
+        """
+        Records a conversation turn, when `follow_up` is given, and the remote calls a
+        follow-up saved by reusing earlier turns, e.g. `grader=3`.
+        """
+        if follow_up is not None:
+            self.count("ana_session_turns_total", type="follow_up" if follow_up else "new")
+        for call, saved in calls_saved.items():
+            if saved:
+                self.count("ana_session_calls_saved_total", saved, call=call)
+        trace = current_trace.get()
+        if trace is not None:
+            with trace.lock:
+                session = trace.attributes.setdefault("session", {})
+                if follow_up is not None:
+                    session["follow_up"] = follow_up
+                for call, saved in calls_saved.items():
+                    session[f"{call}_calls_saved"] = session.get(f"{call}_calls_saved", 0) + saved
+
+    def record_llm(self, model, seconds, prompt_tokens, completion_tokens):
+        model = standardize_model_name(model) if model else "unknown"
+        cost = 0.0
+        if model in MODEL_COST_PER_1K_TOKENS:
+            cost = get_openai_token_cost_for_model(model, prompt_tokens)
+            cost += get_openai_token_cost_for_model(model, completion_tokens, is_completion=True)
+        self.count("ana_llm_tokens_total", prompt_tokens, model=model, type="prompt")
+        self.count("ana_llm_tokens_total", completion_tokens, model=model, type="completion")
+        self.count("ana_llm_cost_usd_total", cost, model=model)
+        self.record_call("llm", model, seconds, prompt_tokens=prompt_tokens,
+                         completion_tokens=completion_tokens, cost_usd=cost)
+
+    @contextmanager
+    def trace(self, question):
+        """
+        Traces one request; nodes and calls made inside the block are recorded as its spans.
+        """
+        trace = Trace(question)
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace):
+        record = trace.to_dict()
+        path = "cache" if record.get("cache_hits", {}).get("answer") else "graph"
+        self.observe("ana_request_duration_seconds", record["duration_ms"] / 1000, path=path)
+        with self.lock:
+            self.traces.append(record)
+        if self.trace_file:
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                logger.error(f"Could not write trace: {e}")
+        if self.metrics_file:
+            self.write_prometheus(self.metrics_file)
+
+    def record_node(self, name, seconds):
+        """
+        Records a graph node run in the metrics and the current trace.
+        """
+        self.observe("ana_node_duration_seconds", seconds, node=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span("node", name, seconds)
+
+    def node(self, name, fn):
+        """
+        Wraps a graph node so that every run is timed and traced.
+        """
+        def record(started):
+            self.record_node(name, time.perf_counter() - started)
+
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_node(state):
+                token = current_node.set(name)
+                started = time.perf_counter()
+                try:
+                    return await fn(state)
+                finally:
+                    record(started)
+                    current_node.reset(token)
+            return async_node
+
+        @wraps(fn)
+        def sync_node(state):
+            token = current_node.set(name)
+            started = time.perf_counter()
+            try:
+                return fn(state)
+            finally:
+                record(started)
+                current_node.reset(token)
+        return sync_node
+
+    def render_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        def labels(items, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*items, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((k, dict(v, buckets=list(v["buckets"]))) for k, v in self.histograms.items())
+        seen = set()
+        for (name, items), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{labels(items)} {value}")
+        for (name, items), value in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{labels(items)} {value}")
+        for (name, items), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{labels(items, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{labels(items)} {histogram['sum']}")
+            lines.append(f"{name}_count{labels(items)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Atomically writes the metrics to a file, e.g. for the node_exporter textfile collector.
+        Each write goes through its own temporary file, so concurrent writers never interleave.
+        """
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=os.path.dirname(path) or ".",
+                prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False,
+            ) as f:
+                tmp_path = f.name
+                f.write(self.render_prometheus())
+            # Temporary files are private; the collector may run as another user
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not write metrics: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def serve(self, port):
+        """
+        Serves the metrics on http://0.0.0.0:<port>/metrics from a daemon thread.
+        """
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not serve metrics on port {port}: {e}")
+            return
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on port {port}.")
+
+    def summary(self):
+        """
+        Returns recent latencies per node and call, LLM usage, context tokens kept and saved,
+        remote calls saved by follow-up questions, and cache hit ratios for the dashboard.
+        """
+        def percentile(values, q):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+        with self.lock:
+            samples = {key: list(values) for key, values in self.samples.items()}
+            counters = dict(self.counters)
+            # Counted by the request histogram, which unlike `traces` is not capped at `recent`
+            requests = sum(
+                histogram["count"] for (name, _), histogram in self.histograms.items()
+                if name == "ana_request_duration_seconds"
+            )
+        latency = []
+        for (name, items), values in samples.items():
+            if name not in ("ana_node_duration_seconds", "ana_call_duration_seconds"):
+                continue
+            labels = dict(items)
+            latency.append({
+                "step": labels.get("node") or f"{labels['kind']}: {labels['name']}",
+                "calls": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+            })
+        usage, caches, branches, context, session_calls = {}, {}, {}, {"kept": 0, "saved": 0}, {}
+        for (name, items), value in counters.items():
+            labels = dict(items)
+            if name == "ana_llm_tokens_total":
+                usage.setdefault(labels["model"], {"prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+                usage[labels["model"]][f"{labels['type']}_tokens"] += value
+            elif name == "ana_llm_cost_usd_total":
+                usage.setdefault(labels["model"], {"prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+                usage[labels["model"]]["cost_usd"] += value
+            elif name == "ana_cache_requests_total":
+                caches.setdefault(labels["cache"], {"hit": 0, "miss": 0})[labels["result"]] += value
+            elif name == "ana_branch_total":
+                branches[labels["decision"]] = value
+            elif name == "ana_context_tokens_total":
+                context[labels["type"]] += value
+            elif name == "ana_session_calls_saved_total":
+                session_calls[labels["call"]] = value
+        return {
+            "latency": latency,
+            "llm_usage": usage,
+            "cache_hit_ratio": {c: v["hit"] / (v["hit"] + v["miss"]) for c, v in caches.items()},
+            "branches": branches,
+            "context_tokens": context,
+            "session_calls_saved": session_calls,
+            "requests": requests,
+        }
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """
+    Records the latency, tokens and cost of every LLM call made through LangChain.
+
+    Streamed responses report no token usage unless the provider sends it with the
+    chunks; their tokens are then counted from the prompt and the generated text.
+    """
+
+    run_inline = True
+
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+        self.started = {}
+
+    def start(self, run_id, kwargs, prompt):
+        # Streamed responses carry no llm_output, so the model name is taken from the request
+        params = kwargs.get("invocation_params") or {}
+        self.started[run_id] = (time.perf_counter(), params.get("model_name") or params.get("model") or "", prompt)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start(run_id, kwargs, "\n".join(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start(run_id, kwargs, "\n".join(str(message.content) for batch in messages for message in batch))
+
+    @staticmethod
+    def count_tokens(model, text):
+        # Imported here: context_builder logs through this module
+        from context_builder import get_encoding
+        encoding = get_encoding(model or "gpt-3.5-turbo")
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def usage(self, response, model, prompt):
+        """
+        Returns the (prompt, completion) tokens of a response: as reported in llm_output,
+        else in the message usage metadata, else counted.
+        """
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        generations = [generation for batch in response.generations for generation in batch]
+        metadata = [getattr(getattr(g, "message", None), "usage_metadata", None) for g in generations]
+        if generations and all(metadata):
+            return sum(m["input_tokens"] for m in metadata), sum(m["output_tokens"] for m in metadata)
+        completion = "".join(generation.text for generation in generations)
+        return self.count_tokens(model, prompt), self.count_tokens(model, completion)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id not in self.started:
+            return
+        started, model, prompt = self.started.pop(run_id)
+        model = (response.llm_output or {}).get("model_name") or model
+        prompt_tokens, completion_tokens = self.usage(response, model, prompt)
+        self.telemetry.record_llm(model, time.perf_counter() - started, prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+        self.telemetry.count("ana_llm_errors_total")
+
+
+configure_logging()
+telemetry = Telemetry.from_env()
+
+# Attached to every LangChain run, next to any handler passed explicitly
+_handler = contextvars.ContextVar("ana_telemetry_handler", default=TelemetryCallbackHandler(telemetry))
+register_configure_hook(_handler, inheritable=True)
@@ -0,0 +1,84 @@
+import pytest
+from fakes import FakeEmbeddings
+from embedding_cache import CachedEmbeddings
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.db")
+
+
+def test_hits_skip_the_underlying_model(cache_path):
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, cache_path)
+    first = cache.embed_documents(["sleep hygiene", "balanced diet"])
+    query = cache.embed_query("how much sleep?")
+    assert model.calls == 2
+
+    assert cache.embed_documents(["sleep hygiene", "balanced diet"]) == first
+    assert cache.embed_query("how much sleep?") == query
+    assert model.calls == 2
+    assert cache.stats()["hits"] == 3
+
+
+def test_hits_survive_reopening_the_cache(cache_path):
+    CachedEmbeddings(FakeEmbeddings(), cache_path).embed_documents(["sleep hygiene"])
+    model = FakeEmbeddings()
+    CachedEmbeddings(model, cache_path).embed_documents(["sleep hygiene"])
+    assert model.calls == 0
+
+
+def test_documents_and_queries_are_cached_apart(cache_path):
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, cache_path)
+    cache.embed_documents(["sleep hygiene"])
+    cache.embed_query("sleep hygiene")
+    assert model.calls == 2
+
+
+@pytest.mark.parametrize("changed", [
+    FakeEmbeddings(model="other-embedding"),
+    FakeEmbeddings(size=128),
+])
+def test_model_or_dimension_change_misses(cache_path, changed):
+    CachedEmbeddings(FakeEmbeddings(), cache_path).embed_documents(["sleep hygiene"])
+    vector = CachedEmbeddings(changed, cache_path).embed_documents(["sleep hygiene"])[0]
+    assert changed.calls == 1
+    assert len(vector) == changed.size
+
+
+def test_batch_embeds_only_the_misses_in_one_call(cache_path):
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, cache_path)
+    cached = cache.embed_documents(["sleep hygiene", "balanced diet"])
+    texts = ["balanced diet", "daily walks", "sleep hygiene", "daily walks", "hydration"]
+    vectors = cache.embed_documents(texts)
+    assert model.calls == 2
+    # Duplicated misses are embedded once
+    assert model.texts_embedded == 4
+    assert vectors == [cached[1], model._embed("daily walks"), cached[0], model._embed("daily walks"),
+                       model._embed("hydration")]
+
+
+def test_batch_queries_embed_only_the_misses(cache_path):
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, cache_path)
+    known = cache.embed_query("how much sleep?")
+    vectors = cache.embed_queries(["how much sleep?", "is coffee healthy?"])
+    assert model.calls == 2
+    assert vectors == [known, model._embed("is coffee healthy?")]
+
+
+def test_least_recently_used_vectors_are_evicted(cache_path):
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, cache_path, max_entries=2)
+    cache.embed_documents(["first"])
+    cache.embed_documents(["second"])
+    cache.embed_documents(["first"])
+    cache.embed_documents(["third"])
+    assert cache.stats()["entries"] == 2
+    calls = model.calls
+    cache.embed_documents(["first", "third"])
+    assert model.calls == calls
+    cache.embed_documents(["second"])
+    assert model.calls == calls + 1
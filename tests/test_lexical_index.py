@@ -0,0 +1,70 @@
+import threading
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_search_ranks_matching_chunks_first():
+    index = BM25Index()
+    index.add("diet", "A balanced diet with vegetables and fruit")
+    index.add("sleep", "Adults need seven to nine hours of sleep")
+    index.add("both", "Sleep and diet both matter")
+    assert [doc_id for doc_id, _ in index.search("hours of sleep")] == ["sleep", "both"]
+
+
+def test_add_replaces_and_remove_drops_a_chunk():
+    index = BM25Index()
+    index.add("a", "vitamin b12 dosage")
+    index.add("a", "iron supplements")
+    assert index.search("b12") == []
+    index.remove("a")
+    assert len(index) == 0 and index.search("iron") == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index()
+    index.add("a", "covid-19 vaccine 5mg")
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    assert BM25Index.load(path).search("covid-19") == index.search("covid-19")
+
+
+def test_concurrent_adds_and_searches():
+    index = BM25Index()
+    for i in range(200):
+        index.add(f"seed-{i}", f"sleep exercise diet topic{i}")
+    errors = []
+    done = threading.Event()
+
+    def add():
+        try:
+            for i in range(3000):
+                index.add(f"web-{i}", f"sleep advice from the web term{i}")
+                if i % 3 == 0:
+                    index.remove(f"web-{i}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def search():
+        try:
+            while not done.is_set():
+                index.search("sleep advice", k=5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add), threading.Thread(target=search), threading.Thread(target=search)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    assert errors == []
+    assert len(index) == 200 + 2000
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]])
+    assert fused[0][0] == "b"
+
+
+def test_tokenize_keeps_dosages_and_drops_stop_words():
+    assert tokenize("What is the 2.5mg dose of B12?") == ["2.5mg", "dose", "b12"]
@@ -0,0 +1,120 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import pytest
+from llm_pool import LLMPool, PRIORITIES, TokenBucketLimiter
+from stub_openai_server import ANSWER, serve
+
+
+def drained_limiter(requests_per_minute=600):
+    # One request per 0.1s, and none left right now
+    limiter = TokenBucketLimiter("test", requests_per_minute, 1_000_000)
+    limiter.requests = 0.0
+    return limiter
+
+
+async def admit_all(limiter, priorities):
+    order = []
+
+    async def waiter(name, priority):
+        await limiter.aacquire(1, priority)
+        order.append(name)
+
+    await asyncio.gather(*(waiter(name, priority) for name, priority in priorities))
+    return order
+
+
+def test_waiters_are_admitted_in_priority_order():
+    limiter = drained_limiter()
+    priorities = [("grading", PRIORITIES["grading"]), ("rewrite", PRIORITIES["rewrite"]),
+                  ("generation", PRIORITIES["generation"]), ("grading-2", PRIORITIES["grading"])]
+    order = asyncio.run(admit_all(limiter, priorities))
+    assert order == ["generation", "rewrite", "grading", "grading-2"]
+
+
+def test_threads_and_coroutines_share_the_priority_queue():
+    limiter = drained_limiter()
+    order = []
+    thread = threading.Thread(target=lambda: (limiter.acquire(1, PRIORITIES["grading"]), order.append("thread")))
+    thread.start()
+    while not limiter.queue_depth():
+        time.sleep(0.001)
+
+    async def generation():
+        await limiter.aacquire(1, PRIORITIES["generation"])
+        order.append("coroutine")
+
+    asyncio.run(generation())
+    thread.join(timeout=5)
+    assert order == ["coroutine", "thread"]
+
+
+def test_async_waiters_hold_no_executor_threads():
+    limiter = TokenBucketLimiter("test", 60, 1_000_000)
+    limiter.requests = 0.0
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        waiters = [asyncio.create_task(limiter.aacquire(1)) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        # Would block behind the waiters if they each parked a thread
+        started = time.monotonic()
+        await asyncio.wait_for(asyncio.to_thread(lambda: None), timeout=1)
+        elapsed = time.monotonic() - started
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return elapsed
+
+    assert asyncio.run(main()) < 1
+    assert limiter.queue_depth() == 0
+
+
+@pytest.fixture
+def rate_limited_stub(monkeypatch):
+    """
+    Stub API allowing one request a minute, whose slot frees up 1s from now, so the
+    first call gets a 429 with a short Retry-After.
+    """
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    server, state = serve(port=0, rpm=1, latency=0)
+    state.recent.append(time.monotonic() - 59.0)
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", state
+    server.shutdown()
+
+
+def test_invoke_retries_after_429(rate_limited_stub):
+    base_url, state = rate_limited_stub
+    model = LLMPool(base_url=base_url, backoff_base=0.01).chat_model()
+    assert model.invoke("How do I stay healthy?").content == ANSWER
+    assert state.stats["rate_limited"] == 1
+    assert state.stats["completions"] == 1
+
+
+def test_ainvoke_retries_after_429(rate_limited_stub):
+    base_url, state = rate_limited_stub
+    model = LLMPool(base_url=base_url, backoff_base=0.01).chat_model()
+    assert asyncio.run(model.ainvoke("How do I stay healthy?")).content == ANSWER
+    assert state.stats["rate_limited"] == 1
+    assert state.stats["completions"] == 1
+
+
+def test_astream_retries_after_429(rate_limited_stub):
+    base_url, state = rate_limited_stub
+    model = LLMPool(base_url=base_url, backoff_base=0.01).chat_model()
+
+    async def stream():
+        return "".join([chunk.content async for chunk in model.astream("How do I stay healthy?")])
+
+    assert asyncio.run(stream()) == ANSWER
+    assert state.stats["rate_limited"] == 1
+
+
+def test_429_is_raised_once_retries_are_exhausted(rate_limited_stub):
+    base_url, state = rate_limited_stub
+    model = LLMPool(base_url=base_url, max_retries=0).chat_model()
+    with pytest.raises(openai.RateLimitError):
+        model.invoke("How do I stay healthy?")
+    assert state.stats["completions"] == 0
@@ -0,0 +1,70 @@
+import multiprocessing
+import numpy as np
+from fakes import FakeEmbeddings
+from mmap_store import MmapVectorStore
+
+WRITERS = 4
+BATCHES = 20
+
+
+def append_batches(directory, writer):
+    store = MmapVectorStore(directory, FakeEmbeddings())
+    for batch in range(BATCHES):
+        texts = [f"writer {writer} batch {batch} chunk {i}" for i in range(3)]
+        store.add_texts(texts, ids=[f"{writer}-{batch}-{i}" for i in range(3)])
+
+
+def replace_and_compact(directory):
+    store = MmapVectorStore(directory, FakeEmbeddings())
+    for _ in range(5):
+        # Replacing every seeded chunk leaves as many dead rows as live ones
+        store.add_texts([f"seed {i} again" for i in range(10)], ids=[f"seed-{i}" for i in range(10)])
+        store.compact()
+
+
+def test_concurrent_writers_and_compaction_keep_every_row(tmp_path):
+    directory = str(tmp_path / "index")
+    store = MmapVectorStore(directory, FakeEmbeddings())
+    store.add_texts([f"seed {i}" for i in range(10)], ids=[f"seed-{i}" for i in range(10)])
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=append_batches, args=(directory, writer)) for writer in range(WRITERS)]
+    processes.append(context.Process(target=replace_and_compact, args=(directory,)))
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    reopened = MmapVectorStore(directory, FakeEmbeddings())
+    result = reopened.get(include=("documents", "embeddings"))
+    expected = {f"{writer}-{batch}-{i}" for writer in range(WRITERS) for batch in range(BATCHES) for i in range(3)}
+    expected |= {f"seed-{i}" for i in range(10)}
+    assert sorted(result["ids"]) == sorted(expected)
+    # Every row's vector is the embedding of its own text
+    vectors = MmapVectorStore.normalize(FakeEmbeddings().embed_documents(result["documents"]))
+    assert np.allclose(result["embeddings"], vectors, atol=1e-5)
+
+
+def test_search_reads_the_mapping_it_searched(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "index"), FakeEmbeddings())
+    store.add_texts([f"chunk {i}" for i in range(10)], ids=[str(i) for i in range(10)])
+    store.delete([str(i) for i in range(4)])
+    query = FakeEmbeddings().embed_query("chunk 8")
+    snapshot = store.snapshot()
+    hits = store.search_vectors([query], k=1, snapshot=snapshot)[0]
+    # Compacting renumbers the rows found above
+    store.compact()
+    [(doc, _)] = store.to_documents(hits, snapshot)
+    assert doc.page_content == "chunk 8"
+
+
+def test_search_picks_up_rows_committed_elsewhere(tmp_path):
+    directory = str(tmp_path / "index")
+    reader = MmapVectorStore(directory, FakeEmbeddings())
+    writer = MmapVectorStore(directory, FakeEmbeddings())
+    writer.add_texts([f"chunk {i}" for i in range(10)], ids=[str(i) for i in range(10)])
+    assert reader.similarity_search("chunk 3", k=1)[0].page_content == "chunk 3"
+    writer.delete([str(i) for i in range(6)])
+    # The deletes compacted the files under the reader's mapping
+    assert {doc.page_content for doc in reader.similarity_search("chunk", k=10)} == {f"chunk {i}" for i in range(6, 10)}
@@ -1,5 +1,5 @@
 import os
-from langchain_community.tools.tavily_search import TavilySearchResults
+from functools import lru_cache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,9 +9,9 @@ TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
 
 
 
-#load websearch toolfrom langchain_community.tools.tavily_search import TavilySearchResults
-
-tv_search = TavilySearchResults(max_results=3, search_depth='advanced',
-                                max_tokens=10000)
-
-
+#load websearch tool on first use; most questions are answered without a web search
+@lru_cache(maxsize=None)
+def get_tv_search():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    return TavilySearchResults(max_results=3, search_depth='advanced',
+                               max_tokens=10000)
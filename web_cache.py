@@ -0,0 +1,88 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+
+
+class WebSearchCache:
+    """
+    Caches web search results keyed by the normalized (rewritten) query.
+
+    Results expire after `ttl_seconds`; beyond `max_entries` the oldest searches are dropped.
+    """
+
+    def __init__(self, db_path="web_cache.db", ttl_seconds=24 * 3600, max_entries=5000):
+        """
+        Args:
+            db_path (str): SQLite file the cache is persisted to.
+            ttl_seconds (float): Lifetime of cached search results.
+            max_entries (int): Maximum number of cached searches.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS searches (
+                query_key TEXT PRIMARY KEY,
+                query TEXT,
+                results TEXT,
+                fetched_at REAL
+            )
+            """
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(query):
+        """
+        Returns the cache key of a query: lowercased, whitespace collapsed, outer punctuation and quotes stripped.
+        """
+        return re.sub(r"\s+", " ", query.lower()).strip(" \"'?!.")
+
+    def get(self, query):
+        """
+        Returns the cached results of a query, or None if missing or expired.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT results, fetched_at FROM searches WHERE query_key = ?", (self.normalize(query),)
+            ).fetchone()
+        if row is None or row[1] < time.time() - self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, results):
+        """
+        Caches the results of a query. Anything but a list of results, such as the error
+        string a failed Tavily search returns, is not cached.
+        """
+        if not isinstance(results, list):
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO searches (query_key, query, results, fetched_at) VALUES (?, ?, ?, ?)",
+                (self.normalize(query), query, json.dumps(results), time.time())
+            )
+            self.conn.execute(
+                """
+                DELETE FROM searches WHERE query_key IN (
+                    SELECT query_key FROM searches ORDER BY fetched_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of the cache.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}